@@ -1,14 +1,21 @@
 import axios from 'axios';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+// Scans can go to a separately scaled OCR service (server/ocr_worker.py)
+const OCR_URL = import.meta.env.VITE_OCR_URL || API_URL;
 
 export const processImageOCR = async (imageBlob) => {
     const formData = new FormData();
     formData.append('file', imageBlob);
 
+    // Signed-in scans are rate limited per user rather than per network address
+    const token = localStorage.getItem('token');
+    const headers = { 'Content-Type': 'multipart/form-data' };
+    if (token) headers.Authorization = `Bearer ${token}`;
+
     try {
-        const response = await axios.post(`${API_URL}/ocr/extract-date`, formData, {
-            headers: { 'Content-Type': 'multipart/form-data' },
+        const response = await axios.post(`${OCR_URL}/ocr/extract-date`, formData, {
+            headers,
             timeout: 30000 // 30 second timeout for OCR processing
         });
         // Map response to expected format
@@ -16,15 +23,116 @@ export const processImageOCR = async (imageBlob) => {
             success: response.data.success,
             expiry_date: response.data.expiry_date,
             confidence: response.data.confidence || 0,
-            message: response.data.message || response.data.error
+            message: response.data.message || response.data.error,
+            // Set when the photo was too dark/blurry/glary to read; message holds the hint
+            quality: response.data.quality?.reason
         };
     } catch (error) {
         console.error("OCR Error", error);
+        const status = error.response?.status;
+        const retryAfter = error.response?.headers?.['retry-after'];
+        let message = "Failed to connect to OCR server";
+        if (status === 429 || status === 503) {
+            message = status === 429 ? "Too many scans, please slow down" : "Scanner is busy";
+            if (retryAfter) message += ` - try again in ${retryAfter}s`;
+        }
         return {
             success: false,
             expiry_date: null,
             confidence: 0,
-            message: "Failed to connect to OCR server"
+            message,
+            retryAfter: retryAfter ? Number(retryAfter) : undefined
         };
     }
 };
+
+// Scan several images in one request. The server streams one NDJSON line per
+// image as soon as it is done; onResult(index, result) fires for each of them.
+export const processImagesOCRBatch = async (imageBlobs, onResult) => {
+    const formData = new FormData();
+    imageBlobs.forEach((blob, i) => formData.append('files', blob, `scan-${i}.jpg`));
+
+    // Charged to the signed-in user's scan quota, like single scans
+    const token = localStorage.getItem('token');
+    const headers = {};
+    if (token) headers.Authorization = `Bearer ${token}`;
+
+    const response = await fetch(`${OCR_URL}/ocr/extract-dates`, {
+        method: 'POST',
+        headers,
+        body: formData
+    });
+    if (!response.ok) {
+        throw new Error(`Batch OCR failed (${response.status})`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const results = new Array(imageBlobs.length).fill(null);
+    let buffered = '';
+
+    const handleLine = (line) => {
+        if (!line.trim()) return;
+        const data = JSON.parse(line);
+        const result = {
+            success: data.success,
+            expiry_date: data.expiry_date,
+            confidence: data.confidence || 0,
+            message: data.message || data.error
+        };
+        results[data.index] = result;
+        if (onResult) onResult(data.index, result);
+    };
+
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffered);
+    return results;
+};
+
+// Live scanning: send camera frames over a WebSocket and get back the date once
+// several frames agree. Call sendFrame(blob) after each onProgress so frames never
+// queue up; the server closes the socket after onResult or a timeout.
+export const openOCRStream = ({ onProgress, onResult, onClose }) => {
+    const url = new URL('/ocr/stream', OCR_URL.replace(/^http/, 'ws'));
+    const token = localStorage.getItem('token');
+    if (token) url.searchParams.set('token', token);
+
+    const socket = new WebSocket(url);
+    socket.binaryType = 'arraybuffer';
+    const opened = new Promise((resolve, reject) => {
+        socket.onopen = resolve;
+        socket.onerror = reject;
+    });
+
+    socket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === 'result') {
+            if (onResult) onResult({
+                success: data.success,
+                expiry_date: data.expiry_date,
+                confidence: data.confidence || 0,
+                source: data.source
+            });
+        } else if (onProgress) {
+            onProgress(data);
+        }
+    };
+    socket.onclose = (event) => {
+        if (onClose) onClose(event.code, event.reason);
+    };
+
+    return {
+        opened,
+        sendFrame: (blob) => {
+            if (socket.readyState === WebSocket.OPEN) socket.send(blob);
+        },
+        close: () => socket.close()
+    };
+};
@@ -1,15 +1,21 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { Camera, AlertCircle } from 'lucide-react';
-import { processImageOCR } from '../api';
+import { processImageOCR, openOCRStream } from '../api';
 import gsap from 'gsap';
 
+// Live frames are small and sent at most this often; the server only needs a glimpse per frame
+const LIVE_FRAME_MAX_SIDE = 640;
+const LIVE_FRAME_INTERVAL_MS = 250;
+
 const Scanner = ({ onClose, onScanComplete }) => {
   const [processing, setProcessing] = useState(false);
   const [error, setError] = useState(null);
   const [cameraReady, setCameraReady] = useState(false);
+  const [liveStatus, setLiveStatus] = useState(null);
   const videoRef = useRef(null);
   const lineRef = useRef(null);
   const streamRef = useRef(null);
+  const liveRef = useRef(null);
 
   useEffect(() => {
     navigator.mediaDevices.getUserMedia({ 
@@ -44,6 +50,78 @@ const Scanner = ({ onClose, onScanComplete }) => {
     };
   }, []);
 
+  // Draw the current video frame, scaled down to maxSide, and encode it as JPEG
+  const grabFrame = (maxSide, quality) => {
+    const video = videoRef.current;
+    const scale = maxSide ? Math.min(1, maxSide / Math.max(video.videoWidth, video.videoHeight)) : 1;
+    const canvas = document.createElement("canvas");
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    canvas.getContext("2d").drawImage(video, 0, 0, canvas.width, canvas.height);
+    return new Promise((resolve, reject) => {
+      canvas.toBlob((b) => {
+        if (b) {
+          resolve(b);
+        } else {
+          reject(new Error("Failed to capture image"));
+        }
+      }, 'image/jpeg', quality);
+    });
+  };
+
+  // Live scan: stream small frames while the camera is open, one per server reply
+  useEffect(() => {
+    if (!cameraReady) return;
+    let finished = false;
+    let timer = null;
+
+    const sendNext = (delay) => {
+      timer = setTimeout(async () => {
+        if (finished || !videoRef.current || videoRef.current.videoWidth === 0) return;
+        try {
+          live.sendFrame(await grabFrame(LIVE_FRAME_MAX_SIDE, 0.7));
+        } catch (err) {
+          console.error("Live frame error:", err);
+        }
+      }, delay);
+    };
+
+    const live = openOCRStream({
+      onProgress: (data) => {
+        const best = data.candidates && data.candidates[0];
+        if (data.quality) {
+          setLiveStatus(data.quality.hint);
+        } else {
+          setLiveStatus(best ? `Reading ${best.date}...` : "Looking for a date...");
+        }
+        sendNext(LIVE_FRAME_INTERVAL_MS);
+      },
+      onResult: (result) => {
+        finished = true;
+        if (result.success && result.expiry_date) {
+          onScanComplete(result.expiry_date, result.confidence || 0);
+        }
+      },
+      onClose: () => {
+        // Timeout, busy server or lost connection: the capture button still works
+        if (!finished) setLiveStatus(null);
+        finished = true;
+      }
+    });
+    liveRef.current = live;
+    live.opened.then(() => {
+      setLiveStatus("Looking for a date...");
+      sendNext(0);
+    }).catch(() => setLiveStatus(null));
+
+    return () => {
+      finished = true;
+      clearTimeout(timer);
+      live.close();
+      liveRef.current = null;
+    };
+  }, [cameraReady]);
+
   const captureAndProcess = async () => {
     if (!videoRef.current || !cameraReady) {
       setError("Camera not ready. Please wait and try again.");
@@ -58,25 +136,12 @@ const Scanner = ({ onClose, onScanComplete }) => {
 
     setProcessing(true);
     setError(null);
+    // A full-resolution capture supersedes the live scan
+    if (liveRef.current) liveRef.current.close();
+    setLiveStatus(null);
 
     try {
-      // Create Canvas to capture video frame
-      const canvas = document.createElement("canvas");
-      canvas.width = videoRef.current.videoWidth;
-      canvas.height = videoRef.current.videoHeight;
-      const ctx = canvas.getContext("2d");
-      ctx.drawImage(videoRef.current, 0, 0);
-
-      // Convert canvas to blob
-      const blob = await new Promise((resolve, reject) => {
-        canvas.toBlob((b) => {
-          if (b) {
-            resolve(b);
-          } else {
-            reject(new Error("Failed to capture image"));
-          }
-        }, 'image/jpeg', 0.95);
-      });
+      const blob = await grabFrame(null, 0.95);
 
       console.log("Image captured, sending to OCR...", blob.size, "bytes");
 
@@ -120,7 +185,7 @@ const Scanner = ({ onClose, onScanComplete }) => {
             <div className={`w-2 h-2 rounded-full ${
               cameraReady ? 'bg-emerald-400' : 'bg-yellow-400 animate-pulse'
             }`}></div>
-            {cameraReady ? 'Camera Ready' : 'Initializing...'}
+            {cameraReady ? (liveStatus || 'Camera Ready') : 'Initializing...'}
           </div>
         </div>
 
@@ -163,7 +228,9 @@ const Scanner = ({ onClose, onScanComplete }) => {
         >
           <Camera size={32} />
         </button>
-        <p className="text-white/60 text-xs mt-2">Tap to capture & scan</p>
+        <p className="text-white/60 text-xs mt-2">
+          {liveStatus ? 'Scanning live - or tap to capture' : 'Tap to capture & scan'}
+        </p>
         <button onClick={onClose} className="mt-3 text-white text-sm underline">Cancel</button>
       </div>
     </div>
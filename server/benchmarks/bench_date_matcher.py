@@ -0,0 +1,106 @@
+"""
+Micro-benchmark: fused DateMatcher vs. the original per-pattern extraction.
+
+Replays a corpus of recorded Tesseract output through both implementations and
+reports texts/s and the speedup. Run from the server directory:
+
+    python benchmarks/bench_date_matcher.py [--corpus PATH] [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_pipeline  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ocr_text_corpus.txt")
+
+
+def load_corpus(path: str):
+    with open(path, encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if not line.startswith("#")]
+    return ["\n".join(block).strip("\n") for block in _split(lines)]
+
+
+def _split(lines):
+    block = []
+    for line in lines:
+        if line.strip() == "%%":
+            yield block
+            block = []
+        else:
+            block.append(line)
+    if block:
+        yield block
+
+
+# The extraction as it was before DateMatcher: one re.search per keyword,
+# one finditer per date pattern and a clock read per candidate.
+def legacy_has_context(line, keywords):
+    upper_line = line.upper()
+    for pattern in keywords:
+        if re.search(pattern, upper_line):
+            return True
+    return False
+
+
+def legacy_extract_dates_from_text(text):
+    candidates = []
+    for line in text.split('\n'):
+        clean_line = line.strip()
+        if not clean_line or legacy_has_context(clean_line, ocr_pipeline.IGNORE_KEYWORDS):
+            continue
+        has_expiry = legacy_has_context(clean_line, ocr_pipeline.EXPIRY_KEYWORDS)
+        for pattern, pattern_type in ocr_pipeline.DATE_PATTERNS:
+            for match in re.finditer(pattern, clean_line, re.IGNORECASE):
+                normalized = ocr_pipeline.normalize_date(match, pattern_type)
+                if normalized:
+                    candidate = ocr_pipeline.DateCandidate(match.group(0), normalized, 0.0, has_expiry,
+                                                   clean_line, pattern_type)
+                    candidate.confidence = ocr_pipeline.calculate_confidence(candidate)
+                    candidates.append(candidate)
+    return candidates
+
+
+def bench(fn, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    return repeat * len(corpus) / elapsed
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--corpus", default=DEFAULT_CORPUS)
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    today = datetime.now()
+
+    legacy_dates = [len(legacy_extract_dates_from_text(t)) for t in corpus]
+    fused_dates = [len(ocr_pipeline.extract_dates_from_text(t, today)) for t in corpus]
+    best_changed = sum(
+        1 for t in corpus
+        if (getattr(ocr_pipeline.select_best_candidate(legacy_extract_dates_from_text(t)), "normalized", None)
+            != getattr(ocr_pipeline.select_best_candidate(ocr_pipeline.extract_dates_from_text(t, today)), "normalized", None))
+    )
+
+    legacy = bench(legacy_extract_dates_from_text, corpus, args.repeat)
+    fused = bench(lambda t: ocr_pipeline.DATE_MATCHER.extract(t, today), corpus, args.repeat)
+
+    print(f"corpus: {len(corpus)} OCR outputs x {args.repeat}")
+    print(f"candidates: legacy {sum(legacy_dates)}, fused {sum(fused_dates)} (overlapping readings dropped)")
+    print(f"best date changed on {best_changed} texts")
+    print(f"legacy: {legacy:10.0f} texts/s")
+    print(f"fused:  {fused:10.0f} texts/s  ({fused / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,186 @@
+"""
+Mixed-workload HTTP load test.
+
+Boots the app in-process (in-memory MongoDB stand-in unless --mongodb-uri is given),
+seeds users and products, then runs a weighted mix of logins, product reads/writes
+and OCR scans at fixed concurrency for a fixed time. Reports requests/s and latency
+percentiles per operation plus event-loop lag, which shows whether CPU-bound OCR or
+bcrypt work is starving CRUD traffic:
+
+    python benchmarks/bench_http_load.py --mix list=8,create=2,login=1
+    python benchmarks/bench_http_load.py --mix list=8,ocr=2 --ocr-executor inline   # OCR on the loop
+    python benchmarks/bench_http_load.py --mix list=8,ocr=2 --ocr-executor process
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from harness import LoopLagMonitor, import_app, latency_summary, running_app, timed
+
+PASSWORD = "bench-password"
+OPERATIONS = ("login", "list", "page", "create", "summary", "changes", "ocr")
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation {name!r} (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def label_jpeg(text: str) -> bytes:
+    from PIL import Image, ImageDraw, ImageFont
+    try:
+        font = ImageFont.load_default(size=40)
+    except TypeError:
+        font = ImageFont.load_default()
+    image = Image.new("L", (1000, 300), 255)
+    ImageDraw.Draw(image).text((60, 110), text, fill=0, font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def seed(client, args) -> list:
+    """Register users, bulk-import their products and return one token per user"""
+    rng = random.Random(args.seed)
+    today = datetime.now()
+    tokens = []
+    for i in range(args.users):
+        r = await client.post("/auth/register", json={"username": f"load{i}", "password": PASSWORD})
+        if r.status_code == 400:
+            r = await client.post("/auth/login", json={"username": f"load{i}", "password": PASSWORD})
+        if r.status_code != 200:
+            raise SystemExit(f"seeding user {i} failed: {r.status_code} {r.text}")
+        token = r.json()["access_token"]
+        tokens.append(token)
+
+        items = [{
+            "name": f"item{j}",
+            "expiryDate": (today + timedelta(days=rng.randint(-10, 400))).strftime("%Y-%m-%d"),
+            "category": rng.choice(["Dairy", "Bakery", "Medicine", "Pantry", "Frozen"])
+        } for j in range(args.products_per_user)]
+        for start in range(0, len(items), 5000):
+            r = await client.post("/products/bulk", json=items[start:start + 5000],
+                                  headers={"Authorization": f"Bearer {token}"})
+            if r.status_code != 200:
+                raise SystemExit(f"seeding products failed: {r.status_code} {r.text}")
+    return tokens
+
+
+async def run(main, args):
+    import core  # already imported by import_app, with the benchmark's environment
+    import ocr_pipeline
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    # Distinct images so scans are not answered from the result cache
+    images = [label_jpeg(f"EXP {m:02d}/20{27 + i % 3}  LOT {i}") for i, m in enumerate(range(1, 13))]
+
+    async with running_app(main) as client:
+        tokens = await seed(client, args)
+        rng = random.Random(args.seed)
+        results = {name: {"times": [], "statuses": {}} for name in names}
+        probe_times = []
+
+        async def call(name: str, user: int):
+            headers = {"Authorization": f"Bearer {tokens[user]}"}
+            if name == "login":
+                return await client.post("/auth/login", json={"username": f"load{user}", "password": PASSWORD})
+            if name == "list":
+                return await client.get("/products", headers=headers)
+            if name == "page":
+                return await client.get("/products", params={"limit": 50}, headers=headers)
+            if name == "create":
+                body = {"name": "bench", "expiryDate": "2027-01-15", "category": "Pantry"}
+                return await client.post("/products", json=body, headers=headers)
+            if name == "summary":
+                return await client.get("/products/summary", headers=headers)
+            if name == "changes":
+                return await client.get("/products/changes", headers=headers)
+            image = images[rng.randrange(len(images))]
+            return await client.post("/ocr/extract-date", files={"file": ("label.jpg", image, "image/jpeg")})
+
+        async def worker(deadline: float):
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                elapsed, r = await timed(call, name, rng.randrange(len(tokens)))
+                entry = results[name]
+                entry["times"].append(elapsed)
+                entry["statuses"][r.status_code] = entry["statuses"].get(r.status_code, 0) + 1
+
+        async def probe():
+            while True:
+                elapsed, _ = await timed(client.get, "/health")
+                probe_times.append(elapsed)
+                await asyncio.sleep(0.05)
+
+        with LoopLagMonitor() as lag:
+            probe_task = asyncio.ensure_future(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(start + args.duration) for _ in range(args.concurrency)))
+            wall = time.perf_counter() - start
+            probe_task.cancel()
+
+        total = sum(len(entry["times"]) for entry in results.values())
+        return {
+            "config": {
+                "users": args.users, "products_per_user": args.products_per_user, "mix": mix,
+                "concurrency": args.concurrency, "duration_s": args.duration,
+                "ocr_executor": ocr_pipeline.OCR_EXECUTOR_KIND, "hash_workers": core.PASSWORD_HASH_WORKERS,
+                "bcrypt_rounds": core.BCRYPT_ROUNDS,
+            },
+            "requests_per_s": round(total / wall, 1),
+            "operations": {
+                name: {"requests_per_s": round(len(entry["times"]) / wall, 1), "statuses": entry["statuses"],
+                       **latency_summary(entry["times"])}
+                for name, entry in results.items()
+            },
+            "health_probe": latency_summary(probe_times),
+            "loop_lag": latency_summary(lag.samples),
+        }
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Mixed-workload HTTP load test")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--products-per-user", type=int, default=200)
+    ap.add_argument("--mix", default="list=6,page=4,create=2,summary=1,changes=1,login=1",
+                    help=f"weighted operations: {', '.join(OPERATIONS)}")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--rounds", type=int, default=10, help="bcrypt cost factor")
+    ap.add_argument("--hash-workers", type=int, default=4, help="0 hashes inline on the event loop")
+    ap.add_argument("--ocr-executor", default="process", choices=["process", "thread", "inline"])
+    ap.add_argument("--ocr-workers", type=int, default=0, help="0 uses one per CPU")
+    ap.add_argument("--mongodb-uri", help="use a real MongoDB instead of the in-memory stand-in")
+    args = ap.parse_args()
+
+    main = import_app(args.mongodb_uri, {
+        "BCRYPT_ROUNDS": args.rounds,
+        "PASSWORD_HASH_WORKERS": args.hash_workers,
+        "PASSWORD_HASH_MAX_PENDING": 100000,
+        "OCR_EXECUTOR": args.ocr_executor,
+        # Load OpenCV/Tesseract before the clock starts, not on the first scan in the mix
+        "OCR_PRELOAD": "startup",
+        # Every scan comes from the same address; measure throughput, not the per-client limit
+        "OCR_RATE_PER_MINUTE": 0,
+        "OCR_WORKERS": args.ocr_workers,
+        # Measure scans, not cache hits
+        "OCR_CACHE_PATH": "",
+        "OCR_CACHE_MEMORY_ENTRIES": 0,
+        "EXPIRY_SWEEP_INTERVAL_SECONDS": 0,
+    })
+    print(json.dumps(asyncio.run(run(main, args)), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
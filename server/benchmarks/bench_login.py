@@ -0,0 +1,87 @@
+"""
+Login throughput under concurrency.
+
+Seeds users, then fires concurrent /auth/login requests while a probe keeps
+calling /health, and reports logins/s, login and probe latency and event-loop
+lag. Compare the bcrypt thread pool against inline hashing:
+
+    python benchmarks/bench_login.py --hash-workers 4
+    python benchmarks/bench_login.py --hash-workers 0     # old behaviour
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from harness import LoopLagMonitor, import_app, latency_summary, running_app, timed
+
+
+async def run(main, args):
+    import core  # already imported by import_app, with the benchmark's environment
+    async with running_app(main) as client:
+        for i in range(args.users):
+            r = await client.post("/auth/register", json={"username": f"bench{i}", "password": "bench-password"})
+            if r.status_code not in (200, 400):
+                raise SystemExit(f"register failed: {r.status_code} {r.text}")
+
+        login_times, probe_times, statuses = [], [], {}
+        queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(i)
+
+        async def login_worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                body = {"username": f"bench{i % args.users}", "password": "bench-password"}
+                elapsed, r = await timed(client.post, "/auth/login", json=body)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                login_times.append(elapsed)
+
+        async def probe():
+            while True:
+                elapsed, _ = await timed(client.get, "/health")
+                probe_times.append(elapsed)
+                await asyncio.sleep(0.02)
+
+        with LoopLagMonitor() as lag:
+            probe_task = asyncio.ensure_future(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+            wall = time.perf_counter() - start
+            probe_task.cancel()
+
+        return {
+            "hash_workers": core.PASSWORD_HASH_WORKERS,
+            "bcrypt_rounds": core.BCRYPT_ROUNDS,
+            "concurrency": args.concurrency,
+            "logins_per_s": round(len(login_times) / wall, 1),
+            "statuses": statuses,
+            "login": latency_summary(login_times),
+            "health_probe": latency_summary(probe_times),
+            "loop_lag": latency_summary(lag.samples),
+        }
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Login throughput under concurrency")
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--rounds", type=int, default=10, help="bcrypt cost factor")
+    ap.add_argument("--hash-workers", type=int, default=4, help="0 hashes inline on the event loop")
+    ap.add_argument("--max-pending", type=int, default=1000)
+    ap.add_argument("--mongodb-uri", help="use a real MongoDB instead of the in-memory stand-in")
+    args = ap.parse_args()
+
+    main = import_app(args.mongodb_uri, {
+        "BCRYPT_ROUNDS": args.rounds,
+        "PASSWORD_HASH_WORKERS": args.hash_workers,
+        "PASSWORD_HASH_MAX_PENDING": args.max_pending,
+        "OCR_EXECUTOR": "inline",
+        "OCR_PRELOAD": "lazy",
+    })
+    print(json.dumps(asyncio.run(run(main, args)), indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
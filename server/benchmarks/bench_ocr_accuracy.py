@@ -0,0 +1,343 @@
+"""
+OCR accuracy and latency per pipeline configuration.
+
+Renders a synthetic corpus of expiry labels (every format in DATE_PATTERNS, with
+MFG/PKD/BATCH/MRP distractor lines) under several degradations, optionally adds a
+folder of real labelled photos, and runs the scan pipeline for each configuration.
+Prints JSON with accuracy, p50/p95 latency and CPU time per scan. Run from the server
+directory (needs the tesseract binary):
+
+    python benchmarks/bench_ocr_accuracy.py --output ocr-baseline.json
+    python benchmarks/bench_ocr_accuracy.py --baseline ocr-baseline.json   # exits 1 on regression
+    python benchmarks/bench_ocr_accuracy.py --photos ~/labels --configs cascade
+    python benchmarks/bench_ocr_accuracy.py --unreadable 16 --no-quality-gate   # tune OCR_QUALITY_*
+
+A photos folder holds images plus a labels.csv of `file,expiry_date` rows; files
+missing from it may carry the date as a filename prefix (2026-03-15_milk.jpg).
+
+--unreadable adds hopeless labels (very dark, heavily blurred, glare over the text) that
+the quality gate should turn away; they are reported per condition but left out of the
+accuracy figure. With --no-quality-gate every sample is still assessed, and
+"false_rejects" counts images the gate would have rejected that OCR read correctly.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
+
+from harness import SERVER_DIR, latency_summary
+
+CONDITIONS = ["clean", "blur", "rotated", "low_contrast", "inverted", "noisy"]
+# Hopeless captures the quality gate should reject (--unreadable)
+UNREADABLE_CONDITIONS = ["dark", "heavy_blur", "glare"]
+
+# Pipeline configurations: scan mode plus module settings patched on ocr_pipeline for the run
+CONFIGS = {
+    "grid": {"mode": "grid", "OCR_ROI": False},
+    "cascade": {"mode": "cascade", "OCR_ROI": False},
+    "roi-grid": {"mode": "grid", "OCR_ROI": True},
+    "roi-cascade": {"mode": "cascade", "OCR_ROI": True},
+}
+
+MONTH_NAMES = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+EXPIRY_LABELS = ["EXP", "EXP.", "EXPIRY", "EXP DATE", "USE BY", "BEST BEFORE", "BB"]
+DISTRACTOR_LABELS = ["MFG", "MFD", "PKD", "PACKED ON"]
+
+
+def format_date(day: datetime, fmt: str) -> tuple:
+    """Render a date in one DATE_PATTERNS format; returns (text, expected normalized date)"""
+    month = MONTH_NAMES[day.month - 1]
+    first = day.replace(day=1).strftime("%Y-%m-%d")
+    return {
+        "ymd": (day.strftime("%Y-%m-%d"), day.strftime("%Y-%m-%d")),
+        "dmy": (day.strftime("%d/%m/%Y"), day.strftime("%Y-%m-%d")),
+        "dmy_short": (day.strftime("%d.%m.%y"), day.strftime("%Y-%m-%d")),
+        "my": (day.strftime("%m/%Y"), first),
+        "my_short": (day.strftime("%m/%y"), first),
+        "month_year": (f"{month} {day.year}", first),
+        "day_month_year": (f"{day.day:02d} {month} {day.year}", day.strftime("%Y-%m-%d")),
+        "month_day_year": (f"{month} {day.day:02d}, {day.year}", day.strftime("%Y-%m-%d")),
+    }[fmt]
+
+
+DATE_FORMATS = ["ymd", "dmy", "dmy_short", "my", "my_short", "month_year", "day_month_year", "month_day_year"]
+
+
+def load_font(size: int):
+    for name in ("DejaVuSans-Bold.ttf", "DejaVuSans.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has only the small bitmap font
+        return ImageFont.load_default()
+
+
+def label_lines(rng: random.Random, expiry: datetime, fmt: str) -> tuple:
+    text, expected = format_date(expiry, fmt)
+    lines = [f"{rng.choice(EXPIRY_LABELS)}: {text}"]
+    # Distractors: an earlier manufacturing date in a (possibly different) format and label noise
+    mfg = expiry - timedelta(days=rng.randint(60, 720))
+    lines.append(f"{rng.choice(DISTRACTOR_LABELS)}: {format_date(mfg, rng.choice(DATE_FORMATS))[0]}")
+    lines.append(f"BATCH NO: B{rng.randint(1000, 99999)}")
+    if rng.random() < 0.6:
+        lines.append(f"MRP RS. {rng.randint(10, 999)}.00")
+    rng.shuffle(lines)
+    return lines, expected
+
+
+def render_label(lines, condition: str, rng: random.Random) -> Image.Image:
+    font = load_font(rng.randint(34, 52))
+    width, line_height = 1000, int(font.size * 1.6) if hasattr(font, "size") else 24
+    image = Image.new("L", (width, line_height * (len(lines) + 2)), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((rng.randint(30, 90), line_height * (i + 1)), line, fill=0, font=font)
+
+    if condition == "blur":
+        image = image.filter(ImageFilter.GaussianBlur(rng.uniform(1.2, 2.2)))
+    elif condition == "rotated":
+        image = image.rotate(rng.uniform(-8, 8), expand=True, fillcolor=255, resample=Image.BICUBIC)
+    elif condition == "low_contrast":
+        image = image.point(lambda v: 150 + v * 60 // 255)
+    elif condition == "inverted":
+        image = ImageOps.invert(image)
+    elif condition == "noisy":
+        noise = Image.effect_noise(image.size, 40)
+        image = Image.blend(image, noise, 0.3)
+    elif condition == "dark":
+        image = image.point(lambda v: v * rng.randint(4, 9) // 100)
+    elif condition == "heavy_blur":
+        image = image.filter(ImageFilter.GaussianBlur(rng.uniform(4.5, 7)))
+    elif condition == "glare":
+        # Label on a grey surface with a blown-out highlight over most of the text
+        surface = image.point(lambda v: 40 + v * 110 // 255)
+        w, h = surface.size
+        spot = Image.new("L", surface.size, 0)
+        cx = rng.uniform(0.4, 0.6) * w
+        ImageDraw.Draw(spot).ellipse((cx - 0.32 * w, -0.1 * h, cx + 0.32 * w, 1.1 * h), fill=255)
+        image = Image.composite(Image.new("L", surface.size, 255), surface, spot.filter(ImageFilter.GaussianBlur(12)))
+    return image
+
+
+def encode_jpeg(image: Image.Image, quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def synthetic_corpus(count: int, seed: int, unreadable: int = 0) -> list:
+    """`count` labels per condition (`unreadable` per hopeless one), cycling through every date format"""
+    rng = random.Random(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    samples = []
+    plan = [(c, count) for c in CONDITIONS] + [(c, unreadable) for c in UNREADABLE_CONDITIONS]
+    for condition, n in plan:
+        for i in range(n):
+            fmt = DATE_FORMATS[i % len(DATE_FORMATS)]
+            expiry = today + timedelta(days=rng.randint(20, 900))
+            lines, expected = label_lines(rng, expiry, fmt)
+            samples.append({
+                "id": f"synthetic-{condition}-{i}",
+                "condition": condition,
+                "format": fmt,
+                "expected": expected,
+                "unreadable": condition in UNREADABLE_CONDITIONS,
+                "image": encode_jpeg(render_label(lines, condition, rng)),
+            })
+    return samples
+
+
+def photo_corpus(folder: str) -> list:
+    labels = {}
+    labels_path = os.path.join(folder, "labels.csv")
+    if os.path.exists(labels_path):
+        with open(labels_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                labels[row["file"]] = row["expiry_date"].strip()
+
+    samples = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+            continue
+        expected = labels.get(name)
+        if expected is None:
+            prefix = re.match(r"(\d{4}-\d{2}-\d{2})", name)
+            if not prefix:
+                print(f"skipping {name}: no label", file=sys.stderr)
+                continue
+            expected = prefix.group(1)
+        with open(os.path.join(folder, name), "rb") as f:
+            samples.append({"id": name, "condition": "photo", "format": "photo",
+                            "expected": expected, "image": f.read()})
+    return samples
+
+
+def cpu_seconds() -> float:
+    """This process plus reaped children (the tesseract binary runs as a child)"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+async def scan(ocr, contents: bytes, mode: str) -> tuple:
+    """The uncached scan pipeline; returns (response dict, per-stage ms, quality assessment)"""
+    timer = ocr.ScanTiming()
+    token = ocr.scan_timing.set(timer)
+    try:
+        gray = await ocr.run_stage(ocr.OCR_STAGE_SECONDS, ("decode",), "decode", ocr.decode_image, contents)
+        # Assessed even with the gate off, to count what it would have rejected
+        quality = await ocr.run_stage(ocr.OCR_STAGE_SECONDS, ("quality",), "quality",
+                                       ocr.assess_image_quality, gray)
+        if ocr.OCR_QUALITY_GATE and quality["reason"] is not None:
+            result = ocr.quality_response(quality)
+        else:
+            result = ocr.build_ocr_response(await ocr.run_ocr_passes(gray, mode))
+    finally:
+        ocr.scan_timing.reset(token)
+    return result, {name: seconds * 1000 for name, (seconds, _) in timer.stages.items()}, quality
+
+
+async def run_config(ocr, name: str, config: dict, samples: list, keep_failures: int) -> dict:
+    for key, value in config.items():
+        if key != "mode":
+            setattr(ocr, key, value)
+    # Every configuration starts with the same (untrained) pass ordering
+    ocr.ocr_pair_stats = ocr.OCRPairStats([(v, c) for v in ocr.VARIANT_NAMES for c in ocr.OCR_CONFIGS])
+
+    latencies, cpu, stages, failures = [], [], {}, []
+    by_condition, rejected_by_condition = {}, {}
+    gate = {"enabled": ocr.OCR_QUALITY_GATE, "rejected": 0, "by_reason": {},
+            "readable_rejected": 0, "unreadable_passed": 0, "false_rejects": 0}
+    correct = found = readable = 0
+    for sample in samples:
+        cpu_start, start = cpu_seconds(), time.perf_counter()
+        result, stage_ms, quality = await scan(ocr, sample["image"], config["mode"])
+        latencies.append(time.perf_counter() - start)
+        cpu.append(cpu_seconds() - cpu_start)
+        for stage, ms in stage_ms.items():
+            stages[stage] = stages.get(stage, 0.0) + ms
+
+        ok = result.get("expiry_date") == sample["expected"]
+        bucket = by_condition.setdefault(sample["condition"], [0, 0])
+        bucket[0] += ok
+        bucket[1] += 1
+        reason = quality["reason"]
+        if reason is not None:
+            gate["rejected"] += 1
+            gate["by_reason"][reason] = gate["by_reason"].get(reason, 0) + 1
+            gate["readable_rejected"] += not sample.get("unreadable")
+            gate["false_rejects"] += ok  # only possible with the gate off
+            rejected_by_condition[sample["condition"]] = rejected_by_condition.get(sample["condition"], 0) + 1
+        elif sample.get("unreadable"):
+            gate["unreadable_passed"] += 1
+        if sample.get("unreadable"):
+            continue
+        readable += 1
+        correct += ok
+        found += bool(result.get("success"))
+        if not ok and len(failures) < keep_failures:
+            failures.append({"id": sample["id"], "expected": sample["expected"], "got": result.get("expiry_date"),
+                             "text": (result.get("raw_text") or "")[:120]})
+
+    n = len(samples)
+    gate["rejected_by_condition"] = rejected_by_condition
+    return {
+        "config": config,
+        "samples": n,
+        "accuracy": round(correct / max(readable, 1), 4),
+        "found_rate": round(found / max(readable, 1), 4),
+        "by_condition": {c: round(ok / total, 4) for c, (ok, total) in by_condition.items()},
+        "quality_gate": gate,
+        "latency": latency_summary(latencies),
+        "cpu_ms_per_scan": round(sum(cpu) / n * 1000, 1),
+        "stage_ms_per_scan": {stage: round(ms / n, 2) for stage, ms in sorted(stages.items())},
+        "failures": failures,
+    }
+
+
+def compare(results: dict, baseline: dict, max_accuracy_drop: float, max_latency_ratio: float) -> list:
+    """Regressions against a previous run's JSON (configs present in both)"""
+    regressions = []
+    for name, current in results["configs"].items():
+        before = baseline.get("configs", {}).get(name)
+        if before is None:
+            continue
+        drop = before["accuracy"] - current["accuracy"]
+        if drop > max_accuracy_drop:
+            regressions.append(f"{name}: accuracy {before['accuracy']:.3f} -> {current['accuracy']:.3f}")
+        ratio = current["latency"]["p95_ms"] / max(before["latency"]["p95_ms"], 1e-6)
+        if ratio > max_latency_ratio:
+            regressions.append(f"{name}: p95 {before['latency']['p95_ms']}ms -> {current['latency']['p95_ms']}ms")
+    return regressions
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="OCR accuracy and latency per pipeline configuration")
+    ap.add_argument("--count", type=int, default=16, help="synthetic labels per condition")
+    ap.add_argument("--unreadable", type=int, default=0, help="hopeless labels per unreadable condition")
+    ap.add_argument("--no-quality-gate", action="store_true", help="run OCR on everything (still assessed)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--no-synthetic", action="store_true")
+    ap.add_argument("--photos", help="folder of real labelled photos")
+    ap.add_argument("--configs", default=",".join(CONFIGS), help=f"comma list of {', '.join(CONFIGS)}")
+    ap.add_argument("--failures", type=int, default=10, help="misreads kept per config in the output")
+    ap.add_argument("--output", help="also write the JSON here")
+    ap.add_argument("--baseline", help="previous --output to compare against")
+    ap.add_argument("--max-accuracy-drop", type=float, default=0.02)
+    ap.add_argument("--max-latency-ratio", type=float, default=1.25, help="allowed p95 growth vs baseline")
+    args = ap.parse_args()
+
+    unknown = [c for c in args.configs.split(",") if c not in CONFIGS]
+    if unknown:
+        ap.error(f"unknown configs: {', '.join(unknown)}")
+
+    # Scans run inline (so CPU time is attributable) and bypass the result cache
+    os.environ.update({"OCR_EXECUTOR": "inline", "OCR_CACHE_PATH": ""})
+    sys.path.insert(0, SERVER_DIR)
+    import ocr_pipeline as ocr
+
+    if args.no_quality_gate:
+        ocr.OCR_QUALITY_GATE = False
+    samples = [] if args.no_synthetic else synthetic_corpus(args.count, args.seed, args.unreadable)
+    if args.photos:
+        samples += photo_corpus(args.photos)
+    if not samples:
+        ap.error("empty corpus")
+
+    results = {
+        "corpus": {"samples": len(samples), "synthetic_per_condition": 0 if args.no_synthetic else args.count,
+                   "unreadable_per_condition": 0 if args.no_synthetic else args.unreadable,
+                   "seed": args.seed, "photos": args.photos, "backend": ocr.get_ocr_backend().name,
+                   "quality_gate": ocr.OCR_QUALITY_GATE},
+        "configs": {},
+    }
+    for name in args.configs.split(","):
+        results["configs"][name] = asyncio.run(run_config(ocr, name, CONFIGS[name], samples, args.failures))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_accuracy_drop, args.max_latency_ratio)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
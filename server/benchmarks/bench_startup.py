@@ -0,0 +1,125 @@
+"""
+Cold-start cost per entry point, each measured in a fresh interpreter: import time,
+time until the app answers /health, time until OCR is ready, and resident memory of
+the web process (plus its OCR worker processes once they exist).
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --targets crud_app,main-eager
+
+Targets:
+    crud_app     auth/products/notifications only
+    ocr_worker   OCR only, pipeline loaded before it serves (OCR_PRELOAD=startup)
+    main         everything, OCR loaded in the background after startup (the default)
+    main-eager   everything, OCR loaded before serving, like main.py before the split
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from harness import SERVER_DIR
+
+TARGETS = {
+    "crud_app": ("crud_app", {}),
+    "ocr_worker": ("ocr_worker", {}),
+    "main": ("main", {"OCR_PRELOAD": "background"}),
+    "main-eager": ("main", {"OCR_PRELOAD": "startup"}),
+}
+
+HEAVY_MODULES = ("cv2", "numpy", "PIL", "pytesseract", "dateutil")
+
+# Runs in the child: python -c CHILD <module>
+CHILD = r'''
+import asyncio, importlib, json, multiprocessing, os, sys, time
+
+def rss_mb(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource  # peak, not current, where /proc is missing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+result = {
+    "import_ms": (time.perf_counter() - start) * 1000,
+    "import_rss_mb": rss_mb(),
+    "heavy_modules_after_import": sorted(m for m in HEAVY_MODULES if m in sys.modules),
+}
+
+try:
+    from mongomock_motor import AsyncMongoMockClient
+    import core
+    core.AsyncIOMotorClient = AsyncMongoMockClient
+except ImportError:
+    pass  # Motor connects lazily; index builds fail in the background without a server
+
+async def boot():
+    import httpx
+    app = module.app
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            assert (await client.get("/health")).status_code == 200
+            result["ready_ms"] = (time.perf_counter() - start) * 1000
+            result["ready_rss_mb"] = rss_mb()
+            if "ocr_routes" in sys.modules:
+                ocr = await sys.modules["ocr_routes"].load_ocr_pipeline()
+                # Worker processes start on the first task; count them once they exist
+                await ocr.ocr_executor.run(ocr.timed_call, time.sleep, 0)
+                result["ocr_ready_ms"] = (time.perf_counter() - start) * 1000
+                result["ocr_ready_rss_mb"] = rss_mb()
+                result["ocr_worker_rss_mb"] = sum(rss_mb(p.pid) for p in multiprocessing.active_children())
+
+asyncio.run(boot())
+print("RESULT " + json.dumps(result))
+'''.replace("HEAVY_MODULES", repr(HEAVY_MODULES))
+
+
+def run_once(module: str, env: dict) -> dict:
+    proc = subprocess.run([sys.executable, "-c", CHILD, module], cwd=SERVER_DIR, env={**os.environ, **env},
+                          capture_output=True, text=True, timeout=300)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise SystemExit(f"{module} failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+
+
+def summarise(runs: list) -> dict:
+    """Median of every numeric field across runs"""
+    summary = {}
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)):
+            summary[key] = round(statistics.median(run[key] for run in runs), 1)
+        else:
+            summary[key] = value
+    return summary
+
+
+def main_cli():
+    ap = argparse.ArgumentParser(description="Cold-start time and memory per entry point")
+    ap.add_argument("--targets", default=",".join(TARGETS), help=f"comma list of {', '.join(TARGETS)}")
+    ap.add_argument("--repeat", type=int, default=3, help="fresh interpreters per target")
+    ap.add_argument("--ocr-executor", default="process", choices=["process", "thread", "inline"])
+    args = ap.parse_args()
+
+    unknown = [t for t in args.targets.split(",") if t not in TARGETS]
+    if unknown:
+        ap.error(f"unknown targets: {', '.join(unknown)}")
+
+    # No sweeps or cache files; one OCR worker so worker RSS is per process
+    env = {"EXPIRY_SWEEP_INTERVAL_SECONDS": "0", "OCR_CACHE_PATH": "", "OCR_EXECUTOR": args.ocr_executor,
+           "OCR_WORKERS": "1"}
+    results = {}
+    for name in args.targets.split(","):
+        module, target_env = TARGETS[name]
+        # One untimed run first so every target sees a warm filesystem cache
+        run_once(module, {**env, **target_env})
+        results[name] = summarise([run_once(module, {**env, **target_env}) for _ in range(args.repeat)])
+    print(json.dumps({"repeat": args.repeat, "ocr_executor": args.ocr_executor, "targets": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
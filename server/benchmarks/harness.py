@@ -0,0 +1,95 @@
+"""
+Shared helpers for the HTTP benchmarks: boot `main.app` in-process against an
+in-memory MongoDB stand-in (mongomock-motor) or a real server, measure
+event-loop lag, and summarise latencies.
+"""
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+
+def import_app(mongodb_uri: Optional[str] = None, env: Optional[Dict[str, str]] = None):
+    """
+    Import main (the combined app) with the given environment. Without a URI the Motor
+    client in core is swapped for mongomock-motor, so no MongoDB server is needed.
+    """
+    for key, value in (env or {}).items():
+        os.environ[key] = str(value)
+    if mongodb_uri:
+        os.environ["MONGODB_URI"] = mongodb_uri
+
+    import core
+    import main
+    if not mongodb_uri:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("In-memory mode needs mongomock-motor (pip install mongomock-motor), "
+                     "or pass --mongodb-uri")
+        core.AsyncIOMotorClient = AsyncMongoMockClient
+    return main
+
+
+@asynccontextmanager
+async def running_app(main):
+    """Run the app's startup/shutdown hooks and yield an httpx client bound to it in-process"""
+    import httpx
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            yield client
+
+
+class LoopLagMonitor:
+    """Samples how late a periodic timer fires: a direct measure of event-loop blocking"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def __enter__(self):
+        self._task = asyncio.ensure_future(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_summary(seconds: List[float]) -> dict:
+    """p50/p95/p99/max in milliseconds"""
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 2),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 2),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 2),
+        "max_ms": round(max(seconds, default=0.0) * 1000, 2),
+    }
+
+
+async def timed(coro_fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = await coro_fn(*args, **kwargs)
+    return time.perf_counter() - start, result
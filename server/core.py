@@ -0,0 +1,1009 @@
+"""
+Auth, products and notifications: the MongoDB-backed CRUD API as a router, plus the app
+factory shared by the entry points (main.py serves everything, crud_app.py only this,
+ocr_worker.py only OCR). Nothing here imports the OCR stack.
+"""
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Body
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import BaseModel, ValidationError
+from datetime import datetime, timedelta
+from typing import Any, Optional, Tuple, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from passlib.context import CryptContext
+from jose import JWTError, jwt
+from cache import TTLCache
+from metrics import metrics
+from sweeper import ExpirySweeper, EXPIRY_SWEEP_INTERVAL_SECONDS
+
+# Load environment variables
+load_dotenv()
+
+# CORS - Allow frontend origins
+ALLOWED_ORIGINS = [
+    "http://localhost:5173",
+    "http://localhost:5174",
+    "http://127.0.0.1:5173",
+    "http://127.0.0.1:5174",
+]
+
+# Add Vercel domains from environment variable
+FRONTEND_URL = os.getenv("FRONTEND_URL", "")
+if FRONTEND_URL:
+    ALLOWED_ORIGINS.append(FRONTEND_URL)
+
+# Also allow any Vercel preview deployments
+ALLOWED_ORIGINS.append("https://*.vercel.app")
+
+
+async def prometheus_metrics():
+    """Prometheus text exposition of the counters and stage histograms in this process"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def health_check():
+    """Health check endpoint"""
+    return {"status": "ok", "version": "2.0"}
+
+
+@asynccontextmanager
+async def run_lifespans(app: FastAPI):
+    """Start each included component once, in include order, and stop them in reverse"""
+    async with AsyncExitStack() as stack:
+        for lifespan in app.state.lifespans:
+            await stack.enter_async_context(lifespan(app))
+        yield
+
+
+def create_app(title: str = "ExpireGuard API") -> FastAPI:
+    """
+    App with the shared CORS policy, /metrics and /health. Entry points add what they
+    serve with include_crud / ocr_routes.include_ocr, which register routes and lifespans.
+    """
+    app = FastAPI(title=title, version="2.0", lifespan=run_lifespans)
+    app.state.lifespans = []
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # In production, you can restrict this
+        allow_credentials=False,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+    )
+    app.add_api_route("/metrics", prometheus_metrics, methods=["GET"])
+    app.add_api_route("/health", health_check, methods=["GET"])
+    return app
+
+
+router = APIRouter()
+
+# ==========================================
+# AUTH CONFIGURATION
+# ==========================================
+
+SECRET_KEY = os.getenv("SECRET_KEY", "expireguard-secret-key-change-in-production")
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_DAYS = 30
+
+# bcrypt cost factor; hashes with a different cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads for bcrypt (it releases the GIL); 0 hashes inline on the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash/verify calls admitted at once (running + queued) before answering 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "0")) or max(1, PASSWORD_HASH_WORKERS) * 8
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+security = HTTPBearer()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated thread pool so a login burst cannot freeze the event loop.
+    Admission is bounded: past max_pending, callers get 503 instead of queueing without limit.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    async def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Too many sign-in attempts right now, try again shortly",
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(valid, new_hash): new_hash is set when the stored hash uses an outdated cost factor"""
+        return await self._run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def snapshot(self) -> dict:
+        return {"workers": self.workers, "rounds": BCRYPT_ROUNDS, "pending": self.pending,
+                "rejected": self.rejected, "rehashed": self.rehashed}
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+def create_access_token(data: dict) -> str:
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+# Authenticated users are cached per process; invalidate_user() drops an entry early
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# Remember "user not found" for deleted accounts (0 disables negative caching)
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "10"))
+# Verified token payloads, so repeat requests skip the HMAC check
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(TOKEN_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+auth_stats = {"token_decodes": 0, "token_cache_hits": 0, "user_db_lookups": 0,
+              "user_cache_hits": 0, "user_negative_hits": 0}
+_USER_NOT_FOUND = object()
+
+
+def invalidate_user(user_id: str):
+    """Drop a cached user after it changes (local to this process; other workers expire by TTL)"""
+    user_cache.pop(str(user_id))
+
+
+def decode_access_token(token: str) -> dict:
+    """Verify a JWT once, then serve its payload from memory until it (or the cache entry) expires"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        auth_stats["token_cache_hits"] += 1
+        return payload
+    
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    auth_stats["token_decodes"] += 1
+    ttl = USER_CACHE_TTL_SECONDS
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(token, payload, ttl=ttl)
+    return payload
+
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    token = credentials.credentials
+    try:
+        payload = decode_access_token(token)
+        user_id = payload.get("sub")
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        
+        user = user_cache.get(user_id)
+        if user is _USER_NOT_FOUND:
+            auth_stats["user_negative_hits"] += 1
+            raise HTTPException(status_code=401, detail="User not found")
+        if user is not None:
+            auth_stats["user_cache_hits"] += 1
+            return user
+        
+        auth_stats["user_db_lookups"] += 1
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if user is None:
+            if USER_CACHE_NEGATIVE_TTL_SECONDS > 0:
+                user_cache.set(user_id, _USER_NOT_FOUND, ttl=USER_CACHE_NEGATIVE_TTL_SECONDS)
+            raise HTTPException(status_code=401, detail="User not found")
+        user_cache.set(user_id, user)
+        return user
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+# ==========================================
+# MONGODB CONNECTION
+# ==========================================
+
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+client: AsyncIOMotorClient = None
+db = None
+
+async def startup_db_client():
+    global client, db
+    client = AsyncIOMotorClient(MONGODB_URI)
+    db = client.expireguard
+    print(f"Connected to MongoDB")
+    # Don't hold up startup on an unreachable server; index builds are idempotent
+    asyncio.ensure_future(ensure_indexes())
+
+async def ensure_indexes():
+    try:
+        # Serves the per-user listing sorted by expiry and its keyset pagination.
+        # expiryDate is an ISO YYYY-MM-DD string, so string order is date order.
+        await db.products.create_index([("user_id", 1), ("expiryDate", 1), ("_id", 1)])
+        # Delta sync: changes and tombstones after a per-user version
+        await db.products.create_index([("user_id", 1), ("syncVersion", 1)])
+        await db.product_tombstones.create_index([("user_id", 1), ("syncVersion", 1)])
+        await db.product_tombstones.create_index("deletedAt", expireAfterSeconds=PRODUCT_TOMBSTONE_TTL_DAYS * 86400)
+        # Expiry sweep range scan and notification lookups
+        await ExpirySweeper(db).ensure_indexes()
+        print("MongoDB indexes ready")
+        # Products from before delta sync: version 0 is covered by every sync token
+        backfilled = await db.products.update_many({"syncVersion": {"$exists": False}}, {"$set": {"syncVersion": 0}})
+        if backfilled.modified_count:
+            print(f"Backfilled syncVersion on {backfilled.modified_count} products")
+    except Exception as e:
+        print(f"Index creation failed: {e}")
+
+async def shutdown_db_client():
+    global client
+    if client:
+        client.close()
+    password_hasher.shutdown()
+
+# ==========================================
+# AUTH MODELS
+# ==========================================
+
+class UserRegister(BaseModel):
+    username: str
+    password: str
+    name: Optional[str] = None
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+class UserResponse(BaseModel):
+    id: str
+    username: str
+    name: Optional[str] = None
+
+class TokenResponse(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserResponse
+
+# ==========================================
+# AUTH ENDPOINTS
+# ==========================================
+
+@router.post("/auth/register", response_model=TokenResponse)
+async def register(user_data: UserRegister):
+    """Register a new user"""
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    
+    # Check if username exists
+    existing = await db.users.find_one({"username": user_data.username.lower()})
+    if existing:
+        raise HTTPException(status_code=400, detail="Username already taken")
+    
+    # Create user
+    user_doc = {
+        "username": user_data.username.lower(),
+        "password": await password_hasher.hash(user_data.password),
+        "name": user_data.name or user_data.username,
+        "createdAt": datetime.utcnow().isoformat()
+    }
+    result = await db.users.insert_one(user_doc)
+    invalidate_user(result.inserted_id)
+    
+    # Create token
+    token = create_access_token({"sub": str(result.inserted_id)})
+    
+    return TokenResponse(
+        access_token=token,
+        token_type="bearer",
+        user=UserResponse(
+            id=str(result.inserted_id), 
+            username=user_data.username.lower(),
+            name=user_doc["name"]
+        )
+    )
+
+@router.post("/auth/login", response_model=TokenResponse)
+async def login(user_data: UserLogin):
+    """Login with username and password"""
+    user = await db.users.find_one({"username": user_data.username.lower()})
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    valid, new_hash = await password_hasher.verify_and_update(user_data.password, user["password"])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    
+    # Cost factor changed since this hash was made: store the rehash transparently
+    if new_hash:
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+        invalidate_user(user["_id"])
+        password_hasher.rehashed += 1
+    
+    token = create_access_token({"sub": str(user["_id"])})
+    
+    return TokenResponse(
+        access_token=token,
+        token_type="bearer",
+        user=UserResponse(
+            id=str(user["_id"]), 
+            username=user["username"],
+            name=user.get("name")
+        )
+    )
+
+@router.get("/auth/me", response_model=UserResponse)
+async def get_me(current_user: dict = Depends(get_current_user)):
+    """Get current user info"""
+    return UserResponse(
+        id=str(current_user["_id"]), 
+        username=current_user["username"],
+        name=current_user.get("name")
+    )
+
+@router.get("/auth/stats")
+async def auth_cache_stats():
+    """Token/user cache counters (user_cache_hits are MongoDB lookups saved) and bcrypt pool state"""
+    return {**auth_stats, "cached_users": len(user_cache), "cached_tokens": len(token_cache),
+            "password_hasher": password_hasher.snapshot()}
+
+# ==========================================
+# PRODUCT MODEL
+# ==========================================
+
+class ProductCreate(BaseModel):
+    name: str
+    expiryDate: str
+    category: str
+
+class ProductResponse(BaseModel):
+    id: str
+    name: str
+    expiryDate: str
+    category: str
+    createdAt: str
+    updatedAt: Optional[str] = None
+
+class ProductChangesResponse(BaseModel):
+    changes: List[ProductResponse]
+    deleted: List[str]
+    token: str
+    reset: bool
+
+# ==========================================
+# PRODUCT CRUD ENDPOINTS (Protected)
+# ==========================================
+
+PRODUCTS_MAX_PAGE_SIZE = int(os.getenv("PRODUCTS_MAX_PAGE_SIZE", "1000"))
+PRODUCT_LIST_FIELDS = {"name": 1, "expiryDate": 1, "category": 1, "createdAt": 1, "updatedAt": 1}
+# Deletes are kept as tombstones this long; older sync tokens get a full reset
+PRODUCT_TOMBSTONE_TTL_DAYS = int(os.getenv("PRODUCT_TOMBSTONE_TTL_DAYS", "30"))
+# An in-flight write marker older than this is treated as leaked by a crashed process
+PRODUCT_WRITE_STALE_SECONDS = float(os.getenv("PRODUCT_WRITE_STALE_SECONDS", "60"))
+
+
+async def get_product_version(user_id: str) -> int:
+    """Per-user product version: bumped on every product write, read without touching products"""
+    doc = await db.product_versions.find_one({"_id": user_id})
+    return doc["version"] if doc else 0
+
+
+@asynccontextmanager
+async def product_write(user_id: str):
+    """
+    Wrap every product/tombstone write: marks it as in flight from before the first change
+    until its version bump and summary update are done, so GET /products/summary only
+    stores a summary no write overlapped. Markers are timestamped, so one left behind by
+    a process that died mid-write stops counting after PRODUCT_WRITE_STALE_SECONDS.
+    """
+    marker = f"inflight.{ObjectId()}"
+    await db.product_versions.update_one({"_id": user_id}, {"$set": {marker: datetime.utcnow()}}, upsert=True)
+    try:
+        yield
+    finally:
+        await db.product_versions.update_one({"_id": user_id}, {"$unset": {marker: ""}})
+
+
+def product_writes_in_flight(version_doc: dict) -> bool:
+    """Any write marker on a product_versions doc that is recent enough to still be running"""
+    cutoff = datetime.utcnow() - timedelta(seconds=PRODUCT_WRITE_STALE_SECONDS)
+    return any(started > cutoff for started in (version_doc.get("inflight") or {}).values())
+
+
+async def bump_product_version(user_id: str) -> int:
+    doc = await db.product_versions.find_one_and_update(
+        {"_id": user_id}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+
+async def stamp_product_version(user_id: str, collection, ids: list) -> int:
+    """
+    Bump the version and stamp freshly written products/tombstones with it.
+    Writers insert with syncVersion None first and delta reads include unstamped docs,
+    so a token handed out for version V never predates a write that V covers.
+    """
+    version = await bump_product_version(user_id)
+    for start in range(0, len(ids), PRODUCTS_BULK_CHUNK_SIZE):
+        await collection.update_many({"_id": {"$in": ids[start:start + PRODUCTS_BULK_CHUNK_SIZE]}},
+                                     {"$set": {"syncVersion": version}})
+    return version
+
+
+def encode_sync_token(version: int) -> str:
+    return f"{version}.{int(time.time())}"
+
+
+def decode_sync_token(token: str) -> Tuple[int, float]:
+    try:
+        version, issued = token.split(".")
+        return int(version), float(issued)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+def products_etag(user_id: str, version: int, *params) -> str:
+    digest = hashlib.sha1(repr((user_id, version, params)).encode()).hexdigest()[:16]
+    return f'W/"{digest}"'
+
+
+def encode_product_cursor(doc: dict) -> str:
+    """Opaque keyset cursor: the (expiryDate, _id) of the last product on a page"""
+    raw = json.dumps([doc["expiryDate"], str(doc["_id"])]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_product_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        expiry, product_id = json.loads(raw)
+        return str(expiry), ObjectId(product_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def product_json(doc: dict) -> str:
+    """Serialise a product straight from its Mongo document (same shape as ProductResponse)"""
+    return json.dumps({
+        "id": str(doc["_id"]),
+        "name": doc["name"],
+        "expiryDate": doc["expiryDate"],
+        "category": doc["category"],
+        "createdAt": doc.get("createdAt", ""),
+        "updatedAt": doc.get("updatedAt")
+    })
+
+
+async def stream_json_array(docs, chunk_size: int = 200):
+    """Yield a JSON array of products in chunks, without building the whole list"""
+    yield "["
+    chunk, first = [], True
+    async for doc in docs:
+        chunk.append(product_json(doc))
+        if len(chunk) >= chunk_size:
+            yield ("" if first else ",") + ",".join(chunk)
+            chunk, first = [], False
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield "]"
+
+
+async def _iterate(docs: list):
+    for doc in docs:
+        yield doc
+
+
+@router.get("/products", response_model=List[ProductResponse])
+async def get_products(
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get products for current user sorted by expiry date.
+    Without `limit` the whole list is returned. With `limit`, one page is returned and
+    the X-Next-Cursor header holds the `after` value for the next page (absent on the last).
+    Responses carry an ETag; a matching If-None-Match gets 304 without reading products.
+    """
+    user_id = str(current_user["_id"])
+    etag = products_etag(user_id, await get_product_version(user_id), limit, after)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=cache_headers)
+    
+    query = {"user_id": user_id}
+    if after:
+        expiry, product_id = decode_product_cursor(after)
+        query["$or"] = [
+            {"expiryDate": {"$gt": expiry}},
+            {"expiryDate": expiry, "_id": {"$gt": product_id}}
+        ]
+    cursor = db.products.find(query, PRODUCT_LIST_FIELDS).sort([("expiryDate", 1), ("_id", 1)])
+    
+    if limit is None:
+        return StreamingResponse(stream_json_array(cursor), media_type="application/json", headers=cache_headers)
+    
+    if not 1 <= limit <= PRODUCTS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {PRODUCTS_MAX_PAGE_SIZE}")
+    
+    # One extra document tells us whether another page exists
+    docs = await cursor.limit(limit + 1).to_list(length=limit + 1)
+    headers = dict(cache_headers)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_product_cursor(docs[-1])
+    return StreamingResponse(stream_json_array(_iterate(docs)), media_type="application/json", headers=headers)
+
+@router.get("/products/changes", response_model=ProductChangesResponse)
+async def get_product_changes(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """
+    Products created/updated and ids deleted since a sync token.
+    Without `since` (or with an expired token) the full list is returned with reset=true.
+    Keep the returned `token` for the next call.
+    """
+    user_id = str(current_user["_id"])
+    version = await get_product_version(user_id)
+    
+    since_version, issued = decode_sync_token(since) if since else (0, 0.0)
+    reset = since_version <= 0 or time.time() - issued > (PRODUCT_TOMBSTONE_TTL_DAYS - 1) * 86400
+    
+    if reset:
+        cursor = db.products.find({"user_id": user_id}, PRODUCT_LIST_FIELDS).sort([("expiryDate", 1), ("_id", 1)])
+        deleted = []
+    else:
+        # Explicit nulls are writes still in flight (see stamp_product_version); a missing field
+        # is a product from before delta sync, which only full resets deliver
+        in_flight = {"syncVersion": {"$in": [None], "$exists": True}}
+        changed = {"user_id": user_id, "$or": [{"syncVersion": {"$gt": since_version}}, in_flight]}
+        cursor = db.products.find(changed, PRODUCT_LIST_FIELDS)
+        deleted = [t["product_id"] async for t in db.product_tombstones.find(changed, {"product_id": 1})]
+    
+    changes = [json.loads(product_json(doc)) async for doc in cursor]
+    return ProductChangesResponse(changes=changes, deleted=deleted, token=encode_sync_token(version), reset=reset)
+
+@router.post("/products", response_model=ProductResponse)
+async def create_product(product: ProductCreate, current_user: dict = Depends(get_current_user)):
+    """Create a new product for current user"""
+    user_id = str(current_user["_id"])
+    now = datetime.utcnow().isoformat()
+    doc = {
+        "name": product.name,
+        "expiryDate": product.expiryDate,
+        "category": product.category,
+        "user_id": user_id,
+        "createdAt": now,
+        "updatedAt": now,
+        "syncVersion": None
+    }
+    async with product_write(user_id):
+        result = await db.products.insert_one(doc)
+        version = await stamp_product_version(user_id, db.products, [result.inserted_id])
+        await apply_summary_change(user_id, version, doc, +1)
+    return ProductResponse(
+        id=str(result.inserted_id),
+        name=doc["name"],
+        expiryDate=doc["expiryDate"],
+        category=doc["category"],
+        createdAt=doc["createdAt"],
+        updatedAt=doc["updatedAt"]
+    )
+
+PRODUCTS_BULK_MAX_ITEMS = int(os.getenv("PRODUCTS_BULK_MAX_ITEMS", "5000"))
+PRODUCTS_BULK_CHUNK_SIZE = 500
+PRODUCT_EXPORT_COLUMNS = ["id", "name", "expiryDate", "category", "createdAt", "updatedAt"]
+
+@router.post("/products/bulk")
+async def create_products_bulk(items: List[Any] = Body(...), current_user: dict = Depends(get_current_user)):
+    """
+    Import many products at once. Each item is validated like POST /products;
+    valid ones are written with unordered insert_many in chunks and failures are
+    reported per item (by position in the request).
+    """
+    if len(items) > PRODUCTS_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {PRODUCTS_BULK_MAX_ITEMS} products per request")
+    
+    user_id = str(current_user["_id"])
+    errors = []
+    valid: List[Tuple[int, ProductCreate]] = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "Item must be an object"})
+            continue
+        try:
+            valid.append((index, ProductCreate(**item)))
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append({"index": index, "error": message})
+    
+    inserted = 0
+    if valid:
+        async with product_write(user_id):
+            now = datetime.utcnow().isoformat()
+            ids = []
+            for start in range(0, len(valid), PRODUCTS_BULK_CHUNK_SIZE):
+                chunk = valid[start:start + PRODUCTS_BULK_CHUNK_SIZE]
+                docs = [{
+                    "_id": ObjectId(),
+                    "name": product.name,
+                    "expiryDate": product.expiryDate,
+                    "category": product.category,
+                    "user_id": user_id,
+                    "createdAt": now,
+                    "updatedAt": now,
+                    "syncVersion": None
+                } for _, product in chunk]
+                ids.extend(doc["_id"] for doc in docs)
+                try:
+                    result = await db.products.insert_many(docs, ordered=False)
+                    inserted += len(result.inserted_ids)
+                except BulkWriteError as e:
+                    failed = {err["index"]: err.get("errmsg", "write failed")
+                              for err in e.details.get("writeErrors", [])}
+                    inserted += e.details.get("nInserted", len(docs) - len(failed))
+                    errors.extend({"index": chunk[i][0], "error": msg} for i, msg in failed.items())
+            # Ids of failed inserts match nothing
+            await stamp_product_version(user_id, db.products, ids)
+    
+    errors.sort(key=lambda err: err["index"])
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
+# Spreadsheets evaluate cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_safe(value: str) -> str:
+    """Neutralise formula injection: prefix user text that a spreadsheet would evaluate with '"""
+    return "'" + value if value.startswith(CSV_FORMULA_PREFIXES) else value
+
+
+@router.get("/products/export")
+async def export_products(format: str = "csv", current_user: dict = Depends(get_current_user)):
+    """Stream all of the user's products as CSV or NDJSON straight from the cursor"""
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'")
+    cursor = db.products.find({"user_id": str(current_user["_id"])}, PRODUCT_LIST_FIELDS) \
+        .sort([("expiryDate", 1), ("_id", 1)])
+    
+    async def ndjson_rows():
+        async for doc in cursor:
+            yield product_json(doc) + "\n"
+    
+    async def csv_rows(chunk_size: int = 200):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(PRODUCT_EXPORT_COLUMNS)
+        rows = 0
+        async for doc in cursor:
+            writer.writerow([str(doc["_id"]), csv_safe(doc["name"]), doc["expiryDate"], csv_safe(doc["category"]),
+                             doc.get("createdAt", ""), doc.get("updatedAt", "")])
+            rows += 1
+            if rows % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    filename = f"expireguard-products.{format}"
+    return StreamingResponse(
+        csv_rows() if format == "csv" else ndjson_rows(),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Expiry windows for the dashboard summary, in days from "today"
+PRODUCT_SUMMARY_BUCKETS = ("expired", "this_week", "this_month", "later")
+PRODUCT_SUMMARY_WEEK_DAYS = 7
+PRODUCT_SUMMARY_MONTH_DAYS = 30
+PRODUCT_SUMMARY_TOP_N = int(os.getenv("PRODUCT_SUMMARY_TOP_N", "3"))
+
+
+def summary_bounds(today: datetime) -> Tuple[str, str, str]:
+    """ISO date strings bounding the buckets (string order is date order)"""
+    return (today.strftime("%Y-%m-%d"),
+            (today + timedelta(days=PRODUCT_SUMMARY_WEEK_DAYS)).strftime("%Y-%m-%d"),
+            (today + timedelta(days=PRODUCT_SUMMARY_MONTH_DAYS)).strftime("%Y-%m-%d"))
+
+
+def expiry_bucket(expiry_date: str, bounds: Tuple[str, str, str]) -> str:
+    today, week, month = bounds
+    if expiry_date < today:
+        return "expired"
+    if expiry_date <= week:
+        return "this_week"
+    if expiry_date <= month:
+        return "this_month"
+    return "later"
+
+
+def summary_category_key(category: str) -> str:
+    """Category names can contain '.' or start with '$', so summary fields are keyed by a digest"""
+    return "c" + hashlib.sha1(category.encode()).hexdigest()[:12]
+
+
+def summary_item(doc: dict) -> dict:
+    return {"id": str(doc["_id"]), "name": doc["name"], "expiryDate": doc["expiryDate"]}
+
+
+async def compute_product_summary(user_id: str, bounds: Tuple[str, str, str]) -> dict:
+    """Bucket counts and the soonest-expiring items per (category, bucket), in one aggregation"""
+    today, week, month = bounds
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"expiryDate": 1, "_id": 1}},
+        {"$project": {
+            "name": 1, "expiryDate": 1, "category": 1,
+            "bucket": {"$switch": {
+                "branches": [
+                    {"case": {"$lt": ["$expiryDate", today]}, "then": "expired"},
+                    {"case": {"$lte": ["$expiryDate", week]}, "then": "this_week"},
+                    {"case": {"$lte": ["$expiryDate", month]}, "then": "this_month"}
+                ],
+                "default": "later"
+            }}
+        }},
+        {"$group": {
+            "_id": {"category": "$category", "bucket": "$bucket"},
+            "count": {"$sum": 1},
+            "items": {"$push": {"_id": "$_id", "name": "$name", "expiryDate": "$expiryDate"}}
+        }},
+        {"$project": {"count": 1, "next": {"$slice": ["$items", PRODUCT_SUMMARY_TOP_N]}}}
+    ]
+    totals = {bucket: 0 for bucket in PRODUCT_SUMMARY_BUCKETS}
+    categories: Dict[str, dict] = {}
+    async for group in db.products.aggregate(pipeline):
+        category, bucket = group["_id"]["category"], group["_id"]["bucket"]
+        entry = categories.setdefault(summary_category_key(category), {"category": category})
+        entry[bucket] = {"count": group["count"], "next": [summary_item(doc) for doc in group["next"]]}
+        totals[bucket] += group["count"]
+    return {"asOf": today, "totals": totals, "categories": categories}
+
+
+async def apply_summary_change(user_id: str, version: int, doc: dict, delta: int):
+    """
+    Fold one product create (+1) or delete (-1) into the stored summary.
+    Only applies when the summary is exactly one version behind; otherwise it is
+    left stale and GET /products/summary recomputes it.
+    """
+    bounds = summary_bounds(datetime.now())
+    bucket = expiry_bucket(doc["expiryDate"], bounds)
+    path = f"categories.{summary_category_key(doc['category'])}"
+    update = {
+        "$inc": {f"{path}.{bucket}.count": delta, f"totals.{bucket}": delta},
+        "$set": {"version": version, f"{path}.category": doc["category"]}
+    }
+    if delta > 0:
+        update["$push"] = {f"{path}.{bucket}.next": {
+            "$each": [summary_item(doc)], "$sort": {"expiryDate": 1}, "$slice": PRODUCT_SUMMARY_TOP_N
+        }}
+    else:
+        update["$pull"] = {f"{path}.{bucket}.next": {"id": str(doc["_id"])}}
+    summary = await db.product_summaries.find_one_and_update(
+        {"_id": user_id, "asOf": bounds[0], "version": version - 1}, update,
+        return_document=ReturnDocument.AFTER
+    )
+    if summary and delta < 0:
+        # Removing one of the listed items leaves a gap only a recompute can fill
+        entry = summary["categories"][summary_category_key(doc["category"])][bucket]
+        if len(entry.get("next", [])) < min(entry["count"], PRODUCT_SUMMARY_TOP_N):
+            await db.product_summaries.update_one({"_id": user_id}, {"$set": {"version": -1}})
+
+
+@router.get("/products/summary")
+async def get_product_summary(current_user: dict = Depends(get_current_user)):
+    """
+    Dashboard counts per category and expiry window (expired / this_week / this_month / later)
+    with the soonest-expiring items of each. Served from a per-user summary document that
+    writes keep up to date; it is recomputed when stale (new day, bulk import, missed update).
+    """
+    user_id = str(current_user["_id"])
+    before = await db.product_versions.find_one({"_id": user_id}) or {}
+    version = before.get("version", 0)
+    bounds = summary_bounds(datetime.now())
+    summary = await db.product_summaries.find_one({"_id": user_id})
+    if not summary or summary.get("asOf") != bounds[0] or summary.get("version") != version:
+        summary = await compute_product_summary(user_id, bounds)
+        after = await db.product_versions.find_one({"_id": user_id}) or {}
+        # Only store a snapshot no write overlapped (see product_write); otherwise the next read
+        # recomputes. A write starting after this check bumps past `version`, leaving it stale.
+        overlapped = product_writes_in_flight(before) or product_writes_in_flight(after)
+        if not overlapped and after.get("version", 0) == version:
+            summary["version"] = version
+            await db.product_summaries.replace_one({"_id": user_id}, summary, upsert=True)
+            # Nothing is in flight, so any marker still present was leaked; drop it
+            leaked = {f"inflight.{key}": "" for key in (after.get("inflight") or {})}
+            if leaked:
+                await db.product_versions.update_one({"_id": user_id}, {"$unset": leaked})
+    
+    categories = []
+    for entry in summary["categories"].values():
+        buckets = {bucket: entry.get(bucket) or {"count": 0, "next": []} for bucket in PRODUCT_SUMMARY_BUCKETS}
+        if any(b["count"] > 0 for b in buckets.values()):
+            categories.append({"category": entry["category"], "buckets": buckets})
+    categories.sort(key=lambda c: c["category"])
+    return {"asOf": summary["asOf"], "totals": summary["totals"], "categories": categories}
+
+@router.delete("/products/{product_id}")
+async def delete_product(product_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete a product by ID (only if owned by current user)"""
+    user_id = str(current_user["_id"])
+    try:
+        async with product_write(user_id):
+            deleted = await db.products.find_one_and_delete({
+                "_id": ObjectId(product_id),
+                "user_id": user_id
+            })
+            if deleted is None:
+                raise HTTPException(status_code=404, detail="Product not found")
+            
+            # Tombstone so delta-syncing clients learn about the delete
+            tombstone = await db.product_tombstones.insert_one({
+                "user_id": user_id,
+                "product_id": product_id,
+                "syncVersion": None,
+                "deletedAt": datetime.utcnow()
+            })
+            version = await stamp_product_version(user_id, db.product_tombstones, [tombstone.inserted_id])
+            await apply_summary_change(user_id, version, deleted, -1)
+        await db.notifications.delete_many({"user_id": user_id, "product_id": product_id})
+        return {"message": "Product deleted"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ==========================================
+# NOTIFICATIONS
+# ==========================================
+
+NOTIFICATIONS_MAX_PAGE_SIZE = 200
+# Run the expiry sweep inside this process; turn off when running `python sweeper.py` separately
+EXPIRY_SWEEP_IN_PROCESS = os.getenv("EXPIRY_SWEEP_IN_PROCESS", "true").lower() == "true"
+expiry_sweeper: Optional[ExpirySweeper] = None
+expiry_sweep_task: Optional[asyncio.Task] = None
+
+
+async def startup_expiry_sweep():
+    global expiry_sweeper, expiry_sweep_task
+    expiry_sweeper = ExpirySweeper(db)
+    if EXPIRY_SWEEP_IN_PROCESS and EXPIRY_SWEEP_INTERVAL_SECONDS > 0:
+        expiry_sweep_task = asyncio.ensure_future(expiry_sweeper.run_forever(EXPIRY_SWEEP_INTERVAL_SECONDS))
+
+async def shutdown_expiry_sweep():
+    global expiry_sweep_task
+    if expiry_sweep_task:
+        expiry_sweep_task.cancel()
+        expiry_sweep_task = None
+
+
+def notification_json(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "productId": doc["product_id"],
+        "kind": doc["kind"],
+        "name": doc.get("name"),
+        "category": doc.get("category"),
+        "expiryDate": doc["expiryDate"],
+        "createdAt": doc["createdAt"].isoformat(),
+        "read": doc.get("read", False)
+    }
+
+
+@router.get("/notifications")
+async def get_notifications(
+    since: Optional[str] = None,
+    unread: bool = False,
+    limit: int = 100,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Expiry notifications written by the sweep, oldest first.
+    Pass the returned `next` as `since` to fetch only newer ones.
+    """
+    if not 1 <= limit <= NOTIFICATIONS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {NOTIFICATIONS_MAX_PAGE_SIZE}")
+    query: Dict[str, Any] = {"user_id": str(current_user["_id"])}
+    if since:
+        if not ObjectId.is_valid(since):
+            raise HTTPException(status_code=400, detail="Invalid since")
+        query["_id"] = {"$gt": ObjectId(since)}
+    if unread:
+        query["read"] = False
+    docs = await db.notifications.find(query).sort("_id", 1).limit(limit).to_list(length=limit)
+    return {
+        "notifications": [notification_json(doc) for doc in docs],
+        "next": str(docs[-1]["_id"]) if docs else since
+    }
+
+@router.post("/notifications/{notification_id}/read")
+async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
+    if not ObjectId.is_valid(notification_id):
+        raise HTTPException(status_code=400, detail="Invalid notification id")
+    result = await db.notifications.update_one(
+        {"_id": ObjectId(notification_id), "user_id": str(current_user["_id"])}, {"$set": {"read": True}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return {"message": "Notification marked as read"}
+
+@router.get("/notifications/sweep")
+async def expiry_sweep_status():
+    """Last expiry sweep run in this process and the shared resume state"""
+    state = await db.sweep_state.find_one({"_id": "expiry_sweep"}, {"after": 0}) or {}
+    state.pop("_id", None)
+    if state.get("leaseUntil"):
+        state["leaseUntil"] = state["leaseUntil"].isoformat()
+    return {"in_process": EXPIRY_SWEEP_IN_PROCESS, "last_run": expiry_sweeper.last_run if expiry_sweeper else None,
+            "state": state}
+
+# ==========================================
+# ROOT ENDPOINTS
+# ==========================================
+
+@router.get("/")
+def root():
+    return {"message": "ExpireGuard backend running"}
+
+@router.get("/api")
+def api_test():
+    return {"status": "API working"}
+
+
+@asynccontextmanager
+async def crud_lifespan(app: FastAPI):
+    await startup_db_client()
+    await startup_expiry_sweep()
+    try:
+        yield
+    finally:
+        await shutdown_expiry_sweep()
+        await shutdown_db_client()
+
+
+def include_crud(app: FastAPI):
+    """Serve auth, products and notifications from `app` (routes plus MongoDB and sweep lifecycle)"""
+    app.include_router(router)
+    app.state.lifespans.append(crud_lifespan)
+
+
+
+# Existing counters, read at scrape time
+metrics.callback("expireguard_auth_events_total", "Token/user cache counters", "counter",
+                 lambda: dict(auth_stats), ("event",))
+metrics.callback("expireguard_password_hash_pending", "bcrypt calls admitted", "gauge",
+                 lambda: password_hasher.snapshot()["pending"])
+metrics.callback("expireguard_password_hash_rejected_total", "bcrypt calls rejected with 503", "counter",
+                 lambda: password_hasher.rejected)
@@ -0,0 +1,16 @@
+"""
+CRUD-only entry point: auth, products and notifications without the OCR stack.
+
+    uvicorn crud_app:app --host 0.0.0.0 --port $PORT
+
+Point the client's VITE_OCR_URL at an ocr_worker service for scans.
+"""
+from core import create_app, include_crud
+
+app = create_app("ExpireGuard API")
+include_crud(app)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,148 @@
+"""
+Prometheus text-format metrics without a client library: counters, histograms and
+callbacks read at scrape time. One registry per process, served at GET /metrics.
+"""
+from typing import Any, Dict, List, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels: counter.inc() / counter.labels("a").inc()"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def labels(self, *values) -> "_BoundMetric":
+        return _BoundMetric(self, tuple(str(v) for v in values))
+
+    def inc(self, amount: float = 1, _key: Tuple = ()):
+        self._values[_key] = self._values.get(_key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def labels(self, *values) -> "_BoundMetric":
+        return _BoundMetric(self, tuple(str(v) for v in values))
+
+    def observe(self, value: float, _key: Tuple = ()):
+        state = self._values.get(_key)
+        if state is None:
+            state = self._values[_key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            for bound, count in zip(self.buckets, state):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {round(state[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class _BoundMetric:
+    def __init__(self, metric, key: Tuple):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1):
+        self._metric.inc(amount, self._key)
+
+    def observe(self, value: float):
+        self._metric.observe(value, self._key)
+
+
+class CallbackMetric:
+    """Gauge or counter read at scrape time from existing state (e.g. a stats dict)"""
+
+    def __init__(self, name: str, documentation: str, kind: str, fn, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        value = self._fn()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        return [f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))} {v}"
+                for key, v in items if v is not None]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_TIME_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str, fn, labelnames: Tuple[str, ...] = ()):
+        return self.register(CallbackMetric(name, documentation, kind, fn, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print(f"Metric {metric.name} failed: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+if resource is not None:
+    metrics.callback("expireguard_peak_rss_bytes", "Peak resident set size of this process", "gauge",
+                     lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
@@ -0,0 +1,2312 @@
+"""
+OCR pipeline: image ingest, the quality gate, preprocessing, text-region detection, date
+parsing, the GS1 barcode fast path, Tesseract backends, the executor with admission control,
+the result cache, the job queue and live-scan sessions.
+
+This is the only module that imports OpenCV, NumPy, Pillow and pytesseract. Web processes
+load it on first use through ocr_routes.py, and spawned OCR worker processes import it
+without the CRUD app.
+"""
+from fastapi import HTTPException, UploadFile, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from PIL import Image, ImageOps
+import pytesseract
+import io
+import re
+import cv2
+import numpy as np
+from datetime import datetime
+from typing import Optional, Tuple, List, Dict, Union
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import calendar
+import contextvars
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+from cache import TTLCache
+from metrics import metrics, Histogram
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+load_dotenv()
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+
+# Keywords that indicate EXPIRY date context (positive signals)
+EXPIRY_KEYWORDS = [
+    r'\bEXP\b', r'\bEXPIRY\b', r'\bEXPIRES?\b', r'\bEXP\.?\s*DATE\b',
+    r'\bUSE\s*BY\b', r'\bBEST\s*BEFORE\b', r'\bBB\b', r'\bBBD\b', r'\bBBE\b',
+    r'\bVALID\s*TILL\b', r'\bVALID\s*UNTIL\b', r'\bE\.?\s*$', r'\bEXP\.?\s*$'
+]
+
+# Keywords to IGNORE (negative signals - not expiry dates)
+IGNORE_KEYWORDS = [
+    r'\bMFG\b', r'\bMFD\b', r'\bMANUFACTURED\b', r'\bMANUF\b',
+    r'\bPKD\b', r'\bPACKED\b', r'\bPACKAGED\b',
+    r'\bBATCH\b', r'\bLOT\b', r'\bB\.?\s*NO\b', r'\bL\.?\s*NO\b',
+    r'\bMRP\b', r'\bPRICE\b', r'\bRS\.?\b', r'\bINR\b',
+    r'\bPROD\b', r'\bPRODUCTION\b', r'\bDOM\b'
+]
+
+# Month name patterns
+MONTHS = r'(?:JAN(?:UARY)?|FEB(?:RUARY)?|MAR(?:CH)?|APR(?:IL)?|MAY|JUN(?:E)?|JUL(?:Y)?|AUG(?:UST)?|SEP(?:TEMBER)?|OCT(?:OBER)?|NOV(?:EMBER)?|DEC(?:EMBER)?)'
+
+# Date regex patterns with named groups for parsing
+DATE_PATTERNS = [
+    # YYYY-MM-DD or YYYY/MM/DD or YYYY.MM.DD
+    (r'\b(20[2-4]\d)[-/\.](0?[1-9]|1[0-2])[-/\.](0?[1-9]|[12]\d|3[01])\b', 'ymd'),
+    # DD-MM-YYYY or DD/MM/YYYY or DD.MM.YYYY
+    (r'\b(0?[1-9]|[12]\d|3[01])[-/\.](0?[1-9]|1[0-2])[-/\.](20[2-4]\d)\b', 'dmy'),
+    # DD-MM-YY or DD/MM/YY
+    (r'\b(0?[1-9]|[12]\d|3[01])[-/\.](0?[1-9]|1[0-2])[-/\.]([2-4]\d)\b', 'dmy_short'),
+    # MM-YYYY or MM/YYYY (expiry often shows just month/year)
+    (r'\b(0?[1-9]|1[0-2])[-/\.](20[2-4]\d)\b', 'my'),
+    # MM/YY
+    (r'\b(0?[1-9]|1[0-2])[-/\.]([2-4]\d)\b', 'my_short'),
+    # MMM YYYY or MMM-YYYY (e.g., DEC 2025, MAR-2026)
+    (rf'\b({MONTHS})[-\s\.]*(\d{{4}})\b', 'month_year'),
+    # DD MMM YYYY (e.g., 15 DEC 2025)
+    (rf'\b(\d{{1,2}})\s*[-\s\.]*({MONTHS})[-\s\.]*(\d{{4}})\b', 'day_month_year'),
+    # MMM DD, YYYY (e.g., DEC 15, 2025)
+    (rf'\b({MONTHS})\s*(\d{{1,2}})[,\s]+(\d{{4}})\b', 'month_day_year'),
+]
+
+@dataclass
+class DateCandidate:
+    """Represents a potential expiry date found in text"""
+    date_str: str
+    normalized: str
+    confidence: float
+    has_expiry_keyword: bool
+    line_text: str
+    pattern_type: str
+
+
+# ==========================================
+# IMAGE INGEST
+# ==========================================
+
+# Uploads above this size are rejected before the image is decoded
+OCR_MAX_UPLOAD_BYTES = int(os.getenv("OCR_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Decompression-bomb guard on the encoded dimensions
+OCR_MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_IMAGE_PIXELS", str(50_000_000)))
+# Longest side after decoding; JPEGs are decoded at reduced DCT scale to get close to it
+OCR_DECODE_MAX_SIDE = int(os.getenv("OCR_DECODE_MAX_SIDE", "2000"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ImageTooLarge(ValueError):
+    """Upload or decoded image exceeds the configured ingest limits"""
+
+
+async def read_upload(file: UploadFile, max_bytes: int = OCR_MAX_UPLOAD_BYTES) -> bytearray:
+    """Read an upload in chunks, stopping as soon as it goes over max_bytes"""
+    if file.size is not None and file.size > max_bytes:
+        raise ImageTooLarge(f"Image exceeds the {max_bytes // 1024} KB upload limit")
+    
+    # Returned as a bytearray so the caller can release it in place once decoded
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise ImageTooLarge(f"Image exceeds the {max_bytes // 1024} KB upload limit")
+    return buffer
+
+
+def decode_image(contents: bytes, max_side: int = OCR_DECODE_MAX_SIDE) -> np.ndarray:
+    """
+    Decode uploaded image bytes straight to an upright grayscale array (runs in a worker).
+    JPEGs are decoded in draft mode (DCT scaling + grayscale in the decoder), so a
+    12 MP photo never materialises at full resolution or as RGB.
+    """
+    pil_image = Image.open(io.BytesIO(contents))
+    w, h = pil_image.size
+    if w * h > OCR_MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"Image has {w}x{h} pixels, limit is {OCR_MAX_IMAGE_PIXELS}")
+    
+    # Only a scale >= the target is picked, so the final resize below stays a downscale
+    ratio = min(1.0, max_side / max(w, h))
+    pil_image.draft('L', (max(1, int(w * ratio)), max(1, int(h * ratio))))
+    
+    # Phone cameras store rotation in EXIF instead of rotating pixels
+    pil_image = ImageOps.exif_transpose(pil_image)
+    if pil_image.mode != 'L':
+        pil_image = pil_image.convert('L')
+    if max(pil_image.size) > max_side:
+        pil_image.thumbnail((max_side, max_side), Image.LANCZOS)
+    
+    return np.asarray(pil_image)
+
+
+class IngestStats:
+    """Memory accounting for decoded scans"""
+
+    def __init__(self):
+        self.scans = 0
+        self.largest_upload_bytes = 0
+        self.largest_decoded_bytes = 0
+        self.rejected = 0
+
+    def record(self, upload_bytes: int, decoded: np.ndarray):
+        self.scans += 1
+        self.largest_upload_bytes = max(self.largest_upload_bytes, upload_bytes)
+        self.largest_decoded_bytes = max(self.largest_decoded_bytes, decoded.nbytes)
+
+    def snapshot(self) -> dict:
+        snapshot = {
+            "scans": self.scans,
+            "rejected": self.rejected,
+            "max_upload_bytes": OCR_MAX_UPLOAD_BYTES,
+            "decode_max_side": OCR_DECODE_MAX_SIDE,
+            "largest_upload_bytes": self.largest_upload_bytes,
+            "largest_decoded_bytes": self.largest_decoded_bytes,
+        }
+        if resource is not None:
+            # ru_maxrss is in KB on Linux
+            snapshot["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return snapshot
+
+
+ingest_stats = IngestStats()
+
+
+# ==========================================
+# IMAGE QUALITY GATE
+# ==========================================
+
+# Cheap checks on a downscaled copy that turn away photos OCR cannot read, with a hint
+# the user can act on. Tune against the corpus (compare with --no-quality-gate):
+#     python benchmarks/bench_ocr_accuracy.py --unreadable 20
+OCR_QUALITY_GATE = os.getenv("OCR_QUALITY_GATE", "1").lower() not in ("0", "false", "no")
+OCR_QUALITY_MAX_SIDE = int(os.getenv("OCR_QUALITY_MAX_SIDE", "512"))
+# Laplacian variance of the sharpest tile (a small date on a plain pack is still sharp),
+# rescaled to full contrast so dim-but-sharp labels are not called blurry
+OCR_QUALITY_MIN_SHARPNESS = float(os.getenv("OCR_QUALITY_MIN_SHARPNESS", "200"))
+QUALITY_TILES = 4  # per side
+# 0.1-99.9 percentile spread; below it there is no ink/background separation left
+OCR_QUALITY_MIN_CONTRAST = float(os.getenv("OCR_QUALITY_MIN_CONTRAST", "24"))
+# Share of clipped pixels (>= OCR_QUALITY_GLARE_LEVEL) on a label that isn't itself white
+OCR_QUALITY_MAX_GLARE = float(os.getenv("OCR_QUALITY_MAX_GLARE", "0.3"))
+OCR_QUALITY_GLARE_LEVEL = int(os.getenv("OCR_QUALITY_GLARE_LEVEL", "250"))
+# White paper is clipped background plus dark ink; a coloured or grey surface shows up as
+# mid-tones, and only there is a large clipped area a highlight rather than the paper
+GLARE_SURFACE_MIDTONES = 0.25
+
+QUALITY_HINTS = {
+    "too_dark": "More light - the photo is too dark to read",
+    "overexposed": "Less light - the photo is washed out",
+    "glare": "Tilt the product to avoid glare",
+    "blurry": "Hold steady - the photo is blurry",
+}
+
+
+def assess_image_quality(gray: np.ndarray) -> dict:
+    """
+    Sharpness, exposure and glare of a decoded scan (runs in a worker, a few ms).
+    "reason" is None when the image is worth running OCR on.
+    """
+    h, w = gray.shape
+    scale = OCR_QUALITY_MAX_SIDE / max(h, w)
+    if scale < 1:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    
+    low, high = np.percentile(gray, (0.1, 99.9))
+    contrast = float(high - low)
+    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    th, tw = max(1, laplacian.shape[0] // QUALITY_TILES), max(1, laplacian.shape[1] // QUALITY_TILES)
+    laplacian_var = max(float(laplacian[y:y + th, x:x + tw].var())
+                        for y in range(0, laplacian.shape[0] - th + 1, th)
+                        for x in range(0, laplacian.shape[1] - tw + 1, tw))
+    sharpness = laplacian_var * (255.0 / max(contrast, 1.0)) ** 2
+    glare = float(np.count_nonzero(gray >= OCR_QUALITY_GLARE_LEVEL)) / gray.size
+    midtones = float(np.count_nonzero((gray >= 64) & (gray < OCR_QUALITY_GLARE_LEVEL))) / gray.size
+    brightness = float(gray.mean())
+    
+    # Exposure first: a dark or washed-out frame also measures as blurry
+    if contrast < OCR_QUALITY_MIN_CONTRAST:
+        reason = "too_dark" if brightness < 128 else "overexposed"
+    elif glare > OCR_QUALITY_MAX_GLARE and midtones >= GLARE_SURFACE_MIDTONES:
+        reason = "glare"
+    elif sharpness < OCR_QUALITY_MIN_SHARPNESS:
+        reason = "blurry"
+    else:
+        reason = None
+    return {
+        "reason": reason,
+        "sharpness": round(sharpness, 1),
+        "contrast": round(contrast, 1),
+        "brightness": round(brightness, 1),
+        "glare": round(glare, 3),
+        "midtones": round(midtones, 3),
+    }
+
+
+def quality_response(quality: dict) -> dict:
+    hint = QUALITY_HINTS[quality["reason"]]
+    return {
+        "success": False,
+        "expiry_date": None,
+        "confidence": 0.0,
+        "source": "quality",
+        "quality": {**quality, "hint": hint},
+        "message": hint
+    }
+
+
+class QualityStats:
+    """Scans assessed by the quality gate and how many it turned away, by reason"""
+
+    def __init__(self):
+        self.assessed = 0
+        self.rejected: Dict[str, int] = {}
+
+    def record(self, quality: dict):
+        self.assessed += 1
+        if quality["reason"] is not None:
+            self.rejected[quality["reason"]] = self.rejected.get(quality["reason"], 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": OCR_QUALITY_GATE,
+            "assessed": self.assessed,
+            "rejected": dict(self.rejected),
+            "thresholds": {
+                "min_sharpness": OCR_QUALITY_MIN_SHARPNESS,
+                "min_contrast": OCR_QUALITY_MIN_CONTRAST,
+                "max_glare": OCR_QUALITY_MAX_GLARE,
+            },
+        }
+
+
+quality_stats = QualityStats()
+
+
+# ==========================================
+# IMAGE PREPROCESSING
+# ==========================================
+
+# Names of the variants returned by preprocess_image_variants, in order
+VARIANT_NAMES = ['adaptive', 'otsu', 'morph', 'inverted']
+
+# Images smaller than this on either side are upscaled once before binarisation
+MIN_OCR_SIDE = 800
+
+
+def upscale_small(image: np.ndarray) -> np.ndarray:
+    """Scale up images smaller than MIN_OCR_SIDE (at least 2x), others pass through"""
+    h, w = image.shape
+    if h < MIN_OCR_SIDE or w < MIN_OCR_SIDE:
+        scale = max(MIN_OCR_SIDE / h, MIN_OCR_SIDE / w, 2.0)
+        return cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_CUBIC)
+    return image
+
+
+def stage_base(gray: np.ndarray) -> np.ndarray:
+    """Shared base for the adaptive variants: scale up small images once"""
+    return upscale_small(gray)
+
+
+def stage_clahe(base: np.ndarray) -> np.ndarray:
+    """CLAHE contrast enhancement"""
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(base)
+
+
+def stage_blur(clahe: np.ndarray) -> np.ndarray:
+    return cv2.GaussianBlur(clahe, (3, 3), 0)
+
+
+def stage_adaptive(blur: np.ndarray) -> np.ndarray:
+    """Variant 1: adaptive threshold on the enhanced image"""
+    return cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+
+def stage_denoised(gray: np.ndarray) -> np.ndarray:
+    """
+    Non-local means denoising (the most expensive stage, only runs for otsu).
+    Runs on the image as uploaded: on the upscaled base it would cost 4x or more per small photo.
+    """
+    return cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+
+
+def stage_otsu(denoised: np.ndarray) -> np.ndarray:
+    """Variant 2: Otsu's thresholding with denoising, scaled up afterwards"""
+    _, otsu = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return upscale_small(otsu)
+
+
+def stage_morph(adaptive: np.ndarray) -> np.ndarray:
+    """Variant 3: Morphological operations for cleaning"""
+    kernel = np.ones((2, 2), np.uint8)
+    morph = cv2.morphologyEx(adaptive, cv2.MORPH_CLOSE, kernel)
+    return cv2.morphologyEx(morph, cv2.MORPH_OPEN, kernel)
+
+
+def stage_inverted(adaptive: np.ndarray) -> np.ndarray:
+    """Variant 4: Inverted (for dark backgrounds)"""
+    return cv2.bitwise_not(adaptive)
+
+
+# Stage name -> (input stages, function). "gray" is the decoded input.
+PREPROCESS_STAGES = {
+    'base': (('gray',), stage_base),
+    'clahe': (('base',), stage_clahe),
+    'blur': (('clahe',), stage_blur),
+    'adaptive': (('blur',), stage_adaptive),
+    'denoised': (('gray',), stage_denoised),
+    'otsu': (('denoised',), stage_otsu),
+    'morph': (('adaptive',), stage_morph),
+    'inverted': (('adaptive',), stage_inverted),
+}
+
+
+class PreprocessGraph:
+    """
+    Lazy, per-request preprocessing DAG.
+    Each stage is computed once, on first request, through `run` (e.g. the OCR executor);
+    stages nobody asks for are never computed.
+    """
+
+    def __init__(self, gray: np.ndarray, run):
+        self._run = run
+        self._tasks: Dict[str, asyncio.Future] = {}
+        self._gray = gray
+
+    async def get(self, name: str) -> np.ndarray:
+        if name == 'gray':
+            return self._gray
+        task = self._tasks.get(name)
+        if task is None:
+            # Store the task before awaiting so concurrent callers share it
+            task = asyncio.ensure_future(self._compute(name))
+            self._tasks[name] = task
+        return await task
+
+    async def _compute(self, name: str) -> np.ndarray:
+        deps, fn = PREPROCESS_STAGES[name]
+        inputs = await asyncio.gather(*(self.get(dep) for dep in deps))
+        return await self._run(fn, *inputs)
+
+    @property
+    def computed(self) -> List[str]:
+        return [name for name, task in self._tasks.items() if task.done() and not task.cancelled()]
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+
+def compute_stage(name: str, gray: np.ndarray, cache: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """Synchronous evaluation of one preprocessing stage (memoised in `cache`)"""
+    cache = {} if cache is None else cache
+    if name == 'gray':
+        return gray
+    if name not in cache:
+        deps, fn = PREPROCESS_STAGES[name]
+        cache[name] = fn(*(compute_stage(dep, gray, cache) for dep in deps))
+    return cache[name]
+
+
+def preprocess_image_variants(pil_image: Union[Image.Image, np.ndarray]) -> List[np.ndarray]:
+    """
+    Create multiple preprocessed versions of the image for better OCR coverage.
+    Accepts a PIL image or an already-decoded grayscale array.
+    Returns a list of preprocessed images to try, in VARIANT_NAMES order.
+    """
+    img_np = np.asarray(pil_image)
+    gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY) if img_np.ndim == 3 else img_np
+    
+    cache: Dict[str, np.ndarray] = {}
+    return [compute_stage(name, gray, cache) for name in VARIANT_NAMES]
+
+
+# ==========================================
+# TEXT REGION DETECTION
+# ==========================================
+
+# Locate text lines first and OCR only those crops instead of whole frames
+OCR_ROI = os.getenv("OCR_ROI", "1") == "1"
+OCR_ROI_MAX_REGIONS = int(os.getenv("OCR_ROI_MAX_REGIONS", "12"))
+OCR_ROI_CONFIG = '--oem 3 --psm 7'  # Single text line
+ROI_TEXT_HEIGHT = 48  # Crops are scaled so lines are about this tall
+
+
+def detect_text_regions(gray: np.ndarray, max_regions: int = OCR_ROI_MAX_REGIONS) -> List[Tuple[int, int, int, int]]:
+    """
+    Find candidate text lines with a morphological gradient + horizontal closing.
+    Returns (x, y, w, h) boxes in full-resolution coordinates, most date-like first.
+    """
+    h, w = gray.shape
+    scale = min(1.0, 1000 / max(h, w))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    sh, sw = small.shape
+    
+    # Character edges light up in the gradient; Otsu separates them from flat packaging art
+    grad = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, edges = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    
+    # Join neighbouring characters into line blobs
+    line_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(9, sw // 60), 1))
+    lines = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, line_kernel)
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    scored = []
+    for contour in contours:
+        x, y, cw, ch = cv2.boundingRect(contour)
+        if ch < 8 or ch > sh // 4 or cw < 2 * ch:
+            continue
+        
+        # Count glyph-sized components: dates and keyword lines have roughly 4-20 of them
+        n, _, stats, _ = cv2.connectedComponentsWithStats(edges[y:y + ch, x:x + cw])
+        glyphs = sum(1 for i in range(1, n) if 0.35 * ch <= stats[i, cv2.CC_STAT_HEIGHT] <= ch)
+        if glyphs < 3:
+            continue
+        score = min(glyphs, 20) - 0.5 * max(0, glyphs - 20)
+        
+        # Back to full resolution with a little padding around the line
+        pad = int(0.2 * ch / scale)
+        x0, y0 = max(0, int(x / scale) - pad), max(0, int(y / scale) - pad)
+        x1, y1 = min(w, int((x + cw) / scale) + pad), min(h, int((y + ch) / scale) + pad)
+        scored.append((score, (x0, y0, x1 - x0, y1 - y0)))
+    
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [box for _, box in scored[:max_regions]]
+
+
+def prepare_text_crop(gray: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+    """Crop a text line, scale it to a Tesseract-friendly height and binarise as dark-on-white"""
+    x, y, w, h = box
+    crop = gray[y:y + h, x:x + w]
+    scale = ROI_TEXT_HEIGHT / h
+    crop = cv2.resize(crop, None, fx=scale, fy=scale,
+                      interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
+    _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    
+    # Text is the minority colour; flip light-on-dark print
+    if cv2.countNonZero(binary) < binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    return cv2.copyMakeBorder(binary, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=255)
+
+
+def locate_text_crops(gray: np.ndarray) -> List[np.ndarray]:
+    """Detect text lines and return their prepared crops, most promising first (runs in a worker)"""
+    return [prepare_text_crop(gray, box) for box in detect_text_regions(gray)]
+
+
+# ==========================================
+# DATE PARSING & NORMALIZATION
+# ==========================================
+
+MONTH_MAP = {
+    'JAN': 1, 'JANUARY': 1, 'FEB': 2, 'FEBRUARY': 2, 'MAR': 3, 'MARCH': 3,
+    'APR': 4, 'APRIL': 4, 'MAY': 5, 'JUN': 6, 'JUNE': 6, 'JUL': 7, 'JULY': 7,
+    'AUG': 8, 'AUGUST': 8, 'SEP': 9, 'SEPTEMBER': 9, 'OCT': 10, 'OCTOBER': 10,
+    'NOV': 11, 'NOVEMBER': 11, 'DEC': 12, 'DECEMBER': 12
+}
+
+def normalize_date(match: Union[re.Match, Tuple[str, ...]], pattern_type: str) -> Optional[str]:
+    """
+    Normalize a date match (or its captured groups) to YYYY-MM-DD format.
+    Returns None if date is invalid.
+    """
+    try:
+        groups = match.groups() if isinstance(match, re.Match) else match
+        
+        if pattern_type == 'ymd':
+            year, month, day = int(groups[0]), int(groups[1]), int(groups[2])
+        
+        elif pattern_type == 'dmy':
+            day, month, year = int(groups[0]), int(groups[1]), int(groups[2])
+        
+        elif pattern_type == 'dmy_short':
+            day, month, year = int(groups[0]), int(groups[1]), int(groups[2])
+            year = 2000 + year if year < 100 else year
+        
+        elif pattern_type == 'my':
+            month, year = int(groups[0]), int(groups[1])
+            day = 1  # Default to first of month for MM/YYYY
+        
+        elif pattern_type == 'my_short':
+            month, year = int(groups[0]), int(groups[1])
+            year = 2000 + year if year < 100 else year
+            day = 1
+        
+        elif pattern_type == 'month_year':
+            month_name, year = groups[0].upper(), int(groups[1])
+            month = MONTH_MAP.get(month_name[:3], 0)
+            day = 1
+        
+        elif pattern_type == 'day_month_year':
+            day, month_name, year = int(groups[0]), groups[1].upper(), int(groups[2])
+            month = MONTH_MAP.get(month_name[:3], 0)
+        
+        elif pattern_type == 'month_day_year':
+            month_name, day, year = groups[0].upper(), int(groups[1]), int(groups[2])
+            month = MONTH_MAP.get(month_name[:3], 0)
+        
+        else:
+            return None
+        
+        # Validate ranges
+        if not (2020 <= year <= 2040):
+            return None
+        if not (1 <= month <= 12):
+            return None
+        if not (1 <= day <= 31):
+            return None
+        
+        # Create date (rejects e.g. 31/04) and return normalized string
+        datetime(year, month, day)
+        return f"{year:04d}-{month:02d}-{day:02d}"
+    
+    except (ValueError, IndexError):
+        return None
+
+
+def has_expiry_context(line: str) -> bool:
+    """Check if line contains expiry-related keywords"""
+    return DATE_MATCHER.expiry_re.search(line.upper()) is not None
+
+
+def has_ignore_context(line: str) -> bool:
+    """Check if line contains keywords that indicate NOT expiry (MFG, batch, etc)"""
+    return DATE_MATCHER.ignore_re.search(line.upper()) is not None
+
+
+def calculate_confidence(candidate: DateCandidate, today: Optional[datetime] = None) -> float:
+    """
+    Calculate confidence score for a date candidate.
+    Pass `today` when scoring many candidates to avoid a clock read per candidate.
+    Score range: 0.0 to 1.0
+    """
+    score = 0.5  # Base confidence
+    
+    # Boost for expiry keyword presence
+    if candidate.has_expiry_keyword:
+        score += 0.35
+    
+    # Boost for common expiry formats
+    if candidate.pattern_type in ['my', 'my_short', 'month_year']:
+        score += 0.05  # MM/YYYY is common for expiry
+    
+    # Check if date is in reasonable future (expiry should be future for most products)
+    try:
+        date_obj = datetime.strptime(candidate.normalized, "%Y-%m-%d")
+        today = today or datetime.now()
+        days_diff = (date_obj - today).days
+        
+        if 0 <= days_diff <= 1095:  # Within 3 years from now
+            score += 0.1
+        elif days_diff < 0:  # Already expired
+            score += 0.05  # Still valid, just expired
+        else:
+            score -= 0.1  # Too far in future, suspicious
+    except:
+        pass
+    
+    return min(1.0, max(0.0, score))
+
+
+# ==========================================
+# OCR EXTRACTION
+# ==========================================
+
+# Fused scan order: most specific first, so "15/12/2025" reads as dmy rather than
+# as a month/year inside it
+DATE_PATTERN_PRIORITY = ['ymd', 'dmy', 'day_month_year', 'month_day_year',
+                         'dmy_short', 'month_year', 'my', 'my_short']
+
+
+def _name_groups(pattern: str, prefix: str) -> str:
+    """Rewrite the capturing groups of `pattern` as (?P<prefix__N>...)"""
+    out, index, i = [], 0, 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == '\\':
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if ch == '(' and not pattern.startswith('(?', i):
+            out.append(f'(?P<{prefix}__{index}>')
+            index += 1
+        else:
+            out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+class DateMatcher:
+    """
+    Precompiled matcher for extract_dates_from_text.
+    Keywords are fused into one alternation each and the date patterns into a single
+    named-group scan per line, which also drops overlapping readings of the same text.
+    """
+
+    def __init__(self, date_patterns=DATE_PATTERNS, expiry_keywords=EXPIRY_KEYWORDS,
+                 ignore_keywords=IGNORE_KEYWORDS):
+        self.expiry_re = re.compile('|'.join(f'(?:{k})' for k in expiry_keywords))
+        self.ignore_re = re.compile('|'.join(f'(?:{k})' for k in ignore_keywords))
+        
+        by_type = {pattern_type: pattern for pattern, pattern_type in date_patterns}
+        order = [t for t in DATE_PATTERN_PRIORITY if t in by_type] + \
+                [t for t in by_type if t not in DATE_PATTERN_PRIORITY]
+        self.group_counts = {t: re.compile(by_type[t]).groups for t in order}
+        self.date_re = re.compile(
+            '|'.join(f'(?P<{t}>{_name_groups(by_type[t], t)})' for t in order),
+            re.IGNORECASE
+        )
+
+    def scan_line(self, line: str):
+        """Yield (matched text, pattern type, normalized date) left to right without overlaps"""
+        pos = 0
+        while True:
+            match = self.date_re.search(line, pos)
+            if match is None:
+                return
+            pattern_type = match.lastgroup
+            groups = tuple(match.group(f'{pattern_type}__{i}') for i in range(self.group_counts[pattern_type]))
+            normalized = normalize_date(groups, pattern_type)
+            if normalized:
+                yield match.group(0), pattern_type, normalized
+                pos = match.end()
+            else:
+                # Invalid reading: let a shorter pattern try from the next character
+                pos = match.start() + 1
+
+    def extract(self, text: str, today: Optional[datetime] = None) -> List[DateCandidate]:
+        today = today or datetime.now()
+        candidates = []
+        
+        for line in text.split('\n'):
+            clean_line = line.strip()
+            if not clean_line:
+                continue
+            
+            upper_line = clean_line.upper()
+            # Skip lines with ignore keywords (MFG, batch, etc)
+            if self.ignore_re.search(upper_line):
+                continue
+            
+            has_expiry = self.expiry_re.search(upper_line) is not None
+            
+            for date_str, pattern_type, normalized in self.scan_line(clean_line):
+                candidate = DateCandidate(
+                    date_str=date_str,
+                    normalized=normalized,
+                    confidence=0.0,
+                    has_expiry_keyword=has_expiry,
+                    line_text=clean_line,
+                    pattern_type=pattern_type
+                )
+                candidate.confidence = calculate_confidence(candidate, today)
+                candidates.append(candidate)
+        
+        return candidates
+
+
+DATE_MATCHER = DateMatcher()
+
+
+def extract_dates_from_text(text: str, today: Optional[datetime] = None) -> List[DateCandidate]:
+    """
+    Extract all potential date candidates from OCR text.
+    """
+    return DATE_MATCHER.extract(text, today)
+
+
+# ==========================================
+# GS1 BARCODE FAST PATH
+# ==========================================
+
+# Decode QR / GS1-128 codes before OCR; an AI 17 expiry skips Tesseract entirely.
+# OpenCV has no DataMatrix decoder, so GS1 DataMatrix labels still go through OCR.
+OCR_BARCODE = os.getenv("OCR_BARCODE", "1") == "1"
+
+# Symbology identifiers some scanners/decoders prepend (]C1 GS1-128, ]Q3 GS1 QR, ]d2 GS1 DataMatrix, ]e0 DataBar)
+GS1_SYMBOLOGY_PREFIX = re.compile(r'^\][A-Za-z]\d')
+GS1_SEPARATOR = '\x1d'
+# Element strings starting with these two digits have a predefined total length (AI + data)
+GS1_PREDEFINED_LENGTH = {
+    '00': 20, '01': 16, '02': 16, '03': 16, '04': 18, '11': 8, '12': 8, '13': 8, '14': 8,
+    '15': 8, '16': 8, '17': 8, '18': 8, '19': 8, '20': 4, '31': 10, '32': 10, '33': 10,
+    '34': 10, '35': 10, '36': 10, '41': 16,
+}
+# Primary keys a Digital Link path can start with (GTIN, SSCC, GLN, GRAI, GIAI, ...)
+GS1_DIGITAL_LINK_KEYS = {'01', '00', '253', '255', '401', '402', '414', '417', '8003', '8004', '8006',
+                         '8010', '8013', '8017', '8018'}
+# Date AIs in order of preference: expiration, then best before
+GS1_EXPIRY_AIS = ('17', '15')
+
+
+def gs1_ai_length(data: str) -> int:
+    """Digits in the application identifier at the start of `data`"""
+    head = data[:2]
+    if head[:1] in ('0', '1', '9') or head in ('20', '21', '22', '30', '37'):
+        return 2
+    if head in ('31', '32', '33', '34', '35', '36', '39') or head[:1] == '8' or head == '70':
+        return 4
+    return 3
+
+
+def parse_gs1_element_string(data: str) -> Dict[str, str]:
+    """Split a raw GS1 element string ("0109506000134352172703151…") into {AI: value}"""
+    fields: Dict[str, str] = {}
+    i = 0
+    while i < len(data):
+        if data[i] == GS1_SEPARATOR:
+            i += 1
+            continue
+        if not data[i:i + 2].isdigit():
+            break
+        fixed = GS1_PREDEFINED_LENGTH.get(data[i:i + 2])
+        ai_len = gs1_ai_length(data[i:])
+        ai = data[i:i + ai_len]
+        if fixed is not None:
+            end = i + fixed
+        else:
+            end = data.find(GS1_SEPARATOR, i)
+            end = len(data) if end < 0 else end
+        fields[ai] = data[i + ai_len:end]
+        i = end
+    return fields
+
+
+def parse_gs1(payload: str) -> Dict[str, str]:
+    """
+    GS1 application identifiers from a decoded barcode, in any of the common encodings:
+    a Digital Link URL (…/01/<gtin>/17/<yymmdd>), the bracketed human-readable form
+    ((01)…(17)…) or a raw element string with GS separators.
+    """
+    payload = GS1_SYMBOLOGY_PREFIX.sub('', payload.strip())
+    if '://' in payload:
+        from urllib.parse import urlsplit, parse_qsl
+        url = urlsplit(payload)
+        parts = [p for p in url.path.split('/') if p]
+        # The path may have a custom prefix; AI/value pairs start at the primary key
+        start = next((i for i, p in enumerate(parts) if p in GS1_DIGITAL_LINK_KEYS), len(parts))
+        fields = dict(zip(parts[start::2], parts[start + 1::2]))
+        fields.update({k: v for k, v in parse_qsl(url.query) if k.isdigit()})
+        return fields
+    if payload.startswith('('):
+        return {ai: value for ai, value in re.findall(r'\((\d{2,4})\)([^(]*)', payload)}
+    if payload[:2].isdigit():
+        return parse_gs1_element_string(payload)
+    return {}
+
+
+def gs1_date(value: str, today: Optional[datetime] = None) -> Optional[str]:
+    """
+    YYMMDD -> YYYY-MM-DD. The century follows the GS1 sliding window (up to 49 years
+    back, 50 ahead); DD=00 means the last day of the month.
+    """
+    if not re.fullmatch(r'\d{6}', value or ''):
+        return None
+    yy, month, day = int(value[:2]), int(value[2:4]), int(value[4:6])
+    current = (today or datetime.now()).year
+    year = current - current % 100 + yy
+    if yy - current % 100 >= 51:
+        year -= 100
+    elif yy - current % 100 <= -50:
+        year += 100
+    if not 1 <= month <= 12:
+        return None
+    if day == 0:
+        day = calendar.monthrange(year, month)[1]
+    try:
+        return datetime(year, month, day).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+_barcode_local = threading.local()
+
+
+def read_barcodes(gray: np.ndarray) -> List[Tuple[str, str]]:
+    """(symbology, payload) for every QR code and 1D barcode OpenCV can decode (runs in a worker)"""
+    if not hasattr(_barcode_local, 'qr'):
+        _barcode_local.qr = cv2.QRCodeDetector()
+        _barcode_local.barcode = cv2.barcode.BarcodeDetector() if hasattr(cv2, 'barcode') else None
+    
+    found = []
+    try:
+        ok, payloads, _, _ = _barcode_local.qr.detectAndDecodeMulti(gray)
+        if ok:
+            found.extend(('QR_CODE', p) for p in payloads if p)
+    except cv2.error:
+        pass
+    if _barcode_local.barcode is not None:
+        try:
+            ok, payloads, types, _ = _barcode_local.barcode.detectAndDecodeWithType(gray)
+            if ok:
+                found.extend((t, p) for t, p in zip(types, payloads) if p)
+        except cv2.error:
+            pass
+    return found
+
+
+def expiry_from_barcodes(codes: List[Tuple[str, str]], today: Optional[datetime] = None) -> Optional[dict]:
+    """First GS1 expiry (AI 17, else best-before AI 15) among the decoded codes"""
+    for symbology, payload in codes:
+        fields = parse_gs1(payload)
+        for ai in GS1_EXPIRY_AIS:
+            date = gs1_date(fields.get(ai), today)
+            if date:
+                return {"expiry_date": date, "ai": ai, "symbology": symbology, "payload": payload}
+    return None
+
+
+def barcode_response(found: dict, time_saved: Optional[float]) -> dict:
+    response = {
+        "success": True,
+        "expiry_date": found["expiry_date"],
+        "confidence": 1.0,
+        "source": "barcode",
+        "barcode": {"symbology": found["symbology"], "ai": found["ai"]},
+        "raw_text": found["payload"][:500],
+        "ocr_passes": 0
+    }
+    if time_saved is not None:
+        response["time_saved_ms"] = round(time_saved * 1000)
+    return response
+
+
+OCR_BARCODE_SCANS = metrics.counter(
+    "expireguard_ocr_barcode_scans_total", "Scans by barcode fast-path result (hit, miss)", ("result",))
+
+
+class BarcodeStats:
+    """Fast-path hit rate and the OCR time it saved (estimated from recent OCR-path scans)"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.ocr_seconds_ewma: Optional[float] = None
+
+    def record_ocr(self, seconds: float):
+        self.ocr_seconds_ewma = seconds if self.ocr_seconds_ewma is None \
+            else 0.2 * seconds + 0.8 * self.ocr_seconds_ewma
+
+    def record_hit(self) -> Optional[float]:
+        self.hits += 1
+        OCR_BARCODE_SCANS.labels("hit").inc()
+        if self.ocr_seconds_ewma is not None:
+            self.seconds_saved += self.ocr_seconds_ewma
+        return self.ocr_seconds_ewma
+
+    def record_miss(self):
+        self.misses += 1
+        OCR_BARCODE_SCANS.labels("miss").inc()
+
+    def snapshot(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": OCR_BARCODE,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "seconds_saved": round(self.seconds_saved, 2),
+        }
+
+
+barcode_stats = BarcodeStats()
+metrics.callback("expireguard_ocr_barcode_seconds_saved_total", "Estimated OCR time skipped by barcode hits",
+                 "counter", lambda: round(barcode_stats.seconds_saved, 3))
+
+
+# ==========================================
+# OCR BACKENDS
+# ==========================================
+
+# "auto" uses the in-process tesserocr engine when installed, else pytesseract
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto").lower()
+
+# Character whitelist for date-focused extraction
+OCR_CHAR_WHITELIST = '0123456789/-. JANFEBMARAPRMAYJUNJULAUGSEPOCTNOVDECBSTBYUELVID'
+
+
+def parse_tesseract_config(config: str) -> Tuple[int, int]:
+    """Read (oem, psm) out of a '--oem N --psm N' config string"""
+    oem = re.search(r'--oem\s+(\d+)', config)
+    psm = re.search(r'--psm\s+(\d+)', config)
+    return (int(oem.group(1)) if oem else 3, int(psm.group(1)) if psm else 3)
+
+
+class PytesseractBackend:
+    """Runs the tesseract binary per call (temp image + subprocess + model load)"""
+    name = "pytesseract"
+
+    def recognize(self, image: np.ndarray, config: str) -> str:
+        pil_img = Image.fromarray(image)
+        # Escape the space so it survives pytesseract's shell-style argument split
+        whitelist = OCR_CHAR_WHITELIST.replace(' ', '\\ ')
+        custom_config = config + f' -c tessedit_char_whitelist={whitelist}'
+        return pytesseract.image_to_string(pil_img, config=custom_config)
+
+
+class TesserocrBackend:
+    """
+    Long-lived libtesseract engine: the LSTM model is loaded once per worker
+    and images are handed over as raw grayscale buffers (no PNG, no fork).
+    """
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._apis: Dict[int, object] = {}
+
+    def _api(self, oem: int):
+        api = self._apis.get(oem)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(lang='eng', oem=oem)
+            api.SetVariable('tessedit_char_whitelist', OCR_CHAR_WHITELIST)
+            self._apis[oem] = api
+        return api
+
+    def recognize(self, image: np.ndarray, config: str) -> str:
+        oem, psm = parse_tesseract_config(config)
+        api = self._api(oem)
+        api.SetPageSegMode(psm)
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        h, w = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), w, h, channels, w * channels)
+        return api.GetUTF8Text()
+
+
+def create_ocr_backend(name: str = OCR_BACKEND):
+    """Build the configured backend, falling back to pytesseract when tesserocr is unavailable"""
+    if name in ("auto", "tesserocr"):
+        try:
+            return TesserocrBackend()
+        except Exception as e:
+            if name == "tesserocr":
+                print(f"tesserocr backend unavailable ({e}), falling back to pytesseract")
+    return PytesseractBackend()
+
+
+# One engine per worker thread/process (a tesseract API object is not thread-safe)
+_ocr_backend_local = threading.local()
+
+
+def get_ocr_backend():
+    backend = getattr(_ocr_backend_local, "backend", None)
+    if backend is None:
+        backend = create_ocr_backend()
+        _ocr_backend_local.backend = backend
+    return backend
+
+
+def init_ocr_worker():
+    """Executor initializer: load the OCR engine before the first scan arrives"""
+    backend = get_ocr_backend()
+    print(f"OCR worker {os.getpid()} ready ({backend.name})")
+
+
+def run_ocr(image: np.ndarray, config: str) -> str:
+    """Run Tesseract OCR with given config"""
+    try:
+        return get_ocr_backend().recognize(image, config)
+    except Exception as e:
+        print(f"OCR error: {e}")
+        return ""
+
+
+# ==========================================
+# OCR EXECUTOR
+# ==========================================
+
+# Executor kind: "process" (default), "thread" or "inline" (run on the event loop)
+OCR_EXECUTOR_KIND = os.getenv("OCR_EXECUTOR", "process").lower()
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or (os.cpu_count() or 1)
+# Max scans admitted at once (running + waiting for a worker)
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", "0")) or OCR_WORKERS * 2
+OCR_TIMEOUT_SECONDS = float(os.getenv("OCR_TIMEOUT_SECONDS", "25"))
+# Scans running at once; the rest wait in line (up to OCR_MAX_PENDING in total)
+OCR_MAX_CONCURRENT_SCANS = int(os.getenv("OCR_MAX_CONCURRENT_SCANS", "0")) or OCR_WORKERS
+# Interactive scans whose expected wait + scan time exceeds this are shed up front (client timeout)
+OCR_CLIENT_DEADLINE_SECONDS = float(os.getenv("OCR_CLIENT_DEADLINE_SECONDS", "30"))
+# Per-user (JWT sub, else client IP) scan rate; 0 disables
+OCR_RATE_PER_MINUTE = float(os.getenv("OCR_RATE_PER_MINUTE", "20"))
+OCR_RATE_BURST = int(os.getenv("OCR_RATE_BURST", "10"))
+# Max images per /ocr/extract-dates request
+OCR_BATCH_MAX_FILES = int(os.getenv("OCR_BATCH_MAX_FILES", "50"))
+
+OCR_CONFIGS = [
+    '--oem 3 --psm 6',   # Single block of text
+    '--oem 3 --psm 11',  # Sparse text
+    '--oem 3 --psm 3',   # Fully automatic
+    '--oem 3 --psm 4',   # Single column of text
+]
+
+# "grid" runs every (variant, config) pair; "cascade" stops early once a result is good enough
+OCR_MODE = os.getenv("OCR_MODE", "grid").lower()
+# Cascade stops when a keyword-backed candidate reaches this confidence...
+OCR_CASCADE_CONFIDENCE = float(os.getenv("OCR_CASCADE_CONFIDENCE", "0.9"))
+# ...or when this many passes agree on the same date
+OCR_CASCADE_CONSENSUS = int(os.getenv("OCR_CASCADE_CONSENSUS", "3"))
+
+
+OCR_ADMISSION_WAIT_SECONDS = metrics.histogram(
+    "expireguard_ocr_admission_wait_seconds", "Time scans waited for a slot before running")
+OCR_ADMISSION_REJECTED = metrics.counter(
+    "expireguard_ocr_admission_rejected_total", "Scans shed at admission", ("reason",))
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets (rate per second, burst capacity); idle keys age out of a TTLCache"""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self._buckets = TTLCache(max_keys, ttl=burst / self.rate if self.rate > 0 else 60)
+
+    def acquire(self, key: str, cost: float = 1) -> Optional[float]:
+        """
+        Take `cost` tokens; returns None if allowed, else seconds until enough tokens exist.
+        A cost above the burst needs a full bucket and leaves it in debt, so it is still charged in full.
+        """
+        if self.rate <= 0:
+            return None
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        needed = min(cost, self.burst)
+        if tokens < needed:
+            self._buckets.set(key, (tokens, now), ttl=(self.burst - tokens) / self.rate)
+            return (needed - tokens) / self.rate
+        tokens -= cost
+        # Kept until refilled: dropping an indebted bucket early would forgive the debt
+        self._buckets.set(key, (tokens, now), ttl=(self.burst - tokens) / self.rate)
+        return None
+
+    def refund(self, key: str, cost: float = 1):
+        """Give back tokens taken for a request that was then turned away"""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate + cost)
+        self._buckets.set(key, (tokens, now), ttl=(self.burst - tokens) / self.rate)
+
+
+class OCRExecutor:
+    """
+    Runs CPU-bound OCR work off the event loop.
+    At most `max_concurrent` scans run at once and the rest wait in line. Interactive
+    scans are shed with 503 when the line is full, or when the expected wait (from an
+    EWMA of scan times) would run past the client's deadline anyway.
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int, timeout: float,
+                 max_concurrent: int, deadline: float):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.deadline = deadline
+        self.running = 0
+        self.waiting = 0
+        self.scan_seconds_ewma: Optional[float] = None
+        self._pool = None
+        self._slot_freed: Optional[asyncio.Condition] = None
+
+    def start(self):
+        if self._pool is not None or self.kind == "inline":
+            return
+        if self.kind == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr",
+                                            initializer=init_ocr_worker)
+        else:
+            # spawn: forking a process that already runs an event loop and Mongo threads is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=init_ocr_worker)
+        print(f"OCR executor: {self.kind} x{self.workers} (max pending {self.max_pending})")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self) -> int:
+        return self.running + self.waiting
+
+    def expected_wait(self) -> float:
+        """Seconds a scan arriving now would wait: the line ahead drains max_concurrent at a time"""
+        if self.running < self.max_concurrent or self.scan_seconds_ewma is None:
+            return 0.0
+        return (self.waiting + 1) / self.max_concurrent * self.scan_seconds_ewma
+
+    def _shed(self, reason: str, retry_after: float):
+        OCR_ADMISSION_REJECTED.labels(reason).inc()
+        raise HTTPException(status_code=503, detail="OCR server busy, try again shortly",
+                            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+    @asynccontextmanager
+    async def admit(self, wait: bool = False, timed: bool = True, queue: bool = True):
+        """
+        Reserve a scan slot. Interactive scans fail fast with 503 when they would not finish
+        in time; batch scans (wait=True) queue for the next free slot instead.
+        timed=False keeps the hold out of the scan-time EWMA behind deadline shedding
+        (live frames take a fraction of a full scan).
+        queue=False never waits: with every slot running it sheds at once, without taking
+        one of the pending places uploads queue in.
+        """
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        queued = time.perf_counter()
+        if self.running >= self.max_concurrent:
+            expected = self.expected_wait()
+            if not queue:
+                self._shed("busy", expected)
+            if not wait:
+                if self.pending >= self.max_pending:
+                    self._shed("queue_full", expected or self.timeout / 5)
+                if expected + (self.scan_seconds_ewma or 0.0) > self.deadline:
+                    self._shed("deadline", expected)
+            self.waiting += 1
+            try:
+                async with self._slot_freed:
+                    slot = self._slot_freed.wait_for(lambda: self.running < self.max_concurrent)
+                    if wait:
+                        await slot
+                    else:
+                        # Stop waiting once the scan could no longer finish before the client gives up
+                        budget = max(0.0, self.deadline - (self.scan_seconds_ewma or 0.0))
+                        await asyncio.wait_for(slot, timeout=budget)
+                    self.running += 1
+            except asyncio.TimeoutError:
+                self._shed("deadline", self.expected_wait())
+            finally:
+                self.waiting -= 1
+        else:
+            self.running += 1
+        
+        started = time.perf_counter()
+        OCR_ADMISSION_WAIT_SECONDS.observe(started - queued)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if timed:
+                self.scan_seconds_ewma = elapsed if self.scan_seconds_ewma is None \
+                    else 0.2 * elapsed + 0.8 * self.scan_seconds_ewma
+            self.running -= 1
+            async with self._slot_freed:
+                # Waiters that were cancelled can swallow a single notify
+                self._slot_freed.notify_all()
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool and await its result"""
+        if self.kind == "inline":
+            return fn(*args)
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, fn, *args)
+
+
+ocr_executor = OCRExecutor(OCR_EXECUTOR_KIND, OCR_WORKERS, OCR_MAX_PENDING, OCR_TIMEOUT_SECONDS,
+                           OCR_MAX_CONCURRENT_SCANS, OCR_CLIENT_DEADLINE_SECONDS)
+ocr_rate_limiter = TokenBucketLimiter(OCR_RATE_PER_MINUTE, OCR_RATE_BURST)
+
+
+def enforce_ocr_rate_limit(client_key: str, cost: float = 1):
+    """Charge a scan to `client_key` (see ocr_routes.ocr_client_key); 429 with Retry-After when out of tokens"""
+    retry_after = ocr_rate_limiter.acquire(client_key, cost)
+    if retry_after is not None:
+        OCR_ADMISSION_REJECTED.labels("rate_limited").inc()
+        OCR_SCANS.labels("rate_limited").inc()
+        raise HTTPException(status_code=429, detail="Too many scans, slow down",
+                            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))})
+
+
+# Stage timings. Executor stages are timed inside the worker, so queueing is excluded.
+OCR_STAGE_SECONDS = metrics.histogram(
+    "expireguard_ocr_stage_seconds", "Time per OCR pipeline stage", ("stage",))
+OCR_PREPROCESS_SECONDS = metrics.histogram(
+    "expireguard_ocr_preprocess_seconds", "Time per preprocessing step", ("step",))
+OCR_PASS_SECONDS = metrics.histogram(
+    "expireguard_ocr_pass_seconds", "Time per Tesseract pass", ("variant", "psm"))
+OCR_SCANS = metrics.counter(
+    "expireguard_ocr_scans_total", "Scans by outcome (found, empty, cached, rejected, rate_limited, too_large, timeout, error)",
+    ("outcome",))
+OCR_PAIR_WINS = metrics.counter(
+    "expireguard_ocr_pair_wins_total", "Scans won by each (variant, psm) pass", ("variant", "psm"))
+OCR_CANDIDATES = metrics.histogram(
+    "expireguard_ocr_candidates_per_scan", "Date candidates found across all passes of a scan",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+
+
+class ScanTiming:
+    """Stage durations of one scan, for the opt-in Server-Timing header"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}  # name -> [seconds, runs]
+
+    def add(self, name: str, seconds: float):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def header(self) -> str:
+        parts = [f'{name};dur={seconds * 1000:.1f}' + (f';desc="{runs} runs"' if runs > 1 else '')
+                 for name, (seconds, runs) in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# Set by endpoints that asked for Server-Timing; tasks spawned by the scan inherit it
+scan_timing: contextvars.ContextVar[Optional[ScanTiming]] = contextvars.ContextVar("scan_timing", default=None)
+
+
+def observe_stage(histogram: Histogram, labels: Tuple, timing_name: str, seconds: float):
+    histogram.labels(*labels).observe(seconds)
+    timing = scan_timing.get()
+    if timing is not None:
+        timing.add(timing_name, seconds)
+
+
+def timed_call(fn, *args):
+    """Runs in the worker: return fn's result with its own run time"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+async def run_stage(histogram: Histogram, labels: Tuple, timing_name: str, fn, *args):
+    """Run fn(*args) on the OCR executor and record how long it took in the worker"""
+    result, seconds = await ocr_executor.run(timed_call, fn, *args)
+    observe_stage(histogram, labels, timing_name, seconds)
+    return result
+
+
+async def run_preprocess_stage(fn, *inputs) -> np.ndarray:
+    step = fn.__name__[len("stage_"):]
+    return await run_stage(OCR_PREPROCESS_SECONDS, (step,), f"pre-{step}", fn, *inputs)
+
+
+OCRPair = Tuple[str, str]  # (variant name, tesseract config)
+
+
+class OCRPairStats:
+    """
+    Runtime win-rate statistics per (variant, config) pair.
+    Used to run the historically best pairs first in cascade mode.
+    """
+
+    def __init__(self, pairs: List[OCRPair]):
+        self.pairs = list(pairs)
+        self.runs: Dict[OCRPair, int] = {p: 0 for p in self.pairs}
+        self.wins: Dict[OCRPair, int] = {p: 0 for p in self.pairs}
+
+    def win_rate(self, pair: OCRPair) -> float:
+        # Laplace smoothing: untried pairs start at 0.5 so they still get explored
+        return (self.wins[pair] + 1) / (self.runs[pair] + 2)
+
+    def ordered(self) -> List[OCRPair]:
+        """Pairs sorted by win rate, ties keep the default grid order"""
+        return sorted(self.pairs, key=lambda p: -self.win_rate(p))
+
+    def record(self, ran: List[OCRPair], winner: Optional[OCRPair]):
+        # Passes outside the grid (e.g. text-line crops) are not ranked
+        for pair in ran:
+            if pair in self.runs:
+                self.runs[pair] += 1
+        if winner in self.wins:
+            self.wins[winner] += 1
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {"variant": v, "config": c, "runs": self.runs[(v, c)], "wins": self.wins[(v, c)],
+             "win_rate": round(self.win_rate((v, c)), 3)}
+            for v, c in self.ordered()
+        ]
+
+
+ocr_pair_stats = OCRPairStats([(v, c) for v in VARIANT_NAMES for c in OCR_CONFIGS])
+
+
+def select_best_candidate(candidates: List[DateCandidate]) -> Optional[DateCandidate]:
+    """Pick the most confident candidate, preferring ones backed by an expiry keyword"""
+    if not candidates:
+        return None
+    
+    # Sort by confidence (highest first)
+    ranked = sorted(candidates, key=lambda c: c.confidence, reverse=True)
+    
+    # Prefer candidates with expiry keywords
+    keyword_candidates = [c for c in ranked if c.has_expiry_keyword]
+    return keyword_candidates[0] if keyword_candidates else ranked[0]
+
+
+def cascade_should_stop(passes: List[Tuple[OCRPair, str, List[DateCandidate]]],
+                        min_confidence: float, consensus: int) -> bool:
+    """True once a keyword-backed candidate is confident enough or enough passes agree"""
+    votes: Dict[str, int] = {}
+    for _, _, candidates in passes:
+        for c in candidates:
+            if c.has_expiry_keyword and c.confidence >= min_confidence:
+                return True
+        for date in {c.normalized for c in candidates}:
+            votes[date] = votes.get(date, 0) + 1
+            if votes[date] >= consensus:
+                return True
+    return False
+
+
+# ==========================================
+# OCR RESULT CACHE
+# ==========================================
+
+# Two tiers: per-process LRU + a SQLite file shared by every worker on the host ("" disables it)
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(tempfile.gettempdir(), "expireguard-ocr-cache.sqlite3"))
+OCR_CACHE_MEMORY_ENTRIES = int(os.getenv("OCR_CACHE_MEMORY_ENTRIES", "256"))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "20000"))
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Max Hamming distance between perceptual hashes to count as the same photo (0 disables).
+# Off by default: a 9x8 hash can't tell two packs of one product with different dates apart.
+OCR_CACHE_PHASH_DISTANCE = int(os.getenv("OCR_CACHE_PHASH_DISTANCE", "0"))
+
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    """64-bit difference hash: robust to re-encoding, small resizes and exposure changes"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+def _to_sqlite_int(value: int) -> int:
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def ocr_cache_scope() -> str:
+    """Fingerprint of the settings that change what a scan returns, so results from other settings aren't reused"""
+    settings = [OCR_DECODE_MAX_SIDE, OCR_BARCODE, OCR_BACKEND, OCR_ROI, OCR_ROI_MAX_REGIONS, OCR_ROI_CONFIG,
+                OCR_CONFIGS, OCR_CASCADE_CONFIDENCE, OCR_CASCADE_CONSENSUS, MIN_OCR_SIDE]
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()[:12]
+
+
+def cache_owner(client_key: Optional[str]) -> Optional[str]:
+    """Near-duplicate hits are only shared within one signed-in user's scans"""
+    return client_key if client_key and client_key.startswith("user:") else None
+
+
+class OCRResultCache:
+    """
+    Content-addressed cache of successful OCR responses.
+    Exact hits are keyed by SHA-256 of the upload plus mode and pipeline settings;
+    near-duplicates (re-encoded or re-sent photos by the same user) match on a perceptual
+    hash, looked up through four 16-bit bands so only rows sharing a band are compared.
+    Failed reads are never stored: a retake after "No date found" must run OCR again.
+    """
+
+    def __init__(self, path: str, memory_entries: int, max_entries: int, ttl: float, phash_distance: int,
+                 scope: str):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.phash_distance = phash_distance
+        self.scope = scope
+        self.memory = TTLCache(memory_entries, ttl)
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def key(self, contents, mode: str) -> str:
+        return f"{mode}:{self.scope}:{hashlib.sha256(contents).hexdigest()}"
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            # WAL lets every worker process read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(ocr_cache)")]
+            if columns and "owner" not in columns:
+                conn.execute("DROP TABLE ocr_cache")  # written by an older version; it's only a cache
+            conn.execute("""CREATE TABLE IF NOT EXISTS ocr_cache (
+                key TEXT PRIMARY KEY, mode TEXT, owner TEXT, phash INTEGER,
+                band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                result TEXT, created REAL, accessed REAL)""")
+            for band in range(4):
+                conn.execute(f"CREATE INDEX IF NOT EXISTS ocr_cache_band{band} ON ocr_cache (band{band})")
+            conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_accessed ON ocr_cache (accessed)")
+            self._conn = conn
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT result FROM ocr_cache WHERE key = ? AND created > ?",
+                             (key, time.time() - self.ttl)).fetchone()
+            if row is not None:
+                db.execute("UPDATE ocr_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+        return json.loads(row[0]) if row else None
+
+    def _disk_get_near(self, mode: str, owner: str, phash: int) -> Optional[dict]:
+        bands = [(phash >> (16 * i)) & 0xFFFF for i in range(4)]
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT phash, result FROM ocr_cache WHERE mode = ? AND owner = ? AND created > ? AND "
+                "(band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?)",
+                (f"{mode}:{self.scope}", owner, time.time() - self.ttl, *bands)).fetchall()
+        best = None
+        for stored, result in rows:
+            distance = bin((stored & 0xFFFFFFFFFFFFFFFF) ^ phash).count("1")
+            if distance <= self.phash_distance and (best is None or distance < best[0]):
+                best = (distance, result)
+        return json.loads(best[1]) if best else None
+
+    def _disk_put(self, key: str, mode: str, owner: Optional[str], phash: Optional[int], result: dict):
+        bands = [(phash >> (16 * i)) & 0xFFFF for i in range(4)] if phash is not None else [None] * 4
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO ocr_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, f"{mode}:{self.scope}", owner, None if phash is None else _to_sqlite_int(phash), *bands,
+                        json.dumps(result), now, now))
+            # TTL first, then least recently used beyond the size cap
+            evicted = db.execute("DELETE FROM ocr_cache WHERE created <= ?", (now - self.ttl,)).rowcount
+            evicted += db.execute(
+                "DELETE FROM ocr_cache WHERE key IN (SELECT key FROM ocr_cache ORDER BY accessed DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+            db.commit()
+        self.counters["evictions"] += evicted
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Exact lookup: memory, then the shared disk tier"""
+        result = self.memory.get(key)
+        if result is not None:
+            self.counters["memory_hits"] += 1
+            return result
+        if self.path:
+            result = await asyncio.to_thread(self._disk_get, key)
+            if result is not None:
+                self.counters["disk_hits"] += 1
+                self.memory.set(key, result)
+                return result
+        return None
+
+    async def get_near(self, mode: str, owner: Optional[str], phash: int) -> Optional[dict]:
+        """Near-duplicate lookup by perceptual hash among `owner`'s scans; counts a miss when nothing matches"""
+        # Near-uniform frames (lens cap, blank wall) all hash alike; only match textured ones
+        informative = 8 <= bin(phash).count("1") <= 56
+        if self.path and self.phash_distance > 0 and owner is not None and informative:
+            result = await asyncio.to_thread(self._disk_get_near, mode, owner, phash)
+            if result is not None:
+                # Not promoted to the exact tier: the same bytes from another user must not hit it
+                self.counters["near_hits"] += 1
+                return result
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, mode: str, owner: Optional[str], phash: Optional[int], result: dict):
+        if not result.get("success"):
+            return
+        self.memory.set(key, result)
+        self.counters["stores"] += 1
+        if self.path:
+            try:
+                await asyncio.to_thread(self._disk_put, key, mode, owner, phash, result)
+            except sqlite3.Error as e:
+                print(f"OCR cache write failed: {e}")
+
+    def snapshot(self) -> dict:
+        return {**self.counters, "memory_entries": len(self.memory), "path": self.path or None}
+
+
+ocr_cache = OCRResultCache(OCR_CACHE_PATH, OCR_CACHE_MEMORY_ENTRIES, OCR_CACHE_MAX_ENTRIES,
+                           OCR_CACHE_TTL_SECONDS, OCR_CACHE_PHASH_DISTANCE, ocr_cache_scope())
+
+
+async def run_ocr_pass(pair: OCRPair, image) -> str:
+    """OCR one image (or an awaitable that produces it, e.g. a lazy preprocessing stage)"""
+    if not isinstance(image, np.ndarray):
+        image = await image
+    psm = parse_tesseract_config(pair[1])[1]
+    return await run_stage(OCR_PASS_SECONDS, (pair[0], psm), "ocr", run_ocr, image, pair[1])
+
+
+async def run_ocr_wave(jobs: list, today: Optional[datetime] = None) -> List[Tuple[OCRPair, str, List[DateCandidate]]]:
+    """OCR a batch of (pair, image) jobs concurrently on the executor"""
+    tasks = [asyncio.ensure_future(run_ocr_pass(pair, image)) for pair, image in jobs]
+    try:
+        texts = await asyncio.gather(*tasks)
+    finally:
+        # Drop queued passes if the scan was abandoned (timeout / client gone)
+        for task in tasks:
+            task.cancel()
+    
+    passes = []
+    for (pair, _), text in zip(jobs, texts):
+        start = time.perf_counter()
+        candidates = extract_dates_from_text(text, today)
+        observe_stage(OCR_STAGE_SECONDS, ("extract_dates",), "extract", time.perf_counter() - start)
+        passes.append((pair, text, candidates))
+    return passes
+
+
+async def run_ocr_passes(gray: np.ndarray, mode: str) -> List[Tuple[OCRPair, str, List[DateCandidate]]]:
+    """
+    Run OCR passes on the executor and return (pair, text, candidates) per pass.
+    Detected text lines are tried first; full frames are only OCRed when the crops are inconclusive.
+    Grid mode then runs every pair at once; cascade mode runs the best pairs first,
+    one executor-wide wave at a time, and stops as soon as the result is good enough.
+    Preprocessing variants are built lazily, only for the pairs that actually run.
+    """
+    today = datetime.now()
+    passes = []
+    if OCR_ROI:
+        crops = await run_stage(OCR_STAGE_SECONDS, ("locate_text",), "roi", locate_text_crops, gray)
+        passes.extend(await run_ocr_wave([(("roi", OCR_ROI_CONFIG), crop) for crop in crops], today))
+        if cascade_should_stop(passes, OCR_CASCADE_CONFIDENCE, OCR_CASCADE_CONSENSUS):
+            return passes
+    
+    graph = PreprocessGraph(gray, run_preprocess_stage)
+    order = ocr_pair_stats.ordered()
+    wave_size = len(order) if mode == "grid" else max(1, ocr_executor.workers)
+    
+    try:
+        for start in range(0, len(order), wave_size):
+            wave = order[start:start + wave_size]
+            passes.extend(await run_ocr_wave([(pair, graph.get(pair[0])) for pair in wave], today))
+            
+            if mode == "cascade" and cascade_should_stop(passes, OCR_CASCADE_CONFIDENCE, OCR_CASCADE_CONSENSUS):
+                break
+    finally:
+        graph.cancel()
+    
+    return passes
+
+
+def build_ocr_response(passes: List[Tuple[OCRPair, str, List[DateCandidate]]]) -> dict:
+    """Select the best candidate across all passes and shape the API response"""
+    all_text = [text for _, text, _ in passes]
+    all_candidates = [c for _, _, candidates in passes for c in candidates]
+    
+    start = time.perf_counter()
+    best = select_best_candidate(all_candidates)
+    winner = None
+    if best is not None:
+        winner = next(pair for pair, _, candidates in passes
+                      if any(c.normalized == best.normalized for c in candidates))
+    observe_stage(OCR_STAGE_SECONDS, ("select",), "select", time.perf_counter() - start)
+    
+    ocr_pair_stats.record([pair for pair, _, _ in passes], winner)
+    OCR_CANDIDATES.observe(len(all_candidates))
+    if winner is not None:
+        OCR_PAIR_WINS.labels(winner[0], parse_tesseract_config(winner[1])[1]).inc()
+    
+    if best is None:
+        return {
+            "success": False,
+            "expiry_date": None,
+            "confidence": 0.0,
+            "raw_text": "\n".join(all_text)[:500],
+            "ocr_passes": len(passes),
+            "source": "ocr",
+            "message": "No date found in image"
+        }
+    
+    print(f"Best candidate: {best.normalized} (confidence: {best.confidence:.2f})")
+    print(f"Context: {best.line_text} [{winner[0]} {winner[1]}, {len(passes)} passes]")
+    
+    return {
+        "success": True,
+        "expiry_date": best.normalized,
+        "confidence": round(best.confidence, 2),
+        "raw_text": "\n".join(all_text)[:500],
+        "ocr_passes": len(passes),
+        "source": "ocr"
+    }
+
+
+async def scan_image(contents: bytearray, mode: str, cache_key: str, owner: Optional[str] = None) -> dict:
+    """
+    Decode and OCR one upload; `owner` (see cache_owner) scopes near-duplicate cache hits.
+    The encoded buffer is cleared as soon as it is decoded to keep per-scan memory down.
+    """
+    gray = await run_stage(OCR_STAGE_SECONDS, ("decode",), "decode", decode_image, contents)
+    ingest_stats.record(len(contents), gray)
+    contents.clear()
+    
+    phash = perceptual_hash(gray)
+    cached = await ocr_cache.get_near(mode, owner, phash)
+    if cached is not None:
+        return {**cached, "cached": True}
+    
+    # GS1 codes carry the expiry exactly and are far cheaper to read than running OCR
+    if OCR_BARCODE:
+        codes = await run_stage(OCR_STAGE_SECONDS, ("barcode",), "barcode", read_barcodes, gray)
+        found = expiry_from_barcodes(codes)
+        if found is not None:
+            result = barcode_response(found, barcode_stats.record_hit())
+            await ocr_cache.put(cache_key, mode, owner, phash, result)
+            return result
+        barcode_stats.record_miss()
+    
+    # After the barcode read (codes often survive what defeats OCR), before any OCR pass
+    if OCR_QUALITY_GATE:
+        quality = await run_stage(OCR_STAGE_SECONDS, ("quality",), "quality", assess_image_quality, gray)
+        quality_stats.record(quality)
+        if quality["reason"] is not None:
+            # Not cached: the near-duplicate lookup would hand it to the steadier retake
+            return quality_response(quality)
+    
+    start = time.perf_counter()
+    result = build_ocr_response(await run_ocr_passes(gray, mode))
+    barcode_stats.record_ocr(time.perf_counter() - start)
+    await ocr_cache.put(cache_key, mode, owner, phash, result)
+    return result
+
+
+async def reject_oversized_scans(request: Request, call_next):
+    """Reject oversized scans from Content-Length before the multipart body is parsed"""
+    limit = {
+        "/ocr/extract-date": OCR_MAX_UPLOAD_BYTES,
+        "/ocr/jobs": OCR_MAX_UPLOAD_BYTES,
+        "/ocr/extract-dates": OCR_MAX_UPLOAD_BYTES * OCR_BATCH_MAX_FILES,
+    }.get(request.url.path)
+    if limit is not None:
+        length = request.headers.get("content-length")
+        # Allow some headroom for the multipart envelope
+        if length and length.isdigit() and int(length) > limit + UPLOAD_CHUNK_SIZE:
+            ingest_stats.rejected += 1
+            return JSONResponse(status_code=413, content={"detail": "Image too large"})
+    return await call_next(request)
+
+
+def validate_ocr_mode(mode: Optional[str]) -> str:
+    mode = (mode or OCR_MODE).lower()
+    if mode not in ("grid", "cascade"):
+        raise HTTPException(status_code=400, detail="mode must be 'grid' or 'cascade'")
+    return mode
+
+
+async def extract_date_from_upload(file: UploadFile, mode: str, wait: bool = False,
+                                   client_key: Optional[str] = None, charge: bool = True) -> dict:
+    """
+    Full single-image flow: capped read, cache lookup, admission and OCR.
+    With `client_key`, near-duplicate cache hits come from that user's own scans and,
+    unless `charge` is False, the caller's scan rate limit is charged (cache hits are free).
+    """
+    try:
+        # 1. Read Image (rescans of the same photo are answered from the cache)
+        contents = await read_upload(file)
+        await file.close()
+        cache_key = ocr_cache.key(contents, mode)
+        cached = await ocr_cache.get(cache_key)
+        if cached is not None:
+            OCR_SCANS.labels("cached").inc()
+            return {**cached, "cached": True}
+        
+        if client_key is not None and charge:
+            enforce_ocr_rate_limit(client_key)
+        
+        # 2-5. Decode, preprocess, OCR and select the best candidate off the event loop
+        async with ocr_executor.admit(wait=wait):
+            start = time.perf_counter()
+            result = await asyncio.wait_for(scan_image(contents, mode, cache_key, cache_owner(client_key)),
+                                            timeout=ocr_executor.timeout)
+        if result.get("cached"):
+            OCR_SCANS.labels("cached").inc()
+        else:
+            OCR_STAGE_SECONDS.labels("scan").observe(time.perf_counter() - start)
+            outcome = "found" if result["success"] else "unreadable" if result.get("source") == "quality" else "empty"
+            OCR_SCANS.labels(outcome).inc()
+        return result
+    
+    except HTTPException as e:
+        if e.status_code == 503:
+            OCR_SCANS.labels("rejected").inc()
+        raise
+    except ImageTooLarge as e:
+        ingest_stats.rejected += 1
+        OCR_SCANS.labels("too_large").inc()
+        raise HTTPException(status_code=413, detail=str(e))
+    except asyncio.TimeoutError:
+        print(f"OCR timed out after {ocr_executor.timeout}s")
+        OCR_SCANS.labels("timeout").inc()
+        raise HTTPException(status_code=504, detail="OCR timed out")
+    except Exception as e:
+        OCR_SCANS.labels("error").inc()
+        print(f"Error processing image: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "expiry_date": None,
+            "confidence": 0.0,
+            "error": str(e)
+        }
+
+
+async def extract_date(file: UploadFile, mode: Optional[str], timing: bool, client_key: str):
+    """POST /ocr/extract-date; with `timing` the stage durations go out in a Server-Timing header"""
+    mode = validate_ocr_mode(mode)
+    if not timing:
+        return await extract_date_from_upload(file, mode, client_key=client_key)
+    
+    timer = ScanTiming()
+    token = scan_timing.set(timer)
+    try:
+        result = await extract_date_from_upload(file, mode, client_key=client_key)
+    finally:
+        scan_timing.reset(token)
+    return JSONResponse(content=result, headers={"Server-Timing": timer.header()})
+
+
+async def extract_dates_batch(files: List[UploadFile], mode: Optional[str], client_key: str):
+    """POST /ocr/extract-dates: NDJSON, one line per image in completion order"""
+    mode = validate_ocr_mode(mode)
+    if len(files) > OCR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {OCR_BATCH_MAX_FILES} images per batch")
+    # Batches queue instead of being shed, so charge them up front, every image included
+    enforce_ocr_rate_limit(client_key, cost=len(files))
+    
+    async def scan(index: int, file: UploadFile) -> dict:
+        try:
+            result = await extract_date_from_upload(file, mode, wait=True, client_key=client_key, charge=False)
+        except HTTPException as e:
+            result = {"success": False, "expiry_date": None, "confidence": 0.0,
+                      "status": e.status_code, "error": e.detail}
+        return {"index": index, "filename": file.filename, **result}
+    
+    async def stream():
+        tasks = [asyncio.ensure_future(scan(i, f)) for i, f in enumerate(files)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client disconnected: stop scheduling the rest of the batch
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# ==========================================
+# OCR JOB QUEUE
+# ==========================================
+
+# Job mode: submit returns a job id at once; a local worker pool drains the queue
+OCR_JOB_QUEUE_DEPTH = int(os.getenv("OCR_JOB_QUEUE_DEPTH", "32"))
+OCR_JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "0")) or OCR_WORKERS
+# Finished jobs stay pollable for this long
+OCR_JOB_TTL_SECONDS = float(os.getenv("OCR_JOB_TTL_SECONDS", "600"))
+
+JOB_FINAL_STATES = ("done", "failed", "cancelled")
+
+
+@dataclass
+class OCRJob:
+    id: str
+    mode: str
+    contents: Optional[bytearray]
+    created: float
+    owner: Optional[str] = None  # cache_owner of the submitter
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    finished: Optional[float] = None
+    task: Optional[asyncio.Task] = None
+    changed: Optional[asyncio.Event] = None
+
+    def snapshot(self) -> dict:
+        return {"job_id": self.id, "status": self.status, "result": self.result, "error": self.error}
+
+
+class OCRJobQueue:
+    """
+    In-process OCR job queue with a fixed number of consumers.
+    The queue depth is bounded: a full queue answers 429 with a Retry-After estimate.
+    """
+
+    def __init__(self, depth: int, workers: int, ttl: float):
+        self.depth = depth
+        self.workers = workers
+        self.ttl = ttl
+        self.jobs: Dict[str, OCRJob] = {}
+        self.avg_job_seconds = 2.0  # EWMA of job run time, used for Retry-After
+        self.rejected = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers: List[asyncio.Task] = []
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.depth)
+            self._consumers = [asyncio.ensure_future(self._consume()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._consumers:
+            task.cancel()
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        self._consumers = []
+        self._queue = None
+
+    def retry_after(self) -> int:
+        return max(1, int(self._queue.qsize() * self.avg_job_seconds / self.workers))
+
+    def submit(self, contents: bytearray, mode: str, owner: Optional[str] = None) -> OCRJob:
+        self.start()
+        self._prune()
+        job = OCRJob(id=uuid.uuid4().hex, mode=mode, contents=contents, created=time.time(), owner=owner,
+                     changed=asyncio.Event())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="OCR queue is full",
+                                headers={"Retry-After": str(self.retry_after())})
+        self.jobs[job.id] = job
+        return job
+
+    def finish(self, job: OCRJob, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        job.status, job.result, job.error = status, result, error
+        job.contents = None
+        job.finished = time.time()
+        self._notify(job)
+
+    def cancel(self, job: OCRJob):
+        if job.status in JOB_FINAL_STATES:
+            return
+        if job.task is not None:
+            job.task.cancel()
+        self.finish(job, "cancelled")
+
+    def _notify(self, job: OCRJob):
+        # Swap the event so every waiter wakes once and later waiters block again
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+            del self.jobs[job_id]
+
+    async def _consume(self):
+        queue = self._queue
+        while True:
+            job = await queue.get()
+            try:
+                if job.status != "queued":
+                    continue  # cancelled while waiting
+                job.status = "running"
+                self._notify(job)
+                started = time.monotonic()
+                job.task = asyncio.ensure_future(self._run(job))
+                try:
+                    # wait() rather than await: cancelling the job must not look like cancelling the consumer
+                    await asyncio.wait({job.task})
+                except asyncio.CancelledError:
+                    job.task.cancel()
+                    if job.status not in JOB_FINAL_STATES:
+                        self.finish(job, "cancelled")
+                    raise
+                try:
+                    self.finish(job, "done", result=job.task.result())
+                except asyncio.CancelledError:
+                    if job.status not in JOB_FINAL_STATES:
+                        self.finish(job, "cancelled")
+                except HTTPException as e:
+                    self.finish(job, "failed", error=str(e.detail))
+                except Exception as e:
+                    # e.g. the cache's SQLite file is locked; the consumer must outlive any one job
+                    print(f"OCR job {job.id} failed: {e!r}")
+                    self.finish(job, "failed", error=str(e) or type(e).__name__)
+                self.avg_job_seconds = 0.8 * self.avg_job_seconds + 0.2 * (time.monotonic() - started)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: OCRJob) -> dict:
+        cache_key = ocr_cache.key(job.contents, job.mode)
+        cached = await ocr_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        async with ocr_executor.admit(wait=True):
+            try:
+                return await asyncio.wait_for(scan_image(job.contents, job.mode, cache_key, job.owner),
+                                              timeout=ocr_executor.timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="OCR timed out")
+            except ImageTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except Exception as e:
+                print(f"Error processing OCR job {job.id}: {e}")
+                return {"success": False, "expiry_date": None, "confidence": 0.0, "error": str(e)}
+
+    def snapshot(self) -> dict:
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.status] = states.get(job.status, 0) + 1
+        return {
+            "depth": self.depth,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "rejected": self.rejected,
+            "avg_job_seconds": round(self.avg_job_seconds, 2),
+            "jobs": states,
+        }
+
+
+ocr_jobs = OCRJobQueue(OCR_JOB_QUEUE_DEPTH, OCR_JOB_WORKERS, OCR_JOB_TTL_SECONDS)
+
+
+def get_ocr_job(job_id: str) -> OCRJob:
+    job = ocr_jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def submit_ocr_job(file: UploadFile, mode: Optional[str], client_key: str):
+    """Queue an expiry-date scan and return its job id immediately"""
+    mode = validate_ocr_mode(mode)
+    enforce_ocr_rate_limit(client_key)
+    try:
+        contents = await read_upload(file)
+        await file.close()
+        job = ocr_jobs.submit(contents, mode, cache_owner(client_key))
+    except ImageTooLarge as e:
+        # Rejected uploads don't count against the quota, so retrying per Retry-After doesn't drain it
+        ocr_rate_limiter.refund(client_key)
+        ingest_stats.rejected += 1
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        ocr_rate_limiter.refund(client_key)
+        raise
+    return job.snapshot()
+
+
+async def get_ocr_job_status(job_id: str):
+    """Poll a job; `result` has the /ocr/extract-date response once status is done"""
+    return get_ocr_job(job_id).snapshot()
+
+
+async def stream_ocr_job(job_id: str):
+    """Server-sent events: one `status` event per state change, ending with the final state"""
+    job = get_ocr_job(job_id)
+    
+    async def events():
+        last = None
+        while True:
+            # Grab the event before reading the state so no change slips in between
+            changed = job.changed
+            snapshot = job.snapshot()
+            if snapshot != last:
+                yield f"event: status\ndata: {json.dumps(snapshot)}\n\n"
+                last = snapshot
+            if job.status in JOB_FINAL_STATES:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def cancel_ocr_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = get_ocr_job(job_id)
+    ocr_jobs.cancel(job)
+    return job.snapshot()
+
+
+# ==========================================
+# LIVE SCAN STREAM (WebSocket)
+# ==========================================
+
+# Live camera frames: one cheap pass per frame, votes across frames, answer once they agree
+OCR_STREAM_MAX_SESSIONS = int(os.getenv("OCR_STREAM_MAX_SESSIONS", "0")) or OCR_WORKERS * 2
+OCR_STREAM_FRAME_MAX_SIDE = int(os.getenv("OCR_STREAM_FRAME_MAX_SIDE", "960"))
+OCR_STREAM_MAX_FRAME_BYTES = int(os.getenv("OCR_STREAM_MAX_FRAME_BYTES", str(1024 * 1024)))
+OCR_STREAM_MAX_REGIONS = int(os.getenv("OCR_STREAM_MAX_REGIONS", "3"))
+OCR_STREAM_MAX_SECONDS = float(os.getenv("OCR_STREAM_MAX_SECONDS", "30"))
+# Frames that must agree on a date, and how far it must lead the runner-up (score ratio)
+OCR_STREAM_MIN_VOTES = int(os.getenv("OCR_STREAM_MIN_VOTES", "2"))
+OCR_STREAM_LEAD_RATIO = float(os.getenv("OCR_STREAM_LEAD_RATIO", "2.0"))
+
+OCR_STREAM_SESSIONS = metrics.counter(
+    "expireguard_ocr_stream_sessions_total", "Live scan sessions by outcome", ("outcome",))
+OCR_STREAM_FRAMES = metrics.counter(
+    "expireguard_ocr_stream_frames_total", "Live scan frames processed, unreadable, dropped while busy or shed by admission control", ("result",))
+OCR_STREAM_TIME_TO_RESULT = metrics.histogram(
+    "expireguard_ocr_stream_time_to_result_seconds", "Time from first frame to a converged result")
+
+
+def scan_stream_frame(contents: bytes) -> Tuple[str, Optional[dict], Optional[dict]]:
+    """
+    One cheap pass over a live camera frame (runs in a worker): the GS1 barcode reader,
+    the quality gate, then a single-line OCR pass over the few most date-like text regions.
+    Returns (text, barcode hit, quality assessment of a rejected frame).
+    """
+    gray = decode_image(contents, OCR_STREAM_FRAME_MAX_SIDE)
+    if OCR_BARCODE:
+        found = expiry_from_barcodes(read_barcodes(gray))
+        if found is not None:
+            return "", found, None
+    if OCR_QUALITY_GATE:
+        quality = assess_image_quality(gray)
+        if quality["reason"] is not None:
+            return "", None, quality
+    boxes = detect_text_regions(gray, OCR_STREAM_MAX_REGIONS)
+    if boxes:
+        text = "\n".join(run_ocr(prepare_text_crop(gray, box), OCR_ROI_CONFIG) for box in boxes)
+    else:
+        text = run_ocr(compute_stage('adaptive', gray), OCR_CONFIGS[0])
+    return text, None, None
+
+
+class FrameVotes:
+    """Date votes accumulated across frames; each frame votes once per date with its best confidence"""
+
+    def __init__(self, min_votes: int = OCR_STREAM_MIN_VOTES, lead_ratio: float = OCR_STREAM_LEAD_RATIO):
+        self.min_votes = min_votes
+        self.lead_ratio = lead_ratio
+        self.frames = 0
+        self.votes: Dict[str, int] = {}
+        self.scores: Dict[str, float] = {}
+        self.confidence: Dict[str, float] = {}  # summed candidate confidence, same 0-1 scale as uploads
+
+    def add(self, candidates: List[DateCandidate]):
+        self.frames += 1
+        best: Dict[str, float] = {}
+        confidence: Dict[str, float] = {}
+        for c in candidates:
+            # Keyword-backed readings count double, like select_best_candidate prefers them
+            weight = c.confidence * (2.0 if c.has_expiry_keyword else 1.0)
+            best[c.normalized] = max(best.get(c.normalized, 0.0), weight)
+            confidence[c.normalized] = max(confidence.get(c.normalized, 0.0), c.confidence)
+        for date, weight in best.items():
+            self.votes[date] = self.votes.get(date, 0) + 1
+            self.scores[date] = self.scores.get(date, 0.0) + weight
+            self.confidence[date] = self.confidence.get(date, 0.0) + confidence[date]
+
+    def mean_confidence(self, date: str) -> float:
+        return self.confidence[date] / self.votes[date]
+
+    def ranked(self) -> List[str]:
+        return sorted(self.scores, key=lambda d: -self.scores[d])
+
+    def converged(self) -> Optional[str]:
+        ranked = self.ranked()
+        if not ranked or self.votes[ranked[0]] < self.min_votes:
+            return None
+        runner_up = self.scores[ranked[1]] if len(ranked) > 1 else 0.0
+        return ranked[0] if self.scores[ranked[0]] >= self.lead_ratio * runner_up else None
+
+    def snapshot(self) -> List[dict]:
+        return [{"date": d, "votes": self.votes[d], "score": round(self.scores[d], 2)} for d in self.ranked()[:3]]
+
+
+class LiveScanSession:
+    """One WebSocket scan: runs at most one frame at a time and tallies the votes"""
+
+    def __init__(self):
+        self.votes = FrameVotes()
+        self.dropped = 0
+        self.started: Optional[float] = None
+
+    async def process(self, contents: bytes) -> dict:
+        if self.started is None:
+            self.started = time.perf_counter()
+        try:
+            # Frames share scan slots with uploads; when those are saturated the frame is skipped
+            async with ocr_executor.admit(timed=False, queue=False):
+                text, barcode, quality = await run_stage(OCR_STAGE_SECONDS, ("stream_frame",), "frame",
+                                                scan_stream_frame, contents)
+        except HTTPException:
+            OCR_STREAM_FRAMES.labels("shed").inc()
+            return self.progress(busy=True)
+        if quality is not None:
+            # No vote; the hint lets the user fix the shot while the stream keeps going
+            OCR_STREAM_FRAMES.labels("unreadable").inc()
+            reason = quality["reason"]
+            return {**self.progress(), "quality": {"reason": reason, "hint": QUALITY_HINTS[reason]}}
+        OCR_STREAM_FRAMES.labels("processed").inc()
+        if barcode is not None:
+            return self.result(barcode["expiry_date"], 1.0, "barcode")
+        self.votes.add(extract_dates_from_text(text))
+        date = self.votes.converged()
+        if date is not None:
+            return self.result(date, self.votes.mean_confidence(date), "ocr")
+        return self.progress()
+
+    def progress(self, busy: bool = False) -> dict:
+        return {"type": "progress", "frames": self.votes.frames, "dropped": self.dropped, "busy": busy,
+                "candidates": self.votes.snapshot()}
+
+    def result(self, date: str, confidence: float, source: str) -> dict:
+        elapsed = time.perf_counter() - self.started
+        OCR_STREAM_TIME_TO_RESULT.observe(elapsed)
+        return {
+            "type": "result", "success": True, "expiry_date": date, "confidence": round(confidence, 2),
+            "source": source, "frames": self.votes.frames, "dropped": self.dropped,
+            "elapsed_ms": round(elapsed * 1000)
+        }
+
+
+live_scan_sessions = 0
+
+
+async def stream_scan(websocket: WebSocket, client_key: str):
+    """
+    One live-scan session (WebSocket /ocr/stream): at most one frame in flight, frames
+    arriving meanwhile are dropped, and the socket closes after the result or a timeout.
+    """
+    global live_scan_sessions
+    await websocket.accept()
+    if live_scan_sessions >= OCR_STREAM_MAX_SESSIONS:
+        OCR_STREAM_SESSIONS.labels("rejected").inc()
+        await websocket.close(code=1013, reason="OCR server busy")
+        return
+    retry_after = ocr_rate_limiter.acquire(client_key)
+    if retry_after is not None:
+        OCR_STREAM_SESSIONS.labels("rate_limited").inc()
+        await websocket.close(code=1008, reason=f"Too many scans, retry in {int(retry_after + 0.999)}s")
+        return
+    
+    live_scan_sessions += 1
+    session = LiveScanSession()
+    receiving: Optional[asyncio.Future] = None
+    busy: Optional[asyncio.Future] = None
+    deadline = time.monotonic() + OCR_STREAM_MAX_SECONDS
+    outcome = "disconnected"
+    try:
+        while True:
+            if receiving is None:
+                receiving = asyncio.ensure_future(websocket.receive())
+            waiting = {receiving} if busy is None else {receiving, busy}
+            done, _ = await asyncio.wait(waiting, timeout=max(0.0, deadline - time.monotonic()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                outcome = "timeout"
+                await websocket.send_json({"type": "timeout", "frames": session.votes.frames,
+                                           "candidates": session.votes.snapshot()})
+                await websocket.close()
+                break
+            
+            if busy in done:
+                message = busy.result()
+                busy = None
+                await websocket.send_json(message)
+                if message["type"] == "result":
+                    outcome = message["source"]
+                    await websocket.close()
+                    break
+            
+            if receiving in done:
+                event = receiving.result()
+                receiving = None
+                if event["type"] == "websocket.disconnect":
+                    break
+                frame = event.get("bytes")
+                if not frame:
+                    continue
+                if len(frame) > OCR_STREAM_MAX_FRAME_BYTES:
+                    await websocket.close(code=1009, reason="Frame too large")
+                    outcome = "frame_too_large"
+                    break
+                if busy is not None:
+                    # Only the newest frames matter; never queue behind a running pass
+                    session.dropped += 1
+                    OCR_STREAM_FRAMES.labels("dropped").inc()
+                    continue
+                busy = asyncio.ensure_future(session.process(frame))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        outcome = "error"
+        print(f"Live scan failed: {e}")
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        live_scan_sessions -= 1
+        OCR_STREAM_SESSIONS.labels(outcome).inc()
+        for task in (receiving, busy):
+            if task is not None:
+                task.cancel()
+
+
+async def ocr_stats():
+    """Ingest memory figures, cache hit/miss counters and per (variant, config) win rates"""
+    return {
+        "mode": OCR_MODE,
+        "backend": OCR_BACKEND,
+        "admission": {
+            "running": ocr_executor.running,
+            "waiting": ocr_executor.waiting,
+            "max_concurrent": ocr_executor.max_concurrent,
+            "max_pending": ocr_executor.max_pending,
+            "scan_seconds_ewma": ocr_executor.scan_seconds_ewma,
+            "expected_wait_seconds": round(ocr_executor.expected_wait(), 2),
+        },
+        "ingest": ingest_stats.snapshot(),
+        "barcode": barcode_stats.snapshot(),
+        "quality": quality_stats.snapshot(),
+        "cache": ocr_cache.snapshot(),
+        "jobs": ocr_jobs.snapshot(),
+        "pairs": ocr_pair_stats.snapshot()
+    }
+
+
+# Existing counters, read at scrape time
+metrics.callback("expireguard_ocr_scans_running", "Scans holding an OCR slot", "gauge",
+                 lambda: ocr_executor.running)
+metrics.callback("expireguard_ocr_scans_waiting", "Scans waiting for an OCR slot", "gauge",
+                 lambda: ocr_executor.waiting)
+metrics.callback("expireguard_ocr_scan_seconds_ewma", "Moving average of scan time used for shedding", "gauge",
+                 lambda: ocr_executor.scan_seconds_ewma)
+metrics.callback("expireguard_ocr_cache_events_total", "OCR result cache lookups and writes", "counter",
+                 lambda: dict(ocr_cache.counters), ("event",))
+metrics.callback("expireguard_ocr_cache_memory_entries", "Entries in the in-process OCR cache", "gauge",
+                 lambda: len(ocr_cache.memory))
+metrics.callback("expireguard_ocr_ingest_rejected_total", "Uploads rejected by the ingest limits", "counter",
+                 lambda: ingest_stats.rejected)
+metrics.callback("expireguard_ocr_ingest_largest_decoded_bytes", "Largest decoded image held in memory", "gauge",
+                 lambda: ingest_stats.largest_decoded_bytes)
+metrics.callback("expireguard_ocr_quality_rejected_total", "Scans turned away by the quality gate", "counter",
+                 lambda: dict(quality_stats.rejected), ("reason",))
+metrics.callback("expireguard_ocr_pair_runs_total", "Passes run per (variant, config)", "counter",
+                 lambda: dict(ocr_pair_stats.runs), ("variant", "config"))
+metrics.callback("expireguard_ocr_jobs", "OCR jobs held in memory by state", "gauge",
+                 lambda: ocr_jobs.snapshot()["jobs"], ("state",))
+
+
+def startup():
+    """Start the executor pool and the job consumers (called once the module is loaded)"""
+    ocr_executor.start()
+    ocr_jobs.start()
+
+
+async def shutdown():
+    await ocr_jobs.stop()
+    ocr_executor.shutdown()
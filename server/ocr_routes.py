@@ -0,0 +1,192 @@
+"""
+OCR endpoints as a router that loads the OCR pipeline on first use.
+
+Importing this module costs no more than FastAPI itself: OpenCV, NumPy, Pillow and
+pytesseract come in with ocr_pipeline.py, imported off the event loop in a thread.
+OCR_PRELOAD picks when that happens:
+
+    background   right after startup, while CRUD requests are already served (main.py)
+    startup      before the app accepts requests (ocr_worker.py)
+    lazy         on the first OCR request
+"""
+from fastapi import APIRouter, FastAPI, File, Request, UploadFile, WebSocket
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
+import os
+import time
+from jose import JWTError
+from core import decode_access_token
+from metrics import metrics
+
+OCR_PRELOAD = os.getenv("OCR_PRELOAD", "background").lower()
+# Reverse proxies in front of the app that append to X-Forwarded-For (Render has one; 0 if exposed directly)
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "1"))
+
+OCR_PIPELINE_LOAD_SECONDS = metrics.histogram(
+    "expireguard_ocr_pipeline_load_seconds", "Time to import the OCR pipeline and start its executor")
+
+router = APIRouter()
+
+_pipeline = None
+_loading: Optional[asyncio.Future] = None
+
+
+async def _import_pipeline():
+    global _pipeline
+    start = time.perf_counter()
+    # Imports hold the import lock, not the loop: other requests keep being served meanwhile
+    module = await asyncio.to_thread(importlib.import_module, "ocr_pipeline")
+    module.startup()
+    _pipeline = module
+    elapsed = time.perf_counter() - start
+    OCR_PIPELINE_LOAD_SECONDS.observe(elapsed)
+    print(f"OCR pipeline loaded in {elapsed:.2f}s")
+    return module
+
+
+async def load_ocr_pipeline():
+    """The ocr_pipeline module, imported and started once; concurrent callers share the load"""
+    global _loading
+    if _pipeline is not None:
+        return _pipeline
+    if _loading is None:
+        _loading = asyncio.ensure_future(_import_pipeline())
+    try:
+        # Shielded so one cancelled request doesn't abort the load for everyone
+        return await asyncio.shield(_loading)
+    except Exception:
+        if _loading.done():
+            _loading = None  # let the next request retry
+        raise
+
+
+@asynccontextmanager
+async def ocr_lifespan(app: FastAPI):
+    """Load the pipeline per OCR_PRELOAD; stop its executor and job queue on shutdown"""
+    preload = None
+    if OCR_PRELOAD == "startup":
+        await load_ocr_pipeline()
+    elif OCR_PRELOAD == "background":
+        preload = asyncio.ensure_future(load_ocr_pipeline())
+    try:
+        yield
+    finally:
+        if preload is not None and not preload.done():
+            preload.cancel()
+        if _pipeline is not None:
+            await _pipeline.shutdown()
+
+
+def ocr_client_key(request: Request, token: Optional[str] = None) -> str:
+    """
+    Rate-limit key: the JWT subject when a valid token is sent, else the client address.
+    `token` covers clients that can't set headers (browser WebSockets pass it in the query).
+    """
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        token = auth[7:].strip()
+    if token:
+        try:
+            sub = decode_access_token(token).get("sub")
+            if sub:
+                return f"user:{sub}"
+        except JWTError:
+            pass
+    # Earlier X-Forwarded-For hops are whatever the client sent; only the one our
+    # outermost trusted proxy appended can't be spoofed
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    if TRUSTED_PROXY_COUNT > 0 and len(hops) >= TRUSTED_PROXY_COUNT:
+        host = hops[-TRUSTED_PROXY_COUNT]
+    else:
+        host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+async def reject_oversized_scans(request: Request, call_next):
+    """Reject oversized scans from Content-Length before the multipart body is parsed"""
+    if request.method == "POST" and request.url.path.startswith("/ocr/"):
+        ocr = await load_ocr_pipeline()
+        return await ocr.reject_oversized_scans(request, call_next)
+    return await call_next(request)
+
+
+def include_ocr(app: FastAPI):
+    """Serve the OCR endpoints from `app` (routes, pipeline lifespan and the upload size check)"""
+    app.include_router(router)
+    app.state.lifespans.append(ocr_lifespan)
+    app.middleware("http")(reject_oversized_scans)
+
+
+@router.post("/ocr/extract-date")
+async def extract_date(request: Request, file: UploadFile = File(...), mode: Optional[str] = None,
+                       timing: bool = False):
+    """
+    Extract expiry date from uploaded product image.
+    Returns the most confident expiry date in YYYY-MM-DD format.
+    Optional ?mode=grid|cascade overrides OCR_MODE for this scan.
+    With ?timing=1 the response carries a Server-Timing header with per-stage durations.
+    Overload answers 503 and per-user rate limiting 429, both with Retry-After.
+    """
+    ocr = await load_ocr_pipeline()
+    return await ocr.extract_date(file, mode, timing, ocr_client_key(request))
+
+
+@router.post("/ocr/extract-dates")
+async def extract_dates_batch(request: Request, files: List[UploadFile] = File(...), mode: Optional[str] = None):
+    """
+    Extract expiry dates from many images in one multipart request.
+    Results stream back as NDJSON, one line per image in completion order,
+    keyed by the upload's position in `files`.
+    """
+    ocr = await load_ocr_pipeline()
+    return await ocr.extract_dates_batch(files, mode, ocr_client_key(request))
+
+
+@router.post("/ocr/jobs", status_code=202)
+async def submit_ocr_job(request: Request, file: UploadFile = File(...), mode: Optional[str] = None):
+    """Queue an expiry-date scan and return its job id immediately"""
+    ocr = await load_ocr_pipeline()
+    return await ocr.submit_ocr_job(file, mode, ocr_client_key(request))
+
+
+@router.get("/ocr/jobs/{job_id}")
+async def get_ocr_job_status(job_id: str):
+    """Poll a job; `result` has the /ocr/extract-date response once status is done"""
+    ocr = await load_ocr_pipeline()
+    return await ocr.get_ocr_job_status(job_id)
+
+
+@router.get("/ocr/jobs/{job_id}/events")
+async def stream_ocr_job(job_id: str):
+    """Server-sent events: one `status` event per state change, ending with the final state"""
+    ocr = await load_ocr_pipeline()
+    return await ocr.stream_ocr_job(job_id)
+
+
+@router.delete("/ocr/jobs/{job_id}")
+async def cancel_ocr_job(job_id: str):
+    """Cancel a queued or running job"""
+    ocr = await load_ocr_pipeline()
+    return await ocr.cancel_ocr_job(job_id)
+
+
+@router.websocket("/ocr/stream")
+async def stream_scan(websocket: WebSocket):
+    """
+    Live scan: send low-resolution JPEG frames as binary messages (a few per second).
+    Each frame gets one cheap pass; frames arriving while a pass runs are dropped.
+    The server answers {"type": "progress", ...} per processed frame and a single
+    {"type": "result", ...} once frames agree on a date, then closes the socket.
+    Browsers can't set headers on WebSockets, so pass ?token=<jwt> to be rate limited as a user.
+    """
+    ocr = await load_ocr_pipeline()
+    await ocr.stream_scan(websocket, ocr_client_key(websocket, websocket.query_params.get("token")))
+
+
+@router.get("/ocr/stats")
+async def ocr_stats():
+    """Ingest memory figures, cache hit/miss counters and per (variant, config) win rates"""
+    ocr = await load_ocr_pipeline()
+    return await ocr.ocr_stats()
@@ -0,0 +1,22 @@
+"""
+OCR-only entry point, scaled independently of the CRUD API. It needs no MongoDB; signed-in
+scans are rate limited per user by verifying the JWT with the shared SECRET_KEY.
+
+    uvicorn ocr_worker:app --host 0.0.0.0 --port $PORT
+
+The pipeline loads before the app accepts requests (OCR_PRELOAD=startup by default here).
+"""
+import os
+
+os.environ.setdefault("OCR_PRELOAD", "startup")
+
+from core import create_app  # noqa: E402
+from ocr_routes import include_ocr  # noqa: E402
+
+app = create_app("ExpireGuard OCR worker")
+include_ocr(app)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,206 @@
+"""
+Expiry sweep: turns products entering a lead-time window into notification records.
+
+Runs inside the API process (see EXPIRY_SWEEP_INTERVAL_SECONDS in core.py) or on its own:
+
+    python sweeper.py            # sweep every EXPIRY_SWEEP_INTERVAL_SECONDS
+    python sweeper.py --once     # one pass, e.g. from cron
+
+Each pass is a range scan over the global (expiryDate, _id) index, in batches, with the
+position saved in `sweep_state` so a restarted worker resumes where it stopped. Every
+interval starts a new pass, so products added after the morning's pass are still notified
+the same day; notifications are unique on (user_id, product_id, kind), so re-running a
+pass (or two workers overlapping) never notifies twice. A lease in `sweep_state` keeps concurrent
+workers from scanning at the same time.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+import argparse
+import asyncio
+import os
+import socket
+import uuid
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+EXPIRY_SWEEP_LEAD_DAYS = [int(d) for d in os.getenv("EXPIRY_SWEEP_LEAD_DAYS", "7,3,1,0").split(",") if d.strip()]
+EXPIRY_SWEEP_BATCH_SIZE = int(os.getenv("EXPIRY_SWEEP_BATCH_SIZE", "1000"))
+EXPIRY_SWEEP_INTERVAL_SECONDS = int(os.getenv("EXPIRY_SWEEP_INTERVAL_SECONDS", "3600"))
+EXPIRY_SWEEP_LEASE_SECONDS = int(os.getenv("EXPIRY_SWEEP_LEASE_SECONDS", "300"))
+# Products that expired this many days ago still get an "expired" notification
+EXPIRY_SWEEP_EXPIRED_LOOKBACK_DAYS = int(os.getenv("EXPIRY_SWEEP_EXPIRED_LOOKBACK_DAYS", "1"))
+NOTIFICATION_TTL_DAYS = int(os.getenv("NOTIFICATION_TTL_DAYS", "30"))
+
+SWEEP_STATE_ID = "expiry_sweep"
+
+
+def notification_kind(expiry_date: str, today: datetime, lead_days: List[int]) -> Optional[str]:
+    """The tightest lead window an expiry date falls into ("expires_in_3d", "expires_today", "expired")"""
+    try:
+        days_left = (datetime.strptime(expiry_date, "%Y-%m-%d") - today).days
+    except (TypeError, ValueError):
+        return None
+    if days_left < 0:
+        return "expired"
+    for lead in sorted(lead_days):
+        if days_left <= lead:
+            return "expires_today" if lead == 0 else f"expires_in_{lead}d"
+    return None
+
+
+class ExpirySweeper:
+    """Batched, resumable expiry scan across all users. Only needs a motor database handle."""
+
+    def __init__(self, db, lead_days: List[int] = None, batch_size: int = EXPIRY_SWEEP_BATCH_SIZE,
+                 lease_seconds: int = EXPIRY_SWEEP_LEASE_SECONDS,
+                 expired_lookback_days: int = EXPIRY_SWEEP_EXPIRED_LOOKBACK_DAYS):
+        self.db = db
+        self.lead_days = sorted(lead_days if lead_days is not None else EXPIRY_SWEEP_LEAD_DAYS)
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.expired_lookback_days = expired_lookback_days
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.last_run: Optional[dict] = None
+
+    async def ensure_indexes(self):
+        # The sweep's range scan across users; also its keyset resume point
+        await self.db.products.create_index([("expiryDate", 1), ("_id", 1)])
+        await self.db.notifications.create_index([("user_id", 1), ("product_id", 1), ("kind", 1)], unique=True)
+        await self.db.notifications.create_index([("user_id", 1), ("_id", 1)])
+        await self.db.notifications.create_index("createdAt", expireAfterSeconds=NOTIFICATION_TTL_DAYS * 86400)
+
+    async def acquire_lease(self) -> bool:
+        now = datetime.utcnow()
+        try:
+            await self.db.sweep_state.find_one_and_update(
+                {"_id": SWEEP_STATE_ID,
+                 "$or": [{"leaseUntil": None}, {"leaseUntil": {"$lt": now}}, {"leaseOwner": self.owner}]},
+                {"$set": {"leaseOwner": self.owner, "leaseUntil": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            return True
+        except DuplicateKeyError:
+            # State document exists and another worker holds an unexpired lease
+            return False
+
+    async def release_lease(self):
+        await self.db.sweep_state.update_one(
+            {"_id": SWEEP_STATE_ID, "leaseOwner": self.owner}, {"$set": {"leaseUntil": None}}
+        )
+
+    async def run_once(self, today: Optional[datetime] = None) -> dict:
+        """
+        Sweep today's window, resuming a pass that was interrupted today.
+        After a completed pass the next run starts over; already-sent notifications are skipped.
+        """
+        today = (today or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+        today_str = today.strftime("%Y-%m-%d")
+        if not await self.acquire_lease():
+            return {"skipped": "lease held by another worker"}
+        try:
+            state = await self.db.sweep_state.find_one({"_id": SWEEP_STATE_ID}) or {}
+            if state.get("runDate") != today_str or state.get("complete"):
+                state = {"runDate": today_str, "after": None, "complete": False}
+                await self.db.sweep_state.update_one({"_id": SWEEP_STATE_ID}, {"$set": state})
+            return await self._sweep(today, state.get("after"))
+        finally:
+            await self.release_lease()
+
+    async def _sweep(self, today: datetime, after: Optional[list]) -> dict:
+        low = (today - timedelta(days=self.expired_lookback_days)).strftime("%Y-%m-%d")
+        high = (today + timedelta(days=max(self.lead_days, default=0))).strftime("%Y-%m-%d")
+        stats = {"runDate": today.strftime("%Y-%m-%d"), "resumed": after is not None,
+                 "batches": 0, "scanned": 0, "notified": 0}
+        started = datetime.utcnow()
+
+        while True:
+            if after:
+                expiry, product_id = after
+                query = {"$or": [
+                    {"expiryDate": {"$gt": expiry, "$lte": high}},
+                    {"expiryDate": expiry, "_id": {"$gt": product_id}}
+                ]}
+            else:
+                query = {"expiryDate": {"$gte": low, "$lte": high}}
+            docs = await self.db.products.find(
+                query, {"user_id": 1, "name": 1, "expiryDate": 1, "category": 1}
+            ).sort([("expiryDate", 1), ("_id", 1)]).limit(self.batch_size).to_list(length=self.batch_size)
+
+            now = datetime.utcnow()
+            notifications = []
+            for doc in docs:
+                kind = notification_kind(doc["expiryDate"], today, self.lead_days)
+                if kind is None:
+                    continue
+                notifications.append({
+                    "user_id": doc["user_id"], "product_id": str(doc["_id"]), "kind": kind,
+                    "name": doc.get("name"), "category": doc.get("category"),
+                    "expiryDate": doc["expiryDate"], "createdAt": now, "read": False
+                })
+            if notifications:
+                stats["notified"] += await self._insert_new(notifications)
+
+            stats["batches"] += 1
+            stats["scanned"] += len(docs)
+            complete = len(docs) < self.batch_size
+            if docs:
+                after = [docs[-1]["expiryDate"], docs[-1]["_id"]]
+            # Checkpoint (and extend the lease) after every batch
+            await self.db.sweep_state.update_one({"_id": SWEEP_STATE_ID}, {"$set": {
+                "after": after, "complete": complete,
+                "leaseUntil": datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+            }})
+            if complete:
+                break
+
+        stats["seconds"] = round((datetime.utcnow() - started).total_seconds(), 3)
+        self.last_run = stats
+        await self.db.sweep_state.update_one({"_id": SWEEP_STATE_ID}, {"$set": {"lastRun": stats}})
+        return stats
+
+    async def _insert_new(self, notifications: List[dict]) -> int:
+        """Unordered insert; duplicates of already-sent notifications fail on the unique index"""
+        try:
+            result = await self.db.notifications.insert_many(notifications, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            other = [err for err in e.details.get("writeErrors", []) if err.get("code") != 11000]
+            if other:
+                raise
+            return e.details.get("nInserted", 0)
+
+    async def run_forever(self, interval: int = EXPIRY_SWEEP_INTERVAL_SECONDS):
+        while True:
+            try:
+                stats = await self.run_once()
+                if "skipped" not in stats:
+                    print(f"Expiry sweep: {stats['scanned']} scanned, {stats['notified']} notified "
+                          f"in {stats['batches']} batches ({stats['seconds']}s)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Expiry sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+
+async def main(once: bool):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    sweeper = ExpirySweeper(client.expireguard)
+    await sweeper.ensure_indexes()
+    try:
+        if once:
+            print(await sweeper.run_once())
+        else:
+            await sweeper.run_forever()
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="ExpireGuard expiry notification sweep")
+    arg_parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    asyncio.run(main(arg_parser.parse_args().once))
@@ -0,0 +1,36 @@
+import os
+import sys
+
+# Tests import the server modules the way uvicorn does, from the server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No background work or shared files during tests
+os.environ.setdefault("EXPIRY_SWEEP_INTERVAL_SECONDS", "0")
+os.environ.setdefault("OCR_CACHE_PATH", "")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Entry points are imported by tests; OCR is loaded only where a test asks for it
+os.environ.setdefault("OCR_PRELOAD", "lazy")
+
+import itertools  # noqa: E402
+
+import pytest  # noqa: E402
+
+_usernames = itertools.count()
+
+
+@pytest.fixture
+def crud_client(monkeypatch):
+    """TestClient for crud_app against a fresh in-memory MongoDB stand-in"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from fastapi.testclient import TestClient
+    import core
+    import crud_app
+    monkeypatch.setattr(core, "AsyncIOMotorClient", mongomock_motor.AsyncMongoMockClient)
+    with TestClient(crud_app.app) as client:
+        yield client
+
+
+def register(client, password: str = "secret-password") -> dict:
+    """Register a fresh user and return Authorization headers for them"""
+    r = client.post("/auth/register", json={"username": f"user{next(_usernames)}", "password": password})
+    assert r.status_code == 200, r.text
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
@@ -0,0 +1,28 @@
+from starlette.requests import Request
+
+import ocr_routes
+
+
+def request(forwarded=None, client="10.0.0.9") -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "method": "POST", "path": "/ocr/extract-date", "headers": headers,
+                    "client": (client, 1234)})
+
+
+def test_spoofed_hops_are_ignored_behind_one_proxy(monkeypatch):
+    monkeypatch.setattr(ocr_routes, "TRUSTED_PROXY_COUNT", 1)
+    assert ocr_routes.ocr_client_key(request("203.0.113.7")) == "ip:203.0.113.7"
+    assert ocr_routes.ocr_client_key(request("1.2.3.4, 203.0.113.7")) == "ip:203.0.113.7"
+    assert ocr_routes.ocr_client_key(request()) == "ip:10.0.0.9"
+
+
+def test_proxy_count_picks_the_hop_the_outermost_proxy_appended(monkeypatch):
+    monkeypatch.setattr(ocr_routes, "TRUSTED_PROXY_COUNT", 2)
+    assert ocr_routes.ocr_client_key(request("1.2.3.4, 203.0.113.7, 10.1.1.1")) == "ip:203.0.113.7"
+    # Fewer hops than proxies: the header didn't come through our proxies
+    assert ocr_routes.ocr_client_key(request("203.0.113.7")) == "ip:10.0.0.9"
+
+
+def test_header_is_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(ocr_routes, "TRUSTED_PROXY_COUNT", 0)
+    assert ocr_routes.ocr_client_key(request("1.2.3.4")) == "ip:10.0.0.9"
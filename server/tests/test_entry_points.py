@@ -0,0 +1,93 @@
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+import core
+import ocr_routes
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+class FakePipeline:
+    """Stands in for ocr_pipeline so lifecycle tests don't start OCR workers"""
+
+    def __init__(self):
+        self.loads = 0
+        self.shutdowns = 0
+
+    async def shutdown(self):
+        self.shutdowns += 1
+
+
+class CountingSweeper:
+    instances = []
+
+    def __init__(self, db):
+        self.db = db
+        self.runs = 0
+        self.last_run = None
+        CountingSweeper.instances.append(self)
+
+    async def ensure_indexes(self):
+        pass
+
+    async def run_forever(self, interval):
+        self.runs += 1
+
+
+@pytest.fixture
+def lifecycle(monkeypatch):
+    """Counts MongoDB clients opened/closed, sweep tasks and OCR pipeline loads/shutdowns"""
+    counts = {"clients": 0, "closed": 0, "hasher_shutdowns": 0}
+
+    class CountingClient(mongomock_motor.AsyncMongoMockClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            counts["clients"] += 1
+
+        def close(self):
+            counts["closed"] += 1
+
+    pipeline = FakePipeline()
+
+    async def import_pipeline():
+        pipeline.loads += 1
+        ocr_routes._pipeline = pipeline
+        return pipeline
+
+    CountingSweeper.instances = []
+    monkeypatch.setattr(core, "AsyncIOMotorClient", CountingClient)
+    monkeypatch.setattr(core, "ExpirySweeper", CountingSweeper)
+    monkeypatch.setattr(core, "EXPIRY_SWEEP_INTERVAL_SECONDS", 3600)
+    monkeypatch.setattr(core, "EXPIRY_SWEEP_IN_PROCESS", True)
+    monkeypatch.setattr(core.password_hasher, "shutdown",
+                        lambda: counts.__setitem__("hasher_shutdowns", counts["hasher_shutdowns"] + 1))
+    monkeypatch.setattr(ocr_routes, "OCR_PRELOAD", "startup")
+    monkeypatch.setattr(ocr_routes, "_import_pipeline", import_pipeline)
+    monkeypatch.setattr(ocr_routes, "_pipeline", None)
+    monkeypatch.setattr(ocr_routes, "_loading", None)
+    return counts, pipeline
+
+
+@pytest.mark.parametrize("module, crud, ocr", [
+    ("crud_app", True, False),
+    ("main", True, True),
+    ("ocr_worker", False, True),
+])
+def test_each_entry_point_starts_and_stops_its_components_once(lifecycle, module, crud, ocr):
+    counts, pipeline = lifecycle
+    app = importlib.import_module(module).app
+    with TestClient(app) as client:
+        assert client.get("/health").status_code == 200
+        started = dict(counts)
+        sweeps = sum(s.runs for s in CountingSweeper.instances)
+        loads = pipeline.loads
+
+    expected = 1 if crud else 0
+    assert started["clients"] == expected
+    assert sweeps == expected
+    assert loads == (1 if ocr else 0)
+    assert counts["closed"] == expected
+    assert counts["hasher_shutdowns"] == expected
+    assert pipeline.shutdowns == (1 if ocr else 0)
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("cv2")
+from ocr_pipeline import DateCandidate, FrameVotes  # noqa: E402
+
+
+def candidate(date: str, confidence: float, keyword: bool = False) -> DateCandidate:
+    return DateCandidate(date, date, confidence, keyword, f"EXP {date}", "numeric")
+
+
+def test_converged_confidence_is_the_mean_candidate_confidence():
+    votes = FrameVotes(min_votes=2, lead_ratio=2.0)
+    votes.add([candidate("2026-12-31", 0.9)])
+    votes.add([candidate("2026-12-31", 0.8), candidate("2026-12-31", 0.7)])
+    assert votes.converged() == "2026-12-31"
+    assert votes.mean_confidence("2026-12-31") == pytest.approx(0.85)
+
+
+def test_keyword_weighting_does_not_leak_into_confidence():
+    votes = FrameVotes(min_votes=2, lead_ratio=2.0)
+    for _ in range(3):
+        votes.add([candidate("2026-12-31", 0.95, keyword=True), candidate("2025-01-01", 0.4)])
+    assert votes.converged() == "2026-12-31"
+    assert votes.mean_confidence("2026-12-31") == pytest.approx(0.95)
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("cv2")
+from ocr_pipeline import OCRResultCache, cache_owner  # noqa: E402
+
+FOUND = {"success": True, "expiry_date": "2026-12-31", "confidence": 0.9, "raw_text": "EXP 31/12/2026"}
+EMPTY = {"success": False, "expiry_date": None, "confidence": 0.0, "raw_text": "", "message": "No date found in image"}
+PHASH = 0x0F0F_F0F0_3C3C_C3C3
+
+
+def make_cache(tmp_path, scope="a") -> OCRResultCache:
+    return OCRResultCache(str(tmp_path / "cache.sqlite3"), 16, 100, 3600, phash_distance=3, scope=scope)
+
+
+def test_failed_reads_are_not_stored(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key(b"photo", "grid")
+
+    async def scenario():
+        await cache.put(key, "grid", "user:alice", PHASH, EMPTY)
+        return await cache.get(key), await cache.get_near("grid", "user:alice", PHASH)
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_near_matches_stay_within_one_user(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def scenario():
+        await cache.put(cache.key(b"photo", "grid"), "grid", "user:alice", PHASH, FOUND)
+        return (await cache.get_near("grid", "user:alice", PHASH ^ 0b101),
+                await cache.get_near("grid", "user:bob", PHASH),
+                await cache.get_near("grid", None, PHASH))
+
+    assert asyncio.run(scenario()) == (FOUND, None, None)
+
+
+def test_key_depends_on_pipeline_settings(tmp_path):
+    assert make_cache(tmp_path, "a").key(b"photo", "grid") != make_cache(tmp_path, "b").key(b"photo", "grid")
+    assert make_cache(tmp_path).key(b"photo", "grid") != make_cache(tmp_path).key(b"photo", "cascade")
+
+
+def test_only_signed_in_users_own_near_matches():
+    assert cache_owner("user:alice") == "user:alice"
+    assert cache_owner("ip:10.0.0.1") is None
+    assert cache_owner(None) is None
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+pytest.importorskip("cv2")
+from ocr_pipeline import OCRJobQueue  # noqa: E402
+
+
+def test_unexpected_error_fails_the_job_and_keeps_the_consumer():
+    async def scenario():
+        queue = OCRJobQueue(depth=4, workers=1, ttl=60)
+        calls = []
+
+        async def run(job):
+            calls.append(job.id)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return {"success": True}
+
+        queue._run = run
+        first = queue.submit(bytearray(b"a"), "grid")
+        await asyncio.sleep(0.05)
+        second = queue.submit(bytearray(b"b"), "grid")
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (first.status, first.error) == ("failed", "database is locked")
+    assert (second.status, second.result) == ("done", {"success": True})
+
+
+def test_cancelled_consumer_stops_instead_of_swallowing_it():
+    async def scenario():
+        queue = OCRJobQueue(depth=4, workers=1, ttl=60)
+        started = asyncio.Event()
+
+        async def run(job):
+            started.set()
+            await asyncio.sleep(60)
+
+        queue._run = run
+        job = queue.submit(bytearray(b"a"), "grid")
+        await started.wait()
+        consumer = queue._consumers[0]
+        consumer.cancel()
+        await asyncio.wait({consumer})
+        return job, consumer
+
+    job, consumer = asyncio.run(scenario())
+    assert consumer.cancelled()
+    assert job.status == "cancelled"
+
+
+def test_untimed_holds_leave_the_scan_time_estimate_alone():
+    from ocr_pipeline import OCRExecutor
+
+    async def scenario():
+        executor = OCRExecutor("inline", 1, 4, timeout=25, max_concurrent=1, deadline=30)
+        async with executor.admit():
+            await asyncio.sleep(0.05)
+        full_scan = executor.scan_seconds_ewma
+        for _ in range(5):
+            async with executor.admit(timed=False):
+                pass
+        return full_scan, executor.scan_seconds_ewma
+
+    full_scan, after_frames = asyncio.run(scenario())
+    assert after_frames == full_scan
+
+
+def test_frame_admission_is_skipped_while_every_slot_runs():
+    from fastapi import HTTPException
+    from ocr_pipeline import OCRExecutor
+
+    async def scenario():
+        executor = OCRExecutor("inline", 1, 4, timeout=25, max_concurrent=1, deadline=30)
+        async with executor.admit():
+            with pytest.raises(HTTPException) as shed:
+                async with executor.admit(timed=False, queue=False):
+                    pass
+            # Rejected at once, leaving the pending places to uploads
+            assert executor.waiting == 0 and executor.running == 1
+        async with executor.admit(timed=False, queue=False):
+            assert executor.running == 1
+        return shed.value.status_code
+
+    assert asyncio.run(scenario()) == 503
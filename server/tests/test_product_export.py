@@ -0,0 +1,26 @@
+import csv
+import io
+
+from conftest import register
+
+
+def test_csv_export_neutralises_formulas(crud_client):
+    headers = register(crud_client)
+    names = ["=cmd|' /C calc'!A0", "+1", "-2", "@SUM(A1)", "\tTab", "Milk"]
+    for name in names:
+        r = crud_client.post("/products", json={"name": name, "expiryDate": "2030-01-01", "category": "=HYPERLINK()"},
+                             headers=headers)
+        assert r.status_code == 200, r.text
+
+    r = crud_client.get("/products/export", params={"format": "csv"}, headers=headers)
+    rows = list(csv.DictReader(io.StringIO(r.text)))
+    assert sorted(row["name"] for row in rows) == sorted("'" + n if n != "Milk" else n for n in names)
+    assert {row["category"] for row in rows} == {"'=HYPERLINK()"}
+
+
+def test_ndjson_export_is_unchanged(crud_client):
+    headers = register(crud_client)
+    crud_client.post("/products", json={"name": "=1+1", "expiryDate": "2030-01-01", "category": "Dairy"},
+                     headers=headers)
+    r = crud_client.get("/products/export", params={"format": "ndjson"}, headers=headers)
+    assert '"name": "=1+1"' in r.text
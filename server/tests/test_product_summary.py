@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import core
+from conftest import register
+
+PRODUCT = {"name": "Milk", "expiryDate": "2030-01-15", "category": "Dairy"}
+
+
+def summary_total(client, headers) -> int:
+    r = client.get("/products/summary", headers=headers)
+    assert r.status_code == 200, r.text
+    return sum(r.json()["totals"].values())
+
+
+def test_summary_overlapping_a_create_is_not_double_counted(crud_client, monkeypatch):
+    """GET aggregates after a create inserted but before it bumped: the stored summary must not count it twice"""
+    headers = register(crud_client)
+    compute = core.compute_product_summary
+    finish = []
+
+    async def compute_during_create(user_id, bounds):
+        write = core.product_write(user_id)
+        await write.__aenter__()
+        now = datetime.utcnow().isoformat()
+        doc = {**PRODUCT, "user_id": user_id, "createdAt": now, "updatedAt": now, "syncVersion": None}
+        await core.db.products.insert_one(doc)
+        summary = await compute(user_id, bounds)
+
+        async def complete():
+            version = await core.stamp_product_version(user_id, core.db.products, [doc["_id"]])
+            await core.apply_summary_change(user_id, version, doc, +1)
+            await write.__aexit__(None, None, None)
+
+        finish.append(complete)
+        return summary
+
+    monkeypatch.setattr(core, "compute_product_summary", compute_during_create)
+    assert summary_total(crud_client, headers) == 1
+    monkeypatch.setattr(core, "compute_product_summary", compute)
+    crud_client.portal.call(finish[0])
+
+    assert summary_total(crud_client, headers) == 1
+
+
+def test_summary_follows_creates_and_deletes(crud_client):
+    headers = register(crud_client)
+    assert summary_total(crud_client, headers) == 0
+    ids = [crud_client.post("/products", json=PRODUCT, headers=headers).json()["id"] for _ in range(3)]
+    assert summary_total(crud_client, headers) == 3
+    crud_client.delete(f"/products/{ids[0]}", headers=headers)
+    crud_client.post("/products", json=PRODUCT, headers=headers)
+    assert summary_total(crud_client, headers) == 3
+    assert crud_client.delete("/products/000000000000000000000000", headers=headers).status_code == 404
+    assert summary_total(crud_client, headers) == 3
+    # The failed delete left nothing in flight, so the summary is stored at the current version
+    user_id = crud_client.get("/auth/me", headers=headers).json()["id"]
+    stored = crud_client.portal.call(core.db.product_summaries.find_one, {"_id": user_id})
+    assert stored["version"] == crud_client.portal.call(core.get_product_version, user_id)
+
+
+def test_write_leaked_by_a_crash_stops_blocking_the_summary(crud_client, monkeypatch):
+    headers = register(crud_client)
+    user_id = crud_client.get("/auth/me", headers=headers).json()["id"]
+    # A process that died mid-write never leaves product_write (kept referenced so it isn't finalized)
+    leaked = core.product_write(user_id)
+    crud_client.portal.call(leaked.__aenter__)
+    crud_client.post("/products", json=PRODUCT, headers=headers)
+
+    assert summary_total(crud_client, headers) == 1
+    assert crud_client.portal.call(core.db.product_summaries.find_one, {"_id": user_id}) is None
+
+    monkeypatch.setattr(core, "PRODUCT_WRITE_STALE_SECONDS", 0)
+    assert summary_total(crud_client, headers) == 1
+    stored = crud_client.portal.call(core.db.product_summaries.find_one, {"_id": user_id})
+    assert stored["version"] == crud_client.portal.call(core.get_product_version, user_id)
+    assert not crud_client.portal.call(core.db.product_versions.find_one, {"_id": user_id}).get("inflight")
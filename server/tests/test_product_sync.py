@@ -0,0 +1,91 @@
+import core
+from conftest import register
+
+PRODUCT = {"name": "Milk", "expiryDate": "2030-01-15", "category": "Dairy"}
+
+
+def sync_ids(response) -> set:
+    assert response.status_code == 200, response.text
+    return {p["id"] for p in response.json()["changes"]}
+
+
+def test_changes_read_mid_write_does_not_lose_the_product(crud_client, monkeypatch):
+    """A /products/changes call landing inside a create must not hand out a token that skips it"""
+    headers = register(crud_client)
+    crud_client.post("/products", json=PRODUCT, headers=headers)
+    first = crud_client.get("/products/changes", headers=headers).json()
+    user = crud_client.get("/auth/me", headers=headers).json()
+    seen = {}
+    bump = core.bump_product_version
+
+    async def bump_then_read(user_id):
+        version = await bump(user_id)
+        # The write is counted in the version but not finished yet
+        seen["mid"] = await core.get_product_changes(since=first["token"], current_user={"_id": user["id"]})
+        return version
+
+    monkeypatch.setattr(core, "bump_product_version", bump_then_read)
+    created = crud_client.post("/products", json=PRODUCT, headers=headers).json()
+    monkeypatch.setattr(core, "bump_product_version", bump)
+
+    mid = seen["mid"]
+    assert not mid.reset
+    after = crud_client.get("/products/changes", params={"since": mid.token}, headers=headers)
+    assert created["id"] in {p.id for p in mid.changes} | sync_ids(after)
+
+
+def test_delete_read_mid_write_does_not_lose_the_tombstone(crud_client, monkeypatch):
+    headers = register(crud_client)
+    created = crud_client.post("/products", json=PRODUCT, headers=headers).json()
+    token = crud_client.get("/products/changes", headers=headers).json()["token"]
+    user = crud_client.get("/auth/me", headers=headers).json()
+    seen = {}
+    bump = core.bump_product_version
+
+    async def bump_then_read(user_id):
+        version = await bump(user_id)
+        seen["mid"] = await core.get_product_changes(since=token, current_user={"_id": user["id"]})
+        return version
+
+    monkeypatch.setattr(core, "bump_product_version", bump_then_read)
+    assert crud_client.delete(f"/products/{created['id']}", headers=headers).status_code == 200
+    monkeypatch.setattr(core, "bump_product_version", bump)
+
+    mid = seen["mid"]
+    after = crud_client.get("/products/changes", params={"since": mid.token}, headers=headers).json()
+    assert created["id"] in set(mid.deleted) | set(after["deleted"])
+
+
+def test_bulk_import_is_delivered_by_delta_sync(crud_client):
+    headers = register(crud_client)
+    crud_client.post("/products", json=PRODUCT, headers=headers)
+    token = crud_client.get("/products/changes", headers=headers).json()["token"]
+    r = crud_client.post("/products/bulk", json=[PRODUCT, {"name": "bad"}, PRODUCT], headers=headers)
+    assert r.json()["inserted"] == 2
+    changes = crud_client.get("/products/changes", params={"since": token}, headers=headers).json()
+    assert len(changes["changes"]) == 2 and not changes["reset"]
+    # Stamped: a later delta from the new token is empty
+    again = crud_client.get("/products/changes", params={"since": changes["token"]}, headers=headers).json()
+    assert again["changes"] == []
+
+
+def test_products_from_before_delta_sync_are_not_resent(crud_client):
+    headers = register(crud_client)
+    user_id = crud_client.get("/auth/me", headers=headers).json()["id"]
+    legacy = {**PRODUCT, "user_id": user_id, "createdAt": "2024-01-01T00:00:00"}
+    crud_client.portal.call(core.db.products.insert_one, legacy)
+    crud_client.post("/products", json=PRODUCT, headers=headers)
+
+    full = crud_client.get("/products/changes", headers=headers).json()
+    assert full["reset"] and len(full["changes"]) == 2
+    delta = crud_client.get("/products/changes", params={"since": full["token"]}, headers=headers).json()
+    assert delta["changes"] == [] and not delta["reset"]
+
+
+def test_startup_backfills_sync_versions(crud_client):
+    headers = register(crud_client)
+    user_id = crud_client.get("/auth/me", headers=headers).json()["id"]
+    inserted = crud_client.portal.call(core.db.products.insert_one, {**PRODUCT, "user_id": user_id})
+    crud_client.portal.call(core.ensure_indexes)
+    stored = crud_client.portal.call(core.db.products.find_one, {"_id": inserted.inserted_id})
+    assert stored["syncVersion"] == 0
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("cv2")
+from ocr_pipeline import TokenBucketLimiter  # noqa: E402
+
+
+def test_batch_larger_than_the_burst_is_charged_in_full(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("ocr_pipeline.time.monotonic", lambda: clock[0])
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=10)
+
+    assert limiter.acquire("user:a", cost=50) is None
+    # 40 tokens in debt plus one for the next scan, at one token per second
+    assert limiter.acquire("user:a") == pytest.approx(41)
+    clock[0] += 40
+    assert limiter.acquire("user:a") == pytest.approx(1)
+    clock[0] += 1
+    assert limiter.acquire("user:a") is None
+
+
+def test_oversized_batch_needs_a_full_bucket(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("ocr_pipeline.time.monotonic", lambda: clock[0])
+    limiter = TokenBucketLimiter(rate_per_minute=60, burst=10)
+
+    assert limiter.acquire("user:a", cost=3) is None
+    assert limiter.acquire("user:a", cost=50) == pytest.approx(3)
+    assert limiter.acquire("user:b", cost=50) is None
+
+
+def test_rejected_job_submissions_refund_their_token(monkeypatch):
+    import asyncio
+    import io
+
+    from fastapi import HTTPException
+    from starlette.datastructures import UploadFile
+
+    import ocr_pipeline
+
+    limiter = TokenBucketLimiter(rate_per_minute=1, burst=2)
+    monkeypatch.setattr(ocr_pipeline, "ocr_rate_limiter", limiter)
+
+    def queue_full(*args):
+        raise HTTPException(status_code=429, detail="OCR queue is full", headers={"Retry-After": "1"})
+
+    monkeypatch.setattr(ocr_pipeline.ocr_jobs, "submit", queue_full)
+
+    async def submit():
+        upload = UploadFile(io.BytesIO(b"jpeg bytes"), filename="label.jpg")
+        with pytest.raises(HTTPException) as rejected:
+            await ocr_pipeline.submit_ocr_job(upload, "grid", "user:a")
+        return rejected.value.detail
+
+    # Well past the burst of 2: every retry is turned away by the queue, never by the rate limit
+    assert [asyncio.run(submit()) for _ in range(5)] == ["OCR queue is full"] * 5
+    assert limiter.acquire("user:a", cost=2) is None
@@ -0,0 +1,120 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from sweeper import SWEEP_STATE_ID, ExpirySweeper, notification_kind
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+TODAY = datetime(2030, 1, 10)
+
+
+def product(days_left: int, user: str = "u1") -> dict:
+    expiry = (TODAY + timedelta(days=days_left)).strftime("%Y-%m-%d")
+    return {"user_id": user, "name": f"item {days_left}", "expiryDate": expiry, "category": "Dairy"}
+
+
+async def fresh_db(*products):
+    db = mongomock_motor.AsyncMongoMockClient().expireguard
+    await ExpirySweeper(db).ensure_indexes()
+    if products:
+        await db.products.insert_many(list(products))
+    return db
+
+
+def test_notification_kind_picks_the_tightest_window():
+    lead = [7, 3, 1, 0]
+    assert notification_kind("2030-01-10", TODAY, lead) == "expires_today"
+    assert notification_kind("2030-01-12", TODAY, lead) == "expires_in_3d"
+    assert notification_kind("2030-01-09", TODAY, lead) == "expired"
+    assert notification_kind("2030-02-01", TODAY, lead) is None
+    assert notification_kind("not a date", TODAY, lead) is None
+
+
+def test_rerunning_a_pass_never_notifies_twice():
+    async def scenario():
+        db = await fresh_db(product(0), product(2), product(5), product(30))
+        sweeper = ExpirySweeper(db)
+        first = await sweeper.run_once(TODAY)
+        second = await sweeper.run_once(TODAY)
+        return first, second, await db.notifications.count_documents({})
+
+    first, second, stored = asyncio.run(scenario())
+    assert (first["notified"], second["notified"], stored) == (3, 0, 3)
+    assert second["scanned"] == 3
+
+
+def test_products_added_after_a_complete_pass_are_notified_the_same_day():
+    async def scenario():
+        db = await fresh_db(product(5))
+        sweeper = ExpirySweeper(db)
+        await sweeper.run_once(TODAY)
+        await db.products.insert_one(product(0, user="u2"))
+        later = await sweeper.run_once(TODAY)
+        notice = await db.notifications.find_one({"user_id": "u2"})
+        return later, notice
+
+    later, notice = asyncio.run(scenario())
+    assert later["notified"] == 1
+    assert notice["kind"] == "expires_today"
+
+
+def test_interrupted_pass_resumes_from_its_checkpoint():
+    async def scenario():
+        db = await fresh_db(*(product(days) for days in (0, 1, 2, 3, 4)))
+        sweeper = ExpirySweeper(db, batch_size=2)
+        insert_new = sweeper._insert_new
+        calls = 0
+
+        async def fail_second_batch(notifications):
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise RuntimeError("worker died")
+            return await insert_new(notifications)
+
+        sweeper._insert_new = fail_second_batch
+        with pytest.raises(RuntimeError):
+            await sweeper.run_once(TODAY)
+        state = await db.sweep_state.find_one({"_id": SWEEP_STATE_ID})
+
+        resumed = await ExpirySweeper(db, batch_size=2).run_once(TODAY)
+        return state, resumed, await db.notifications.count_documents({})
+
+    state, resumed, stored = asyncio.run(scenario())
+    assert state["complete"] is False and state["after"][0] == "2030-01-11"
+    assert resumed["resumed"] is True
+    assert resumed["scanned"] == 3
+    assert stored == 5
+
+
+def test_an_interrupted_pass_from_yesterday_starts_over():
+    async def scenario():
+        db = await fresh_db(product(1), product(2))
+        await db.sweep_state.insert_one({"_id": SWEEP_STATE_ID, "runDate": "2030-01-09",
+                                         "after": ["2030-01-12", None], "complete": False})
+        return await ExpirySweeper(db).run_once(TODAY)
+
+    stats = asyncio.run(scenario())
+    assert stats["resumed"] is False and stats["notified"] == 2
+
+
+def test_lease_keeps_a_second_worker_out_until_released_or_expired():
+    async def scenario():
+        db = await fresh_db(product(0))
+        first, second = ExpirySweeper(db), ExpirySweeper(db)
+        held = await first.acquire_lease()
+        blocked = await second.run_once(TODAY)
+        renewed = await first.acquire_lease()
+        await first.release_lease()
+        after_release = await second.acquire_lease()
+        # An expired lease is taken over
+        await db.sweep_state.update_one({"_id": SWEEP_STATE_ID},
+                                        {"$set": {"leaseUntil": datetime.utcnow() - timedelta(seconds=1)}})
+        after_expiry = await first.acquire_lease()
+        return held, blocked, renewed, after_release, after_expiry
+
+    held, blocked, renewed, after_release, after_expiry = asyncio.run(scenario())
+    assert held and renewed and after_release and after_expiry
+    assert "skipped" in blocked